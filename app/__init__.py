@@ -1,13 +1,33 @@
+import atexit
+import functools
+import logging
+import threading
+from typing import Callable, List, Optional
+
 from flask import Flask
 
 from app.api import configure_api
 from app.config_manager import UserConfigManager
+from app.config_storage import create_config_storage
+from app.dedup import RedisUpdateDeduplicator, UpdateDeduplicator
+from app.dispatcher import UpdateDispatcher
 from app.extensions import init_redis
 from app.utils import generate_uuid_32
-from app.logs import logger
+from app.logs import logger, setup_logger
+from app.metrics import registry as metrics_registry
+from app.rate_limiter import RateLimitedTelegramClient
+from app.resilience import AdaptiveTimeout, CircuitBreaker
+from app.session_cache import CachedSessionManager
+from app.session_sweeper import SessionSweeper
 from app.messages import MessageBuilder, MessageTemplates
+from app.packer import MessagePacker
+from app.redis_session_manager import TelegramSessionManager
 from app.sqlite_session_manager import SQLiteSessionManager
+from app.startup import StartupProfile
+from app.telegram_client import TelegramClient
 from app.updates import CommandHandler
+from app.webhooks import WebhookReconciler
+from app.workers import UpdateWorkerPool
 from config import RedisConfig, Config, APIURLConfig
 
 from app.manus_api import ManusAgent
@@ -22,26 +42,175 @@ BOT_API_URL = "https://api.telegram.org/bot"
 def create_app(
     app_config: Config,
     api_url_config: APIURLConfig,
-    #redis_config: RedisConfig
+    redis_config: Optional[RedisConfig] = None,
+    start_background: bool = True,
+    profile: Optional[StartupProfile] = None,
 ):
+    """Build the app and its components.
+
+    Background threads (session sweeper, async dispatcher loop, long
+    polling, webhook reconcile) are started by ``app.start_background``;
+    with ``start_background=False`` the caller runs it later, e.g. in each
+    gunicorn worker after fork. ``app.shutdown`` drains queued updates and
+    stops everything; it is also registered with ``atexit``.
+
+    With ``STARTUP_LAZY`` work that scales with the data (the user config
+    index, the SQLite session schema setup) is deferred to the first request
+    that needs it. Clients, pools and the rest of the object graph are still
+    built here: they cost no I/O and the first update needs them anyway.
+    ``profile`` receives a mark after each init step.
+    """
+    mark = profile.mark if profile is not None else (lambda name: None)
+    lazy = app_config.get("STARTUP_LAZY", False)
     app = Flask(__name__)
     app.state_config = app_config
+    # Запускаются в start_background / останавливаются в shutdown (LIFO)
+    background_tasks: List[Callable[[], object]] = []
+    primary_tasks: List[Callable[[], object]] = []
+    cleanup_tasks: List[Callable[[], object]] = []
+
+    log_level = logging.getLevelName(app_config.get("LOG_LEVEL", "INFO"))
+    if not isinstance(log_level, int):
+        raise ValueError(f"Unknown LOG_LEVEL: {app_config.get('LOG_LEVEL')}")
+    log_format = app_config.get("LOG_FORMAT", "text")
+    if log_format not in ("text", "json"):
+        raise ValueError(f"Unknown LOG_FORMAT: {log_format}")
+    setup_logger(
+        name=logger.name,
+        level=log_level,
+        log_file=app_config.get("LOG_FILE", "app.log"),
+        async_mode=app_config.get("LOG_ASYNC", False),
+        compress_backups=app_config.get("LOG_COMPRESS", False),
+        json_format=log_format == "json",
+        max_field_length=app_config.get("LOG_MAX_FIELD_LENGTH", 2000),
+        debug_sample_rate=app_config.get("LOG_DEBUG_SAMPLE_RATE", 1.0),
+    )
+    mark("init: flask app, logging")
 
     manus_agent = ManusAgent(
         agent_url=api_url_config.get("OM11"),
         logger=logger,
+        result_cache_size=app_config.get("AGENT_RESULT_CACHE_SIZE", 0),
+        result_cache_max_ttl=app_config.get("AGENT_RESULT_CACHE_MAX_TTL", 30.0),
+        pool_size=app_config.get("AGENT_POOL_SIZE", 20),
+        connect_timeout=app_config.get("AGENT_CONNECT_TIMEOUT", 3.0),
+        adaptive_timeout=AdaptiveTimeout(
+            min_timeout=app_config.get("AGENT_TIMEOUT_MIN", 5.0),
+            max_timeout=app_config.get("AGENT_TIMEOUT_MAX", 120.0),
+        ),
+        breaker=CircuitBreaker(
+            failure_threshold=app_config.get("AGENT_BREAKER_THRESHOLD", 5),
+            reset_timeout=app_config.get("AGENT_BREAKER_RESET", 30.0),
+        ),
     )
-    #redis_client = init_redis(redis_config)
     templates = MessageTemplates()
     message_builder = MessageBuilder(templates)
+    mark("init: agent client")
 
-    session_manager = SQLiteSessionManager(db_file='sessions.db')
-    config_manager = UserConfigManager(config_dir=TG_CONFIGS_DIR)
+    redis_client = None
+    session_backend = app_config.get("SESSION_BACKEND", "sqlite")
+    session_ttl = app_config.get("SESSION_TTL", 0)
+    expired_retention = app_config.get("SESSION_EXPIRED_RETENTION", 0)
+    if session_backend == "redis":
+        if redis_config is None:
+            raise ValueError("SESSION_BACKEND=redis requires redis_config")
+        redis_client = init_redis(redis_config)
+        session_manager = TelegramSessionManager(
+            redis_client,
+            key_prefix=redis_config.get("SESSION_KEY_PREFIX", "om11tg:session:"),
+            ttl=session_ttl,
+            expired_retention=expired_retention,
+        )
+    elif session_backend == "sqlite":
+        session_manager = SQLiteSessionManager(
+            db_file='sessions.db',
+            concurrent=app_config.get("SESSION_DB_CONCURRENT", True),
+            flush_interval=app_config.get("SESSION_FLUSH_INTERVAL", 1.0),
+            session_ttl=session_ttl,
+            expired_retention=expired_retention,
+            lazy_init=lazy,
+        )
+        cleanup_tasks.append(session_manager.close)
+        if session_ttl:
+            # В Redis сессии истекают сами, в SQLite их чистит фоновый поток
+            session_sweeper = SessionSweeper(
+                logger=logger,
+                session_manager=session_manager,
+                interval=app_config.get("SESSION_SWEEP_INTERVAL", 60.0),
+            )
+            background_tasks.append(session_sweeper.start)
+            cleanup_tasks.append(session_sweeper.stop)
+    else:
+        raise ValueError(f"Unknown session backend: {session_backend}")
+    session_manager = CachedSessionManager(
+        backend=session_manager,
+        maxsize=app_config.get("SESSION_CACHE_SIZE", 10000),
+        ttl=app_config.get("SESSION_CACHE_TTL", 60.0),
+        negative_ttl=app_config.get("SESSION_NEGATIVE_TTL", 5.0),
+        session_ttl=session_ttl,
+    )
+    mark("init: session store")
+    config_storage = create_config_storage(
+        kind=app_config.get("CONFIG_STORAGE", "json"),
+        config_dir=TG_CONFIGS_DIR,
+        db_file=app_config.get("CONFIG_DB_FILE", "instance/user_configs.db"),
+    )
+    telegram_client_options = dict(
+        logger=logger,
+        api_url=app_config.get("TELEGRAM_API_URL", BOT_API_URL),
+        pool_size=app_config.get("TELEGRAM_POOL_SIZE", 20),
+        timeout=app_config.get("TELEGRAM_TIMEOUT", 10.0),
+    )
+    if app_config.get("TELEGRAM_RATE_LIMIT", True):
+        telegram_client = RateLimitedTelegramClient(
+            bot_rate=app_config.get("TELEGRAM_BOT_RATE", 30.0),
+            chat_rate=app_config.get("TELEGRAM_CHAT_RATE", 1.0),
+            group_rate=app_config.get("TELEGRAM_GROUP_RATE_PER_MIN", 20.0) / 60,
+            max_wait=app_config.get("TELEGRAM_MAX_WAIT", 10.0) or None,
+            **telegram_client_options,
+        )
+    else:
+        telegram_client = TelegramClient(**telegram_client_options)
+    mark("init: config storage, telegram client")
+    config_manager = UserConfigManager(
+        config_dir=TG_CONFIGS_DIR,
+        storage=config_storage,
+        cache_size=app_config.get("CONFIG_CACHE_SIZE", 1024),
+        cache_ttl=app_config.get("CONFIG_CACHE_TTL", 60.0),
+        lazy_index=lazy,
+    )
+    mark("init: config index")
+    webhook_reconciler = WebhookReconciler(
+        logger=logger,
+        telegram_client=telegram_client,
+        server_address=app.state_config.SERVER_ADDRESS,
+        max_workers=app_config.get("WEBHOOK_RECONCILE_WORKERS", 16),
+    )
     telegram_manager = TelegramManager(
         logger=logger,
         config_manager=config_manager,
         message_creator=message_builder,
         server_address=app.state_config.SERVER_ADDRESS,
+        telegram_client=telegram_client,
+        webhook_reconciler=webhook_reconciler,
+    )
+    app.telegram_manager = telegram_manager
+    ingress_mode = app_config.get("INGRESS_MODE", "webhook")
+    if ingress_mode == "webhook" and app_config.get(
+        "WEBHOOK_RECONCILE_ON_STARTUP", False
+    ):
+        # Одного прохода на деплой достаточно, а не по разу в каждом воркере
+        primary_tasks.append(
+            threading.Thread(
+                target=telegram_manager.set_webhooks,
+                name="webhook-reconciler",
+                daemon=True,
+            ).start
+        )
+
+    message_packer = MessagePacker(
+        limit=app_config.get("MESSAGE_LIMIT", 4096),
+        merge=app_config.get("MESSAGE_MERGE", True),
     )
     command_handler = CommandHandler(
         logger=logger,
@@ -49,13 +218,218 @@ def create_app(
         config_manager=config_manager,
         message_builder=message_builder,
         session_manager=session_manager,
-        bot_api_url=BOT_API_URL,
+        telegram_client=telegram_client,
+        stream_mode=app_config.get("AGENT_STREAM_MODE", "off"),
+        stream_edit_interval=app_config.get("AGENT_STREAM_EDIT_INTERVAL", 1.0),
+        message_packer=message_packer,
     )
+    mark("init: telegram manager, command handler")
+    dedup_backend = app_config.get("DEDUP_BACKEND", "memory")
+    if dedup_backend == "memory":
+        deduplicator = UpdateDeduplicator(
+            maxsize=app_config.get("DEDUP_MAX_SIZE", 100000),
+            ttl=app_config.get("DEDUP_TTL", 3600),
+        )
+    elif dedup_backend == "redis":
+        if redis_config is None:
+            raise ValueError("DEDUP_BACKEND=redis requires redis_config")
+        if redis_client is None:
+            redis_client = init_redis(redis_config)
+        deduplicator = RedisUpdateDeduplicator(
+            redis_client,
+            logger=logger,
+            key_prefix=redis_config.get("DEDUP_KEY_PREFIX", "om11tg:update:"),
+            ttl=app_config.get("DEDUP_TTL", 3600),
+        )
+    elif dedup_backend == "off":
+        deduplicator = None
+    else:
+        raise ValueError(f"Unknown dedup backend: {dedup_backend}")
+    execution_mode = app_config.get("EXECUTION_MODE", "threads")
+    agent_stats = manus_agent.stats
+    if execution_mode == "threads":
+        worker_pool = UpdateWorkerPool(
+            logger=logger,
+            max_workers=app_config.get("WEBHOOK_WORKERS", 8),
+            max_pending=app_config.get("WEBHOOK_QUEUE_SIZE", 1000),
+        )
+        dispatcher = UpdateDispatcher(
+            logger=logger,
+            worker_pool=worker_pool,
+            handler=command_handler.handle_update,
+            max_lane_size=app_config.get("DISPATCHER_LANE_SIZE", 100),
+            max_pending=app_config.get("WEBHOOK_QUEUE_SIZE", 1000),
+            deduplicator=deduplicator,
+            deadline_budget=app_config.get("UPDATE_DEADLINE", 120.0) or None,
+        )
+        cleanup_tasks.append(
+            functools.partial(
+                worker_pool.shutdown,
+                timeout=app_config.get("WEBHOOK_SHUTDOWN_TIMEOUT", 30.0),
+            )
+        )
+    elif execution_mode == "async":
+        # aiohttp нужен только в асинхронном режиме
+        from app.async_dispatcher import AsyncUpdateDispatcher
+        from app.async_manus_api import AsyncManusAgent
+        from app.async_telegram_client import AsyncTelegramClient
+        from app.async_updates import AsyncCommandHandler
+
+        worker_pool = None
+        async_telegram_client = AsyncTelegramClient(
+            logger=logger,
+            api_url=app_config.get("TELEGRAM_API_URL", BOT_API_URL),
+            max_connections=app_config.get("ASYNC_TELEGRAM_CONNECTIONS", 100),
+            timeout=app_config.get("TELEGRAM_TIMEOUT", 10.0),
+            # Общие с синхронным клиентом лимиты: менеджмент идёт через него
+            rate_limiter=telegram_client
+            if isinstance(telegram_client, RateLimitedTelegramClient)
+            else None,
+        )
+        async_manus_agent = AsyncManusAgent(
+            agent_url=api_url_config.get("OM11"),
+            logger=logger,
+            result_cache_size=app_config.get("AGENT_RESULT_CACHE_SIZE", 0),
+            result_cache_max_ttl=app_config.get("AGENT_RESULT_CACHE_MAX_TTL", 30.0),
+            max_connections=app_config.get("ASYNC_AGENT_CONNECTIONS", 1000),
+            connect_timeout=app_config.get("AGENT_CONNECT_TIMEOUT", 3.0),
+            adaptive_timeout=manus_agent.adaptive_timeout,
+            breaker=manus_agent.breaker,
+        )
+        async_command_handler = AsyncCommandHandler(
+            logger=logger,
+            manus_agent=async_manus_agent,
+            config_manager=config_manager,
+            message_builder=message_builder,
+            session_manager=session_manager,
+            telegram_client=async_telegram_client,
+            stream_mode=app_config.get("AGENT_STREAM_MODE", "off"),
+            stream_edit_interval=app_config.get("AGENT_STREAM_EDIT_INTERVAL", 1.0),
+            message_packer=message_packer,
+        )
+        dispatcher = AsyncUpdateDispatcher(
+            logger=logger,
+            handler=async_command_handler.handle_update,
+            max_lane_size=app_config.get("DISPATCHER_LANE_SIZE", 100),
+            max_pending=app_config.get("ASYNC_MAX_PENDING", 10000),
+            deduplicator=deduplicator,
+            deadline_budget=app_config.get("UPDATE_DEADLINE", 120.0) or None,
+            clients=(async_manus_agent, async_telegram_client),
+        )
+        background_tasks.append(dispatcher.start)
+        cleanup_tasks.append(
+            functools.partial(
+                dispatcher.stop,
+                timeout=app_config.get("WEBHOOK_SHUTDOWN_TIMEOUT", 30.0),
+            )
+        )
+        agent_stats = async_manus_agent.stats
+    else:
+        raise ValueError(f"Unknown execution mode: {execution_mode}")
+    app.worker_pool = worker_pool
+    app.dispatcher = dispatcher
+    mark(f"init: dispatcher ({execution_mode})")
+
+    metrics_registry.register_stats(
+        "om11tg_dispatcher", "Update dispatcher lanes and queue.", dispatcher.stats
+    )
+    metrics_registry.register_stats(
+        "om11tg_session_cache", "In-process session cache.", session_manager.stats
+    )
+    metrics_registry.register_stats(
+        "om11tg_config_cache", "User config cache.", config_manager.cache_stats
+    )
+    metrics_registry.register_stats(
+        "om11tg_agent",
+        "Agent client: coalescing, result cache, slow calls and circuit "
+        "breaker (breaker_state 0=closed, 1=half-open, 2=open).",
+        agent_stats,
+    )
+    if deduplicator is not None:
+        metrics_registry.register_stats(
+            "om11tg_update_dedup", "Redelivered update dedup store.", deduplicator.stats
+        )
+    if isinstance(telegram_client, RateLimitedTelegramClient):
+        metrics_registry.register_stats(
+            "om11tg_telegram_scheduler",
+            "Bot API rate limiter.",
+            telegram_client.scheduler_stats,
+        )
+    app.metrics = metrics_registry
+
+    ready = threading.Event()
+    stopped = threading.Event()
+    app.ready = ready
     configure_api(
         app=app,
         logger=logger,
         command_handler=command_handler,
         telegram_manager=telegram_manager,
         generate_uuid_32=generate_uuid_32,
+        dispatcher=dispatcher,
+        metrics=metrics_registry,
+        ready=ready,
     )
+
+    if ingress_mode == "polling":
+        # aiohttp нужен только в режиме long polling
+        from app.polling import LongPollingIngress
+
+        polling_ingress = LongPollingIngress(
+            logger=logger,
+            config_manager=config_manager,
+            dispatch=dispatcher.dispatch,
+            api_url=app_config.get("TELEGRAM_API_URL", BOT_API_URL),
+            poll_timeout=app_config.get("POLLING_TIMEOUT", 30),
+        )
+        # getUpdates для бота допускает только одного читателя
+        primary_tasks.append(polling_ingress.start)
+        app.polling_ingress = polling_ingress
+        cleanup_tasks.append(polling_ingress.stop)
+    elif ingress_mode != "webhook":
+        raise ValueError(f"Unknown ingress mode: {ingress_mode}")
+    mark("init: metrics, api routes, ingress")
+
+    lifecycle_lock = threading.Lock()
+    primary_started = threading.Event()
+
+    def start(primary: bool = True):
+        """Start background threads; ``primary`` also runs ``start_primary``."""
+        with lifecycle_lock:
+            if not ready.is_set() and not stopped.is_set():
+                for task in background_tasks:
+                    task()
+                ready.set()
+        if primary:
+            start_primary()
+
+    def start_primary():
+        """Start the once-per-deployment tasks (webhook reconcile, long
+        polling); with several worker processes only one should call it."""
+        with lifecycle_lock:
+            if primary_started.is_set() or stopped.is_set():
+                return
+            primary_started.set()
+            for task in primary_tasks:
+                task()
+
+    def shutdown():
+        """Stop accepting updates, drain the queue and release resources."""
+        with lifecycle_lock:
+            if stopped.is_set():
+                return
+            stopped.set()
+            ready.clear()
+        for task in reversed(cleanup_tasks):
+            try:
+                task()
+            except Exception as e:
+                logger.exception("Shutdown step %r failed: %s", task, e)
+
+    app.start_background = start
+    app.start_primary = start_primary
+    app.shutdown = shutdown
+    atexit.register(shutdown)
+    if start_background:
+        start()
     return app
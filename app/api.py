@@ -1,6 +1,11 @@
 import logging
-from flask import jsonify, request
+import threading
+import time
+from flask import Response, jsonify, request
 from app.manager import TelegramManager
+from app.dispatcher import UpdateDispatcher
+from app.logs import Truncated
+from app.metrics import CONTENT_TYPE, WEBHOOK_LATENCY, MetricsRegistry
 from typing import Callable, Tuple, Dict
 
 configs = {}
@@ -12,26 +17,50 @@ def configure_api(
     command_handler,
     telegram_manager: TelegramManager,
     generate_uuid_32: Callable,
+    dispatcher: UpdateDispatcher,
+    metrics: MetricsRegistry,
+    ready: threading.Event,
 ):
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+    @app.route("/ready", methods=["GET"])
+    def readiness():
+        # 503 до запуска фоновых потоков и во время остановки
+        if not ready.is_set():
+            return jsonify({"ready": False}), 503
+        return jsonify({"ready": True}), 200
+
     @app.route("/webhook/<token>", methods=["POST"])
     def webhook(token):
+        started = time.perf_counter()
+        response, status_code = _handle_webhook(token, time.monotonic())
+        WEBHOOK_LATENCY.observe(time.perf_counter() - started, status_code)
+        return response, status_code
+
+    def _handle_webhook(token, received_at):
         try:
-            update = request.json
-            logger.info("Update received: %s", update)
-
-            if update and update.get("message"):
-                text = update["message"].get("text", "")
-                if text.startswith("/start"):
-                    command_handler.handle_start(update, token)
-                elif text.startswith("/auth"):
-                    command_handler.handle_auth(update, token)
-                else:
-                    logger.info("Handling message from bot: %s", token)
-                    command_handler.handle_message(update, token)
-
-                return jsonify({"status": "ok"}), 200
-            else:
-                raise ValueError("Unformatted request")
+            update = request.get_json(silent=True)
+            # Полный апдейт только на DEBUG (сэмплируется) и в обрезанном виде
+            logger.debug("Update received for bot %s: %s", token, Truncated(update))
+
+            if not isinstance(update, dict) or "update_id" not in update:
+                logger.warning("Unformatted update for bot: %s", token)
+                return jsonify({"status": "error"}), 400
+            if not isinstance(update.get("message"), dict):
+                # edited_message, callback_query и т.п. не обрабатываем, но на
+                # не-2xx Telegram будет присылать их снова
+                logger.debug("Ignoring non-message update for bot: %s", token)
+                return jsonify({"status": "ignored"}), 200
+
+            # Отвечаем Telegram сразу, обработка идёт в пуле воркеров
+            # Бюджет времени на обработку считается от момента получения апдейта
+            if not dispatcher.dispatch(update, token, received_at=received_at):
+                logger.error("Update queue is full, rejecting update for bot: %s", token)
+                return jsonify({"status": "busy"}), 503
+
+            return jsonify({"status": "ok"}), 200
         except Exception as e:
             logger.exception("Unexpected error occurred while handling update: %s", e)
             return jsonify({"status": "error"}), 500
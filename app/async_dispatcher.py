@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from app.dispatcher import UpdateDispatcher
+
+
+class AsyncUpdateDispatcher:
+    """asyncio counterpart of ``UpdateDispatcher``.
+
+    Keeps the same per-chat lanes (one chat in order, different chats in
+    parallel), but each lane is drained by a task on one event loop instead
+    of a pool thread, so the number of conversations waiting on the agent is
+    bounded by ``max_pending`` rather than by the thread count.
+
+    ``dispatch`` is thread-safe and is called from the webhook route and the
+    polling ingress as before; the loop runs in a background daemon thread
+    started by ``start``.
+
+    Args:
+        logger: Logger instance
+        handler: Coroutine function taking ``(update, bot_token, deadline=...)``
+        max_lane_size: Max updates queued per lane before new ones are rejected
+        max_pending: Max queued plus running updates over all lanes
+        deduplicator: Optional store with ``claim``/``release``, as for
+            ``UpdateDispatcher``
+        deadline_budget: Seconds from arrival an update may take; passed to
+            the handler as ``deadline`` (None disables)
+        clients: Objects with an async ``close()`` closed on the loop by ``stop``
+    """
+
+    lane_key = staticmethod(UpdateDispatcher.lane_key)
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        handler: Callable,
+        max_lane_size: int = 100,
+        max_pending: int = 10000,
+        deduplicator=None,
+        deadline_budget: Optional[float] = None,
+        clients: Iterable = (),
+    ):
+        self.logger = logger
+        self.handler = handler
+        self.max_lane_size = max_lane_size
+        self.max_pending = max_pending
+        self.deduplicator = deduplicator
+        self.deadline_budget = deadline_budget
+        self.clients = list(clients)
+
+        self._lanes: Dict[Hashable, Deque[Tuple]] = {}
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._closed = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # Доступно только из цикла событий
+        self._tasks: Set[asyncio.Task] = set()
+        self.in_flight = 0
+        self.dispatched = 0
+        self.rejected = 0
+        self.duplicates = 0
+
+    def start(self) -> threading.Thread:
+        """Run the event loop in a background daemon thread."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, name="async-dispatcher", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def dispatch(
+        self, update: Dict, bot_token: str, received_at: Optional[float] = None
+    ) -> bool:
+        """Queue an update on its lane; returns False if it was rejected.
+
+        Same contract as ``UpdateDispatcher.dispatch``.
+        """
+        if received_at is None:
+            received_at = time.monotonic()
+        update_id: Optional[int] = update.get("update_id")
+        if self.deduplicator is not None and update_id is not None:
+            if not self.deduplicator.claim(bot_token, update_id):
+                self.duplicates += 1
+                return True
+            if not self._enqueue(update, bot_token, received_at):
+                # Не приняли — повторная доставка должна пройти
+                self.deduplicator.release(bot_token, update_id)
+                return False
+            return True
+        return self._enqueue(update, bot_token, received_at)
+
+    def _enqueue(self, update: Dict, bot_token: str, received_at: float) -> bool:
+        key = self.lane_key(update, bot_token)
+        item = (update, bot_token, received_at)
+
+        with self._cond:
+            if self._closed or self._loop is None or self._pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            lane = self._lanes.get(key)
+            if lane is not None:
+                # Лента уже обрабатывается, просто ставим в очередь
+                if len(lane) >= self.max_lane_size:
+                    self.rejected += 1
+                    return False
+                lane.append(item)
+            else:
+                self._lanes[key] = deque([item])
+                # Под блокировкой: stop не закроет цикл между проверкой и вызовом
+                self._loop.call_soon_threadsafe(self._start_lane, key)
+            self._pending += 1
+            self.dispatched += 1
+            return True
+
+    def _start_lane(self, key: Hashable):
+        task = self._loop.create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key: Hashable):
+        while True:
+            with self._cond:
+                lane = self._lanes[key]
+                if not lane:
+                    del self._lanes[key]
+                    return
+                update, bot_token, received_at = lane[0]
+
+            deadline = (
+                received_at + self.deadline_budget
+                if self.deadline_budget is not None
+                else None
+            )
+            self.in_flight += 1
+            try:
+                await self.handler(update, bot_token, deadline=deadline)
+            except Exception as e:
+                self.logger.exception("Error handling update for lane %s: %s", key, e)
+            finally:
+                self.in_flight -= 1
+                with self._cond:
+                    lane.popleft()
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._cond.notify_all()
+
+    async def _shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for client in self.clients:
+            try:
+                await client.close()
+            except Exception as e:
+                self.logger.warning("Failed to close %r: %s", client, e)
+
+    def stop(self, timeout: Optional[float] = 30.0) -> bool:
+        """Stop accepting updates, wait up to ``timeout`` for queued ones and
+        close the clients and the loop.
+
+        Returns:
+            True if every update finished before the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._closed = True
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            drained = self._pending == 0
+
+        if not drained:
+            self.logger.warning(
+                "Async dispatcher stop timed out with %s updates pending", self._pending
+            )
+        if self._loop is not None and self._thread is not None and self._thread.is_alive():
+            future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+            try:
+                future.result(timeout=10)
+            except Exception as e:
+                self.logger.warning("Async dispatcher shutdown failed: %s", e)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+        return drained
+
+    def stats(self) -> Dict:
+        with self._cond:
+            depths = [len(lane) for lane in self._lanes.values()]
+            now = time.monotonic()
+            oldest = max(
+                (now - lane[0][2] for lane in self._lanes.values() if lane),
+                default=0.0,
+            )
+            pending = self._pending
+        return {
+            "active_lanes": len(depths),
+            "queued_updates": sum(depths),
+            "max_lane_depth": max(depths, default=0),
+            "oldest_update_age": oldest,
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "pending": pending,
+            "in_flight": self.in_flight,
+        }
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+import aiohttp
+
+from app.manus_api import (
+    NDJSON_CONTENT_TYPE,
+    AgentClientBase,
+    AgentUnavailableError,
+    cache_max_age,
+    parse_stream_line,
+)
+from app.metrics import AGENT_LATENCY
+from app.resilience import AdaptiveTimeout, CircuitBreaker
+
+
+class AsyncManusAgent(AgentClientBase):
+    """asyncio counterpart of ``ManusAgent`` built on aiohttp.
+
+    Same behaviour as the synchronous client: deadline budgets, adaptive
+    slow-call threshold, circuit breaker, coalescing of identical in-flight calls
+    and the optional ``max-age`` result cache. A waiting call costs a
+    coroutine instead of a thread, so thousands of conversations can be in
+    flight at once.
+
+    Args:
+        agent_url: Base URL of the agent API
+        logger: Logger instance
+        result_cache_size: Max cached answers (0 disables the cache)
+        result_cache_max_ttl: Upper bound for the agent's max-age in seconds
+        max_connections: Max open connections to the agent
+        connect_timeout: Connect timeout in seconds
+        adaptive_timeout: Slow-call threshold and read timeout (defaults to 5..120 s)
+        breaker: Circuit breaker (defaults to 5 failures / 30 s)
+    """
+
+    def __init__(
+        self,
+        agent_url: str,
+        logger: logging.Logger,
+        result_cache_size: int = 0,
+        result_cache_max_ttl: float = 30.0,
+        max_connections: int = 1000,
+        connect_timeout: float = 3.0,
+        adaptive_timeout: Optional[AdaptiveTimeout] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__(
+            agent_url,
+            logger,
+            result_cache_size=result_cache_size,
+            result_cache_max_ttl=result_cache_max_ttl,
+            connect_timeout=connect_timeout,
+            adaptive_timeout=adaptive_timeout,
+            breaker=breaker,
+        )
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def execute_command(
+        self, message: str, user_uuid: str, deadline: Optional[float] = None
+    ) -> List[str]:
+        """Return the agent output for ``message``.
+
+        Raises:
+            AgentUnavailableError: Breaker open, agent failed or deadline spent
+        """
+        key = (message, user_uuid)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        # Все корутины живут в одном цикле, поэтому блокировка не нужна
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                # shield: отмена ожидающего не должна отменять общий запрос
+                return list(await asyncio.wait_for(asyncio.shield(future), timeout))
+            except asyncio.TimeoutError:
+                raise AgentUnavailableError("Update deadline exceeded waiting for agent")
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            command_list, max_age = await self._request_command(message, user_uuid, deadline)
+            self._remember(key, command_list, max_age)
+            future.set_result(command_list)
+            return list(command_list)
+        except asyncio.CancelledError:
+            future.set_exception(AgentUnavailableError("Agent call was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим; не ругаемся, если их нет
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _request_command(
+        self, message: str, user_uuid: str, deadline: Optional[float]
+    ) -> Tuple[List[str], int]:
+        read_timeout = self._read_timeout(deadline)
+        self._check_breaker()
+        params = {"message": message, "user_uuid": user_uuid}
+        timeout = aiohttp.ClientTimeout(
+            total=read_timeout, sock_connect=min(self.connect_timeout, read_timeout)
+        )
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self._get_session().get(
+                f"{self.agent_url}/api/execute_command/", params=params, timeout=timeout
+            ) as response:
+                self._check_status(response.status)
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+                self.adaptive_timeout.observe(time.perf_counter() - started)
+                command_list = self._command_list(data)
+                if command_list is None:
+                    return [], 0
+                outcome = "ok"
+                return command_list, cache_max_age(response)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            raise self._request_failed(e, started, read_timeout, _timed_out(e)) from e
+        except (aiohttp.ClientError, ValueError) as e:
+            self.logger.error("Request failed: %s", e)
+            return [], 0
+        finally:
+            AGENT_LATENCY.observe(time.perf_counter() - started, "plain", outcome)
+
+    async def execute_command_stream(
+        self, message: str, user_uuid: str, deadline: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Yield output chunks as the agent produces them (NDJSON or a JSON list).
+
+        Raises:
+            AgentUnavailableError: If the agent fails before the first chunk
+        """
+        read_timeout = self._read_timeout(deadline)
+        self._check_breaker()
+        params = {"message": message, "user_uuid": user_uuid, "stream": "1"}
+        # sock_read ограничивает паузу между чанками, а не весь поток
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=min(self.connect_timeout, read_timeout),
+            sock_read=read_timeout,
+        )
+        started = time.perf_counter()
+        outcome = "error"
+        yielded = False
+        try:
+            async with self._get_session().get(
+                f"{self.agent_url}/api/execute_command/",
+                params=params,
+                headers={"Accept": NDJSON_CONTENT_TYPE},
+                timeout=timeout,
+            ) as response:
+                self._check_status(response.status)
+                response.raise_for_status()
+                if not response.content_type.startswith(NDJSON_CONTENT_TYPE):
+                    command_list = self._command_list(await response.json(content_type=None))
+                    if command_list is None:
+                        return
+                    outcome = "ok"
+                    for chunk in command_list:
+                        yielded = True
+                        yield chunk
+                    return
+
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8", errors="replace").strip()
+                    try:
+                        chunk = parse_stream_line(line)
+                    except ValueError:
+                        self.logger.error("Invalid stream line: %.100s", line)
+                        continue
+                    if chunk:
+                        yielded = True
+                        yield chunk
+                outcome = "ok"
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            error = self._stream_failed(e, yielded, read_timeout, _timed_out(e))
+            if error is not None:
+                raise error from e
+        except (aiohttp.ClientError, ValueError) as e:
+            self.logger.error("Stream request failed: %s", e)
+        finally:
+            AGENT_LATENCY.observe(time.perf_counter() - started, "stream", outcome)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+def _timed_out(error: Exception) -> bool:
+    """True for a read timeout (not a connect timeout)."""
+    return isinstance(error, asyncio.TimeoutError) and not isinstance(
+        error, aiohttp.ConnectionTimeoutError
+    )
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from app.rate_limiter import PACED_METHODS
+from app.telegram_client import BOT_API_URL, CallStats, TelegramResponse
+
+
+class AsyncTelegramClient:
+    """asyncio counterpart of ``TelegramClient`` built on aiohttp.
+
+    Method names and arguments match the synchronous client; every call is a
+    coroutine. With ``rate_limiter`` (a ``RateLimitedTelegramClient``) sends
+    are paced through the same buckets as the synchronous client and ``429``
+    answers are retried by its policy (``admit``/``retry_delay``), so both
+    clients together stay within the limits.
+
+    The aiohttp session is created on first use, on the loop that runs the
+    calls.
+
+    Args:
+        logger: Logger instance
+        api_url: Bot API base URL, the token is appended to it
+        max_connections: Max open connections to the Bot API
+        timeout: Default per-call timeout in seconds
+        rate_limiter: Optional ``RateLimitedTelegramClient`` to pace with
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        api_url: str = BOT_API_URL,
+        max_connections: int = 100,
+        timeout: float = 10.0,
+        rate_limiter=None,
+    ):
+        self.logger = logger
+        self.api_url = api_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.call_stats = CallStats()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _send(
+        self,
+        bot_token: str,
+        method: str,
+        http_method: str,
+        params: Optional[Dict[str, Any]],
+        json: Optional[Dict[str, Any]],
+        timeout: Optional[float],
+    ) -> TelegramResponse:
+        url = f"{self.api_url}{bot_token}/{method}"
+        started = time.monotonic()
+        try:
+            async with self._get_session().request(
+                http_method,
+                url,
+                params=params,
+                json=json,
+                timeout=aiohttp.ClientTimeout(total=timeout or self.timeout),
+            ) as response:
+                try:
+                    data = await response.json(content_type=None)
+                except ValueError:
+                    data = None
+                result = TelegramResponse(response.status, response.headers, data)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.call_stats.record(method, time.monotonic() - started, error=True)
+            raise
+
+        self.call_stats.record(method, time.monotonic() - started, error=not result.ok)
+        return result
+
+    async def request(
+        self,
+        bot_token: str,
+        method: str,
+        http_method: str = "POST",
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> TelegramResponse:
+        """Call a Bot API method and return the response.
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError: On connection errors
+                and timeouts
+        """
+        limiter = self.rate_limiter
+        if limiter is None:
+            return await self._send(bot_token, method, http_method, params, json, timeout)
+
+        paced = method in PACED_METHODS
+        chat_id = (json or params or {}).get("chat_id")
+        for attempt in range(limiter.max_retries + 1):
+            if paced:
+                enqueued = time.monotonic()
+                wait, rejected = limiter.admit(bot_token, chat_id, method)
+                if rejected is not None:
+                    return rejected
+                if wait > 0:
+                    limiter.add_waiting(1)
+                    try:
+                        await asyncio.sleep(wait)
+                    finally:
+                        limiter.add_waiting(-1)
+                limiter.record_queue_time(time.monotonic() - enqueued)
+
+            response = await self._send(bot_token, method, http_method, params, json, timeout)
+            if response.status_code != 429:
+                return response
+
+            delay = limiter.retry_delay(response, bot_token, chat_id, method, paced, attempt)
+            if delay is None:
+                break
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        return response
+
+    async def get(self, bot_token: str, method: str, **kwargs) -> TelegramResponse:
+        return await self.request(bot_token, method, http_method="GET", **kwargs)
+
+    async def post(self, bot_token: str, method: str, **kwargs) -> TelegramResponse:
+        return await self.request(bot_token, method, http_method="POST", **kwargs)
+
+    async def send_message(
+        self,
+        bot_token: str,
+        chat_id,
+        text: str,
+        parse_mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> TelegramResponse:
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        return await self.post(bot_token, "sendMessage", json=payload, timeout=timeout)
+
+    async def edit_message_text(
+        self,
+        bot_token: str,
+        chat_id,
+        message_id: int,
+        text: str,
+        timeout: Optional[float] = None,
+    ) -> TelegramResponse:
+        payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
+        return await self.post(bot_token, "editMessageText", json=payload, timeout=timeout)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return self.call_stats.snapshot()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,145 @@
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+from app.packer import TELEGRAM_MESSAGE_LIMIT, MessagePacker, packer_for_bot
+from app.updates import CommandHandlerBase, StreamedReply, auth_token_from
+
+
+class AsyncCommandHandler(CommandHandlerBase):
+    """asyncio counterpart of ``CommandHandler``.
+
+    Same commands and replies (built by ``CommandHandlerBase``); the agent
+    and Telegram calls are awaited on the async clients. Session and config
+    stores stay synchronous (SQLite, Redis, in-process caches) and are called
+    via ``asyncio.to_thread`` so a slow lookup does not stall the loop.
+    """
+
+    async def _send_message(self, bot_token: str, chat_id, text: str):
+        return await self.telegram_client.send_message(bot_token, chat_id, text)
+
+    async def _reply_with_agent_output(
+        self, bot_token: str, chat_id, message, user_uuid, deadline: Optional[float] = None
+    ):
+        packer = await asyncio.to_thread(
+            packer_for_bot, self.config_manager, bot_token, self.message_packer
+        )
+        if self.stream_mode == "off":
+            output_chain: List[str] = await self.manus_agent.execute_command(
+                message, user_uuid, deadline=deadline
+            )
+            for chain in packer.pack(output_chain):
+                await self._send_message(bot_token, chat_id, chain)
+            return
+
+        chunks = _split_stream(
+            packer,
+            self.manus_agent.execute_command_stream(message, user_uuid, deadline=deadline),
+        )
+        if self.stream_mode == "messages":
+            async for chunk in chunks:
+                await self._send_message(bot_token, chat_id, chunk)
+        else:
+            await self._stream_into_message(bot_token, chat_id, chunks, packer.limit)
+
+    async def _stream_into_message(
+        self,
+        bot_token: str,
+        chat_id,
+        chunks: AsyncIterator[str],
+        limit: int = TELEGRAM_MESSAGE_LIMIT,
+    ):
+        """Grow one message via editMessageText as chunks arrive (see ``StreamedReply``)."""
+        reply = StreamedReply(limit, self.stream_edit_interval)
+        async for chunk in chunks:
+            edit = reply.close_if_full(chunk)
+            if edit:
+                await self.telegram_client.edit_message_text(bot_token, chat_id, *edit)
+
+            if not reply.is_open:
+                response = await self._send_message(bot_token, chat_id, chunk)
+                if not reply.open(response, chunk):
+                    # Не удалось получить id сообщения, дальше шлём по частям
+                    async for rest in chunks:
+                        await self._send_message(bot_token, chat_id, rest)
+                    return
+                continue
+
+            edit = reply.append(chunk)
+            if edit:
+                await self.telegram_client.edit_message_text(bot_token, chat_id, *edit)
+
+        edit = reply.pending()
+        if edit:
+            await self.telegram_client.edit_message_text(bot_token, chat_id, *edit)
+
+    async def handle_update(self, update, bot_token, deadline: Optional[float] = None):
+        """Route an update; ``deadline`` is the ``time.monotonic()`` budget end."""
+        text = update["message"].get("text", "")
+        if text.startswith("/start"):
+            await self.handle_start(update, bot_token)
+        elif text.startswith("/auth"):
+            await self.handle_auth(update, bot_token)
+        else:
+            self.logger.debug("Handling message from bot: %s", bot_token)
+            await self.handle_message(update, bot_token, deadline)
+
+    async def handle_message(self, update, bot_token, deadline: Optional[float] = None):
+        message = update["message"].get("text")
+        user = update["message"].get("from")
+        tg_id = user.get("id")
+        user_info = await asyncio.to_thread(self.session_manager.get_user, tg_id)
+        self.logger.debug("tg_id: %s, user_info: %s", tg_id, user_info)
+
+        if user_info:
+            user_uuid = user_info.get("user_uuid")
+            if user_uuid:
+                await asyncio.to_thread(self.session_manager.update_last_active, tg_id)
+                try:
+                    await self._reply_with_agent_output(
+                        bot_token, user["id"], message, user_uuid, deadline
+                    )
+                except Exception as e:
+                    await self._send_message(
+                        bot_token, user["id"], self._agent_error_reply(e)
+                    )
+                return
+
+        # Если пользователь не авторизован
+        expired = user_info is None and await asyncio.to_thread(
+            self.session_manager.is_expired, tg_id
+        )
+        await self._send_message(bot_token, user["id"], self._unauthorized_reply(expired))
+
+    async def handle_start(self, update, bot_token):
+        if not update.get("message"):
+            return
+
+        user = update["message"]["from"]
+        await self._send_message(bot_token, user["id"], self._start_reply(user))
+
+    async def handle_auth(self, update, bot_token):
+        if not update.get("message"):
+            return
+
+        user = update["message"]["from"]
+        auth_token = auth_token_from(update["message"].get("text", ""))
+        if auth_token is None:
+            await self._send_message(bot_token, user["id"], self._auth_token_missing(user))
+            return
+
+        web_user_uuid = await asyncio.to_thread(
+            self.config_manager.user_uuid_by_authtoken, auth_token
+        )
+        if web_user_uuid:
+            await asyncio.to_thread(
+                self.session_manager.add_user,
+                tg_id=user["id"],
+                user_uuid=web_user_uuid,
+            )
+        await self._send_message(bot_token, user["id"], self._auth_reply(user, web_user_uuid))
+
+
+async def _split_stream(packer: MessagePacker, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    async for chunk in chunks:
+        for part in packer.split(chunk):
+            yield part
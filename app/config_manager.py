@@ -1,8 +1,15 @@
+import copy
 import json
 import os
+import sqlite3
+import threading
+import time
 from typing import Dict, Optional
 
+from app.cache import TTLCache
+from app.config_storage import TOKEN_FIELDS, JSONDirectoryStorage
 from app.logs import logger
+from app.metrics import CONFIG_LOAD_LATENCY
 
 
 def read_json_file(file_path):
@@ -62,39 +69,203 @@ def get_json_file_names(directory):
 
 
 class UserConfigManager:
-    def __init__(self, config_dir: str = "instance/user_configs"):
+    def __init__(
+        self,
+        config_dir: str = "instance/user_configs",
+        index_refresh_interval: float = 5.0,
+        storage=None,
+        cache_size: int = 1024,
+        cache_ttl: float = 60.0,
+        lazy_index: bool = False,
+    ):
         self.config_dir = config_dir
-        os.makedirs(self.config_dir, exist_ok=True)
+        self.index_refresh_interval = index_refresh_interval
+        self.storage = storage or JSONDirectoryStorage(config_dir)
+        # TTL ограничивает устаревание конфигов, изменённых извне
+        self._config_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+        # Индекс: user_id -> {"version", "bot_token", "auth_token"},
+        # плюс обратные словари token -> user_id для поиска за O(1)
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict] = {}
+        self._by_token: Dict[str, Dict[str, str]] = {
+            field: {} for field in TOKEN_FIELDS
+        }
+        # None — индекс ещё не строился; с lazy_index его построит первый поиск
+        self._last_refresh: Optional[float] = None
+        # Обновление идёт не более чем в одном потоке
+        self._refreshing = False
+        if not lazy_index:
+            self.refresh_index()
 
     def get_user_config_path(self, user_id: str) -> str:
         return os.path.join(self.config_dir, f"{user_id}.json")
 
+    def _index_config(self, user_id: str, config: Optional[Dict], version: int):
+        self._unindex_config(user_id)
+        entry = {"version": version}
+        for field in TOKEN_FIELDS:
+            value = config.get(field) if isinstance(config, dict) else None
+            entry[field] = value
+            if value:
+                self._by_token[field][value] = user_id
+        self._entries[user_id] = entry
+
+    def _unindex_config(self, user_id: str):
+        entry = self._entries.pop(user_id, None)
+        if not entry:
+            return
+        for field in TOKEN_FIELDS:
+            if self._by_token[field].get(entry[field]) == user_id:
+                del self._by_token[field][entry[field]]
+
+    def refresh_index(self) -> int:
+        """Синхронизирует индекс с хранилищем, перечитывая только изменённые конфиги.
+
+        Хранилище читается без блокировки; изменения применяются, только
+        если запись не поменялась за время чтения (например, save_config).
+
+        Returns:
+            Количество добавленных, изменённых или удалённых конфигов
+        """
+        # Снимок до чтения хранилища: всё, что изменится после, не трогаем
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            seen = {
+                user_id: entry["version"] for user_id, entry in self._entries.items()
+            }
+        versions = self.storage.versions()
+
+        stale = {
+            user_id: version
+            for user_id, version in versions.items()
+            if seen.get(user_id) != version
+        }
+        loaded = {user_id: self.storage.load(user_id) for user_id in stale}
+
+        changed = 0
+        with self._lock:
+            for user_id, version in stale.items():
+                if self._version(user_id) != seen.get(user_id):
+                    continue
+                self._config_cache.invalidate(user_id)
+                self._index_config(user_id, loaded[user_id], version)
+                changed += 1
+
+            for user_id, version in seen.items():
+                if user_id not in versions and self._version(user_id) == version:
+                    self._config_cache.invalidate(user_id)
+                    self._unindex_config(user_id)
+                    changed += 1
+
+        if changed:
+            logger.debug("Config index refreshed, %s entries changed", changed)
+        return changed
+
+    def _version(self, user_id: str) -> Optional[int]:
+        entry = self._entries.get(user_id)
+        return entry["version"] if entry else None
+
+    def _claim_refresh(self) -> bool:
+        """Занимает очередное обновление; False, если рано или оно уже идёт."""
+        with self._lock:
+            if self._refreshing or (
+                self._last_refresh is not None
+                and time.monotonic() - self._last_refresh < self.index_refresh_interval
+            ):
+                return False
+            self._refreshing = True
+            return True
+
+    def _run_refresh(self):
+        try:
+            self.refresh_index()
+        except Exception as e:
+            logger.error("Config index refresh failed: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _maybe_refresh_index(self) -> bool:
+        # Конфиги может писать и внешний сервис, поэтому при промахе
+        # индекс досинхронизируется, но не чаще index_refresh_interval
+        if not self._claim_refresh():
+            return False
+        self._run_refresh()
+        return True
+
+    def _refresh_in_background(self):
+        if self._claim_refresh():
+            threading.Thread(
+                target=self._run_refresh, name="config-index-refresh", daemon=True
+            ).start()
+
+    def _lookup(self, field: str, key) -> Optional[str]:
+        if not key:
+            return None
+        with self._lock:
+            user_id = self._by_token[field].get(key)
+        if user_id is not None:
+            # Токен могли отозвать или сменить извне: индекс каталога
+            # досинхронизируется в фоне, запрос сканирование не ждёт.
+            # Индексированное хранилище меняется через save_config/delete_config,
+            # а промахи проверяет запросом
+            if not self.storage.indexed:
+                self._refresh_in_background()
+            return user_id
+
+        if self.storage.indexed:
+            # Индексированное хранилище отвечает на промах одним запросом
+            user_id = self.storage.find_user_id(field, key)
+            if user_id is not None:
+                config = self.storage.load(user_id)
+                with self._lock:
+                    self._index_config(user_id, config, self._version(user_id) or 0)
+            return user_id
+
+        if self._maybe_refresh_index():
+            with self._lock:
+                return self._by_token[field].get(key)
+        return None
+
     def save_config(self, user_id: str, config: Dict) -> bool:
         try:
-            with open(self.get_user_config_path(user_id), "w") as f:
-                json.dump(config, f, separators=(",", ":"))
+            version = self.storage.save(user_id, config)
+            self._config_cache.invalidate(user_id)
+            with self._lock:
+                self._index_config(user_id, config, version)
             logger.info(f"Telegram config saved for user {user_id}")
             return True
-        except (IOError, PermissionError) as e:
+        except (IOError, PermissionError, sqlite3.Error) as e:
             logger.error(f"Failed to save Telegram config for user {user_id}: {e}")
             return False
 
     def load_config(self, user_id: str) -> Optional[Dict]:
-        config_path = self.get_user_config_path(user_id)
-        if not os.path.exists(config_path):
-            logger.warning(f"No config file found for user {user_id}")
-            return None
-
-        try:
-            with open(config_path, "r") as f:
-                return json.load(f)
-        except (IOError, json.JSONDecodeError) as e:
-            logger.error(f"Error reading config for user {user_id}: {e}")
-            return None
+        started = time.perf_counter()
+        config = self._config_cache.get(user_id)
+        if config is None:
+            config = self.storage.load(user_id)
+            if config is None:
+                CONFIG_LOAD_LATENCY.observe(time.perf_counter() - started, "not_found")
+                logger.warning("No config found for user %s", user_id)
+                return None
+            self._config_cache.set(user_id, config)
+            CONFIG_LOAD_LATENCY.observe(time.perf_counter() - started, "miss")
+        else:
+            CONFIG_LOAD_LATENCY.observe(time.perf_counter() - started, "hit")
+        # Глубокая копия: вложенные dict/list тоже не должны менять кэш
+        return copy.deepcopy(config)
+
+    def cache_stats(self) -> Dict:
+        return self._config_cache.stats()
 
     def delete_config(self, user_id: str) -> bool:
         try:
-            os.remove(self.get_user_config_path(user_id))
+            if not self.storage.delete(user_id):
+                raise FileNotFoundError(f"No config for user {user_id}")
+            self._config_cache.invalidate(user_id)
+            with self._lock:
+                self._unindex_config(user_id)
             logger.info(f"Telegram disconnected for user {user_id}")
             return True
         except Exception as e:
@@ -114,51 +285,34 @@ class UserConfigManager:
         return json_file_names
 
     def check_user_config(self, user_uuid):
-        result = user_uuid in self.get_json_file_names(self.config_dir)
-        return result
+        with self._lock:
+            if user_uuid in self._entries:
+                return True
+        if not self._maybe_refresh_index():
+            return False
+        with self._lock:
+            return user_uuid in self._entries
 
     def find_user_config_for_bot(self, bot_token):
-        for filename in os.listdir(self.config_dir):
-            if filename.endswith(".json"):
-                with open(os.path.join(self.config_dir, filename)) as f:
-                    if bot_token in f.read():
-                        return filename
+        user_id = self._lookup("bot_token", bot_token)
+        if user_id:
+            return f"{user_id}.json"
         return None
 
     def get_uuid_by_bot_token(self, bot_token):
-        filename = self.find_user_config_for_bot(bot_token)
-        if filename:
-            user_id = os.path.splitext(filename)[0]
-            return user_id
-        return None
+        return self._lookup("bot_token", bot_token)
 
     def user_uuid_by_authtoken(self, authtoken):
-        return self.get_uuid_by_bot_token(authtoken)
+        return self._lookup("auth_token", authtoken) or self._lookup(
+            "bot_token", authtoken
+        )
 
     def get_bot_tokens(self):
-        bot_tokens = []
-
-        # Проходим по всем файлам в указанной директории
-        for filename in os.listdir(self.config_dir):
-            if filename.endswith(".json"):
-                file_path = os.path.join(self.config_dir, filename)
-                data = read_json_file(file_path)
-
-                if data and "bot_token" in data:
-                    bot_tokens.append(data["bot_token"])
-
-        return bot_tokens
+        self._maybe_refresh_index()
+        with self._lock:
+            return [e["bot_token"] for e in self._entries.values() if e["bot_token"]]
 
     def get_auth_tokens(self):
-        auth_tokens = []
-
-        # Проходим по всем файлам в указанной директории
-        for filename in os.listdir(self.config_dir):
-            if filename.endswith(".json"):
-                file_path = os.path.join(self.config_dir, filename)
-                data = read_json_file(file_path)
-
-                if data and "auth_token" in data:
-                    auth_tokens.append(data["auth_token"])
-
-        return auth_tokens
+        self._maybe_refresh_index()
+        with self._lock:
+            return [e["auth_token"] for e in self._entries.values() if e["auth_token"]]
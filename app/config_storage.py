@@ -0,0 +1,265 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.logs import logger
+from app.utils import call_after_fork
+
+TOKEN_FIELDS = ("bot_token", "auth_token")
+
+
+class JSONDirectoryStorage:
+    """One ``<user_id>.json`` file per tenant, versioned by file mtime."""
+
+    indexed = False
+
+    def __init__(self, config_dir: str = "instance/user_configs"):
+        self.config_dir = config_dir
+        os.makedirs(self.config_dir, exist_ok=True)
+
+    def get_path(self, user_id: str) -> str:
+        return os.path.join(self.config_dir, f"{user_id}.json")
+
+    def versions(self) -> Dict[str, int]:
+        """Return ``user_id -> mtime_ns`` for every config without reading it."""
+        versions = {}
+        with os.scandir(self.config_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    versions[os.path.splitext(entry.name)[0]] = entry.stat().st_mtime_ns
+                except FileNotFoundError:
+                    continue
+        return versions
+
+    def load(self, user_id: str) -> Optional[Dict]:
+        config_path = self.get_path(user_id)
+        if not os.path.exists(config_path):
+            return None
+
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            logger.error(f"Error reading config for user {user_id}: {e}")
+            return None
+
+    def save(self, user_id: str, config: Dict) -> int:
+        # Пишем во временный файл и атомарно подменяем, чтобы читатели
+        # никогда не видели наполовину записанный JSON
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.config_dir, prefix=f".{user_id}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(config, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.get_path(user_id))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return os.stat(self.get_path(user_id)).st_mtime_ns
+
+    def delete(self, user_id: str) -> bool:
+        try:
+            os.remove(self.get_path(user_id))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_configs(self) -> Iterator[Tuple[str, Dict]]:
+        """Stream ``(user_id, config)`` pairs, skipping unreadable files."""
+        with os.scandir(self.config_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                user_id = os.path.splitext(entry.name)[0]
+                config = self.load(user_id)
+                if isinstance(config, dict):
+                    yield user_id, config
+
+    def find_user_id(self, field: str, value: str) -> Optional[str]:
+        for user_id, config in self.iter_configs():
+            if config.get(field) == value:
+                return user_id
+        return None
+
+
+class SQLiteConfigStorage:
+    """All tenants in a single SQLite table with indexed token columns."""
+
+    indexed = True
+
+    def __init__(self, db_file: str = "instance/user_configs.db"):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        # Соединения родителя после fork: не используем и не закрываем
+        self._inherited = []
+        self._init_db()
+        call_after_fork(self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._inherited.append(conn)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS user_configs (
+                    user_id TEXT PRIMARY KEY,
+                    bot_token TEXT,
+                    auth_token TEXT,
+                    data TEXT NOT NULL,
+                    version INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_user_configs_bot_token "
+                "ON user_configs (bot_token)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_user_configs_auth_token "
+                "ON user_configs (auth_token)"
+            )
+
+    @staticmethod
+    def _row(user_id: str, config: Dict, version: int) -> Tuple:
+        return (
+            user_id,
+            config.get("bot_token"),
+            config.get("auth_token"),
+            json.dumps(config, separators=(",", ":")),
+            version,
+        )
+
+    def versions(self) -> Dict[str, int]:
+        cursor = self._connection().execute("SELECT user_id, version FROM user_configs")
+        return dict(cursor.fetchall())
+
+    def load(self, user_id: str) -> Optional[Dict]:
+        row = (
+            self._connection()
+            .execute("SELECT data FROM user_configs WHERE user_id = ?", (user_id,))
+            .fetchone()
+        )
+        if not row:
+            return None
+        try:
+            return json.loads(row[0])
+        except json.JSONDecodeError as e:
+            logger.error(f"Error reading config for user {user_id}: {e}")
+            return None
+
+    def save(self, user_id: str, config: Dict) -> int:
+        version = time.time_ns()
+        self.save_many([(user_id, config)], version=version)
+        return version
+
+    def save_many(
+        self, items: Iterable[Tuple[str, Dict]], version: Optional[int] = None
+    ) -> int:
+        """Upsert a batch of configs in one transaction; returns the batch size."""
+        version = version or time.time_ns()
+        rows = [self._row(user_id, config, version) for user_id, config in items]
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO user_configs
+                    (user_id, bot_token, auth_token, data, version)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+        return len(rows)
+
+    def delete(self, user_id: str) -> bool:
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM user_configs WHERE user_id = ?", (user_id,)
+            )
+        return cursor.rowcount > 0
+
+    def iter_configs(self) -> Iterator[Tuple[str, Dict]]:
+        cursor = self._connection().execute("SELECT user_id, data FROM user_configs")
+        for user_id, data in cursor:
+            try:
+                yield user_id, json.loads(data)
+            except json.JSONDecodeError:
+                continue
+
+    def find_user_id(self, field: str, value: str) -> Optional[str]:
+        if field not in TOKEN_FIELDS:
+            raise ValueError(f"Field {field} is not indexed")
+        row = (
+            self._connection()
+            .execute(f"SELECT user_id FROM user_configs WHERE {field} = ?", (value,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+
+def create_config_storage(
+    kind: str = "json",
+    config_dir: str = "instance/user_configs",
+    db_file: str = "instance/user_configs.db",
+):
+    if kind == "json":
+        return JSONDirectoryStorage(config_dir)
+    if kind == "sqlite":
+        return SQLiteConfigStorage(db_file)
+    raise ValueError(f"Unknown config storage: {kind}")
+
+
+def migrate_json_to_sqlite(
+    source_dir: str, db_file: str, batch_size: int = 500
+) -> int:
+    """Stream every JSON config from ``source_dir`` into a SQLite store.
+
+    Files are read one at a time and written in ``batch_size`` transactions,
+    so memory use does not grow with the number of tenants. Re-running the
+    migration overwrites rows with the same ``user_id``.
+    """
+    source = JSONDirectoryStorage(source_dir)
+    target = SQLiteConfigStorage(db_file)
+
+    total = 0
+    batch: List[Tuple[str, Dict]] = []
+    for item in source.iter_configs():
+        batch.append(item)
+        if len(batch) >= batch_size:
+            total += target.save_many(batch)
+            batch = []
+            logger.info("Migrated %s configs", total)
+    if batch:
+        total += target.save_many(batch)
+
+    logger.info("Config migration finished: %s configs -> %s", total, db_file)
+    return total
@@ -0,0 +1,103 @@
+import logging
+from typing import Dict, Hashable
+
+from app.cache import TTLCache
+
+
+def _bot_id(bot_token: str) -> str:
+    # Числовой id бота из "<id>:<secret>", чтобы не хранить сам токен в ключах
+    return bot_token.partition(":")[0]
+
+
+class UpdateDeduplicator:
+    """Remembers seen ``(bot, update_id)`` pairs so redeliveries are dropped.
+
+    Telegram redelivers an update when the webhook is slow or answers with
+    an error; ``claim`` returns True only for the first delivery within
+    ``ttl`` seconds. The store is bounded to ``maxsize`` ids.
+
+    Args:
+        maxsize: Max remembered updates
+        ttl: Seconds an update id is remembered
+    """
+
+    def __init__(self, maxsize: int = 100000, ttl: float = 3600.0):
+        self._seen = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.duplicates = 0
+
+    @staticmethod
+    def _key(bot_token: str, update_id: int) -> Hashable:
+        return _bot_id(bot_token), update_id
+
+    def claim(self, bot_token: str, update_id: int) -> bool:
+        """Mark the update as seen; False if it was already seen."""
+        if self._seen.add(self._key(bot_token, update_id), True):
+            return True
+        self.duplicates += 1
+        return False
+
+    def release(self, bot_token: str, update_id: int):
+        """Forget a claimed update, e.g. when it could not be queued."""
+        self._seen.invalidate(self._key(bot_token, update_id))
+
+    def stats(self) -> Dict:
+        return {"size": len(self._seen), "duplicates": self.duplicates}
+
+
+class RedisUpdateDeduplicator:
+    """Same as ``UpdateDeduplicator`` but shared by all processes via Redis.
+
+    Each update is a ``SET NX EX`` key, so the first process to claim it
+    wins. If Redis is unavailable the update is let through: a rare
+    duplicate reply is better than a lost message.
+
+    Args:
+        redis_client: ``redis.Redis`` instance
+        logger: Logger instance
+        key_prefix: Namespace for dedup keys
+        ttl: Seconds an update id is remembered
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        logger: logging.Logger,
+        key_prefix: str = "om11tg:update:",
+        ttl: int = 3600,
+    ):
+        # Импорт здесь: без Redis-бэкенда модуль redis не нужен
+        from redis import RedisError
+
+        self._redis_error = RedisError
+        self.redis_client = redis_client
+        self.logger = logger
+        self.key_prefix = key_prefix
+        self.ttl = int(ttl)
+        self.duplicates = 0
+        self.errors = 0
+
+    def _key(self, bot_token: str, update_id: int) -> str:
+        return f"{self.key_prefix}{_bot_id(bot_token)}:{update_id}"
+
+    def claim(self, bot_token: str, update_id: int) -> bool:
+        try:
+            claimed = self.redis_client.set(
+                self._key(bot_token, update_id), 1, nx=True, ex=self.ttl
+            )
+        except self._redis_error as e:
+            self.errors += 1
+            self.logger.warning("Update dedup unavailable, letting update through: %s", e)
+            return True
+        if claimed:
+            return True
+        self.duplicates += 1
+        return False
+
+    def release(self, bot_token: str, update_id: int):
+        try:
+            self.redis_client.delete(self._key(bot_token, update_id))
+        except self._redis_error as e:
+            self.logger.warning("Failed to release update %s: %s", update_id, e)
+
+    def stats(self) -> Dict:
+        return {"duplicates": self.duplicates, "errors": self.errors}
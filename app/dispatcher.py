@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from app.workers import UpdateWorkerPool
+
+
+class UpdateDispatcher:
+    """Runs updates from one chat in order and different chats in parallel.
+
+    Each ``(bot_token, chat_id)`` pair gets a lane: a FIFO queue drained by at
+    most one worker at a time. Lanes share the worker pool, and a lane gives
+    its worker back after ``max_batch`` updates so a busy chat cannot starve
+    the others.
+
+    Args:
+        logger: Logger instance
+        worker_pool: Pool the lanes are drained on
+        handler: Callable taking ``(update, bot_token, deadline=...)``
+        max_lane_size: Max updates queued per lane before new ones are rejected
+        max_pending: Max queued plus running updates over all lanes (None:
+            only the per-lane limit applies)
+        max_batch: Updates handled per worker turn before the lane is requeued
+        deadline_budget: Seconds from arrival an update may take; passed to
+            the handler as ``deadline`` (None disables)
+        deduplicator: Optional store with ``claim``/``release``; updates whose
+            ``update_id`` was already claimed are acknowledged and dropped
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        worker_pool: UpdateWorkerPool,
+        handler: Callable,
+        max_lane_size: int = 100,
+        max_pending: Optional[int] = None,
+        max_batch: int = 10,
+        deduplicator=None,
+        deadline_budget: Optional[float] = None,
+    ):
+        self.logger = logger
+        self.worker_pool = worker_pool
+        self.handler = handler
+        self.max_lane_size = max_lane_size
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.deduplicator = deduplicator
+        self.deadline_budget = deadline_budget
+
+        self._lanes: Dict[Hashable, Deque[Tuple]] = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.dispatched = 0
+        self.rejected = 0
+        self.duplicates = 0
+
+    @staticmethod
+    def lane_key(update: Dict, bot_token: str) -> Hashable:
+        message = update.get("message") or {}
+        chat_id = (message.get("chat") or {}).get("id")
+        if chat_id is None:
+            chat_id = (message.get("from") or {}).get("id")
+        return bot_token, chat_id
+
+    def dispatch(
+        self, update: Dict, bot_token: str, received_at: Optional[float] = None
+    ) -> bool:
+        """Queue an update on its lane; returns False if it was rejected.
+
+        ``received_at`` is the ``time.monotonic()`` arrival time used for the
+        deadline (defaults to now). A repeated delivery of an already
+        accepted update returns True without queueing it, so Telegram stops
+        redelivering it.
+        """
+        if received_at is None:
+            received_at = time.monotonic()
+        update_id: Optional[int] = update.get("update_id")
+        if self.deduplicator is not None and update_id is not None:
+            if not self.deduplicator.claim(bot_token, update_id):
+                self.duplicates += 1
+                return True
+            if not self._enqueue(update, bot_token, received_at):
+                # Не приняли — повторная доставка должна пройти
+                self.deduplicator.release(bot_token, update_id)
+                return False
+            return True
+        return self._enqueue(update, bot_token, received_at)
+
+    def _enqueue(self, update: Dict, bot_token: str, received_at: float) -> bool:
+        key = self.lane_key(update, bot_token)
+        item = (update, bot_token, received_at)
+
+        with self._lock:
+            if self.max_pending is not None and self._pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            lane = self._lanes.get(key)
+            if lane is not None:
+                # Лента уже обрабатывается, просто ставим в очередь
+                if len(lane) >= self.max_lane_size:
+                    self.rejected += 1
+                    return False
+                lane.append(item)
+                self._pending += 1
+                self.dispatched += 1
+                return True
+
+            self._lanes[key] = deque([item])
+            self._pending += 1
+
+        # Пул вызываем без блокировки; лента уже есть, новые апдейты встают в неё
+        if self.worker_pool.submit(self._drain, key):
+            with self._lock:
+                self.dispatched += 1
+            return True
+
+        # Пул закрыт (остановка): ленту никто не разберёт
+        with self._lock:
+            dropped = self._lanes.pop(key)
+            self._pending -= len(dropped)
+            self.rejected += 1
+        if len(dropped) > 1:
+            self.logger.error(
+                "Dropping %s updates queued for lane %s during shutdown",
+                len(dropped) - 1,
+                key,
+            )
+        return False
+
+    def _drain(self, key: Hashable):
+        handled = 0
+        while True:
+            with self._lock:
+                lane = self._lanes[key]
+                if not lane:
+                    del self._lanes[key]
+                    return
+                yield_turn = handled >= self.max_batch
+                if not yield_turn:
+                    update, bot_token, received_at = lane[0]
+
+            if yield_turn:
+                # Отдаём поток другим лентам; если пул занят, продолжаем сами
+                if self.worker_pool.submit(self._drain, key):
+                    return
+                handled = 0
+                continue
+
+            deadline = (
+                received_at + self.deadline_budget
+                if self.deadline_budget is not None
+                else None
+            )
+            try:
+                self.handler(update, bot_token, deadline=deadline)
+            except Exception as e:
+                self.logger.exception("Error handling update for lane %s: %s", key, e)
+            finally:
+                with self._lock:
+                    lane.popleft()
+                    self._pending -= 1
+            handled += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            depths = [len(lane) for lane in self._lanes.values()]
+            now = time.monotonic()
+            oldest = max(
+                (now - lane[0][2] for lane in self._lanes.values() if lane),
+                default=0.0,
+            )
+            pending = self._pending
+        return {
+            "active_lanes": len(depths),
+            "queued_updates": pending,
+            "max_lane_depth": max(depths, default=0),
+            "oldest_update_age": oldest,
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "pool_pending": self.worker_pool.pending,
+        }
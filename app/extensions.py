@@ -1,11 +1,18 @@
-import redis
-
-
 def init_redis(config):
-    redis_client = redis.Redis(
+    # redis нужен только с Redis-бэкендами, не тянем его при импорте
+    import redis
+
+    pool = redis.ConnectionPool(
         host=config.HOST,
         port=config.PORT,
         db=config.DB,
         decode_responses=config.DECODE_RESPONSES,
+        max_connections=config.get("MAX_CONNECTIONS", 50),
+        socket_timeout=config.get("SOCKET_TIMEOUT", 5.0),
+        socket_connect_timeout=config.get("SOCKET_CONNECT_TIMEOUT", 2.0),
+        socket_keepalive=True,
+        health_check_interval=config.get("HEALTH_CHECK_INTERVAL", 30),
+        retry_on_timeout=True,
     )
+    redis_client = redis.Redis(connection_pool=pool)
     return redis_client
@@ -1,7 +1,19 @@
+import atexit
+import copy
+import gzip
+import json
 import logging
+import os
+import queue
+import random
+import shutil
 import sys
-from logging.handlers import RotatingFileHandler
-from typing import Dict, Any
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Callable, Dict, Optional
+
+# Длинные payload'ы (апдейты, ответы API) обрезаются до этого размера
+DEFAULT_MAX_FIELD_LENGTH = 2000
 
 # Color codes
 COLORS: Dict[str, str] = {
@@ -33,10 +45,15 @@ class ColoredFormatter(logging.Formatter):
         self._fmt = fmt
 
     def format(self, record: logging.LogRecord) -> str:
-        """Format the specified record with colors."""
+        """Format the specified record with colors.
+
+        Works on a copy so other handlers still see the original record.
+        """
+        record = copy.copy(record)
         color = LOG_LEVEL_COLORS.get(record.levelname, COLORS["RESET"])
         record.levelname = f"{color}{record.levelname}{COLORS['RESET']}"
-        record.msg = f"{color}{record.msg}{COLORS['RESET']}"
+        record.msg = f"{color}{record.getMessage()}{COLORS['RESET']}"
+        record.args = None
 
         # Include filename and line number for debug purposes
         if record.levelno >= logging.WARNING:
@@ -45,12 +62,180 @@ class ColoredFormatter(logging.Formatter):
         return super().format(record)
 
 
+def truncate(value: Any, limit: int = DEFAULT_MAX_FIELD_LENGTH) -> str:
+    """Render ``value`` as text of at most ``limit`` characters.
+
+    Dicts and lists are dumped as compact JSON; the cut-off tail is replaced
+    with a marker that tells how many characters were dropped.
+    """
+    if isinstance(value, str):
+        text = value
+    elif isinstance(value, (dict, list, tuple)):
+        try:
+            text = json.dumps(value, ensure_ascii=False, default=str)
+        except (TypeError, ValueError):
+            text = str(value)
+    else:
+        text = str(value)
+    if limit and len(text) > limit:
+        return f"{text[:limit]}...(+{len(text) - limit} chars)"
+    return text
+
+
+class Truncated:
+    """Lazy log argument: ``truncate`` runs only if the record is emitted.
+
+    Usage: ``logger.debug("Update: %s", Truncated(update))``
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = DEFAULT_MAX_FIELD_LENGTH):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return truncate(self.value, self.limit)
+
+    __repr__ = __str__
+
+
+# Стандартные атрибуты LogRecord; всё остальное пришло через extra=
+_RECORD_ATTRS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None))
+) | {"message", "asctime", "sample_rate"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with every field truncated to ``max_field_length``.
+
+    Args:
+        max_field_length: Max characters of the message, traceback and each
+            ``extra`` field (0 disables truncation)
+    """
+
+    def __init__(self, max_field_length: int = DEFAULT_MAX_FIELD_LENGTH):
+        super().__init__()
+        self.max_field_length = max_field_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        limit = self.max_field_length
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": truncate(record.getMessage(), limit),
+            "file": f"{record.filename}:{record.lineno}",
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = (
+                    value
+                    if isinstance(value, (int, float, bool)) or value is None
+                    else truncate(value, limit)
+                )
+        if record.exc_info:
+            payload["exc"] = truncate(self.formatException(record.exc_info), limit)
+        elif record.exc_text:
+            payload["exc"] = truncate(record.exc_text, limit)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Let through only a fraction of records of the noisy levels.
+
+    ``rates`` maps a level to the share of its records that are kept
+    (``{logging.DEBUG: 0.1}`` keeps every tenth DEBUG record on average).
+    A single call can override it with ``extra={"sample_rate": 0.01}``.
+    WARNING and above are never sampled.
+    """
+
+    def __init__(
+        self,
+        rates: Dict[int, float],
+        rng: Callable[[], float] = random.random,
+    ):
+        super().__init__()
+        self.rates = dict(rates)
+        self._rng = rng
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0:
+            return True
+        return rate > 0.0 and self._rng() < rate
+
+
+def gzip_namer(name: str) -> str:
+    return f"{name}.gz"
+
+
+def gzip_rotator(source: str, dest: str):
+    """Compress the rotated log file instead of just renaming it."""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """``QueueHandler`` that leaves all formatting to the listener thread.
+
+    The stdlib ``prepare`` formats the record on the calling thread (which
+    also renders ``Truncated`` arguments and merges the traceback into the
+    message); here the record is only copied.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+# Запущенные QueueListener по имени логгера, чтобы останавливать их при перенастройке
+_listeners: Dict[str, QueueListener] = {}
+
+
+def stop_listener(name: str):
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+
+
+def _restart_listeners_after_fork():
+    # Поток QueueListener не переживает fork: в потомке заводим новый listener
+    # с теми же handler'ами и новой очередью, чтобы не дописать записи родителя
+    for name, listener in list(_listeners.items()):
+        log_queue: queue.Queue = queue.Queue(-1)
+        for handler in logging.getLogger(name).handlers:
+            if isinstance(handler, QueueHandler):
+                handler.queue = log_queue
+        restarted = QueueListener(
+            log_queue,
+            *listener.handlers,
+            respect_handler_level=listener.respect_handler_level,
+        )
+        restarted.start()
+        _listeners[name] = restarted
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+
+
 def setup_logger(
     name: str = __name__,
     level: int = logging.DEBUG,
     log_file: str = None,
     max_bytes: int = 10 * 1024 * 1024,  # 10MB
     backup_count: int = 5,
+    async_mode: bool = False,
+    compress_backups: bool = False,
+    json_format: bool = False,
+    max_field_length: int = DEFAULT_MAX_FIELD_LENGTH,
+    debug_sample_rate: float = 1.0,
 ) -> logging.Logger:
     """Configure and return a logger with enhanced features.
     
@@ -60,6 +245,12 @@ def setup_logger(
         log_file: Path to log file (optional)
         max_bytes: Max log file size before rotation
         backup_count: Number of backup logs to keep
+        async_mode: Only enqueue records on the calling thread; a background
+            QueueListener formats and writes them
+        compress_backups: Gzip rotated log files
+        json_format: Write one JSON object per record instead of text
+        max_field_length: Truncation limit for JSON fields
+        debug_sample_rate: Share of DEBUG records that are kept (0..1)
         
     Returns:
         Configured logger instance
@@ -68,31 +259,63 @@ def setup_logger(
     logger.setLevel(level)
 
     # Clear existing handlers to avoid duplicate logs
+    stop_listener(name)
     if logger.hasHandlers():
+        for handler in logger.handlers:
+            handler.close()
         logger.handlers.clear()
+    for log_filter in list(logger.filters):
+        if isinstance(log_filter, SamplingFilter):
+            logger.removeFilter(log_filter)
+
+    # Сэмплирование на уровне логгера: отброшенные записи не попадают
+    # ни в очередь, ни в форматтер
+    if debug_sample_rate < 1.0:
+        logger.addFilter(SamplingFilter({logging.DEBUG: debug_sample_rate}))
+
+    json_formatter: Optional[JSONFormatter] = (
+        JSONFormatter(max_field_length) if json_format else None
+    )
+    handlers = []
 
     # Console handler with colored output
     console_handler = logging.StreamHandler(sys.stdout)
-    console_formatter = ColoredFormatter(
+    console_formatter = json_formatter or ColoredFormatter(
         "%(asctime)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)"
     )
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # File handler with rotation if log file is specified
     if log_file:
         file_handler = RotatingFileHandler(
-            log_file, maxBytes=max_bytes, backupCount=backup_count
+            log_file, maxBytes=max_bytes, backupCount=backup_count, delay=True
         )
-        file_formatter = logging.Formatter(
+        if compress_backups:
+            file_handler.namer = gzip_namer
+            file_handler.rotator = gzip_rotator
+        file_formatter = json_formatter or logging.Formatter(
             "%(asctime)s - %(name)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)"
         )
         file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    if not async_mode:
+        for handler in handlers:
+            logger.addHandler(handler)
+        return logger
 
+    # Запись, форматирование и ротация уходят в поток QueueListener
+    log_queue: queue.Queue = queue.Queue(-1)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners[name] = listener
     return logger
 
-logger = setup_logger(log_file="app.log")
+# Файл (LOG_FILE) подключает create_app; импорт модуля ничего не открывает
+logger = setup_logger()
+atexit.register(lambda: stop_listener(logger.name))
 
 # Example usage
 if __name__ == "__main__":
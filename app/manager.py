@@ -3,10 +3,10 @@ import logging
 import requests
 
 from app.config_manager import UserConfigManager
-from app.logs import logger
+from app.logs import Truncated, logger
 from app.messages import MessageBuilder
-
-BOT_API_URL = "https://api.telegram.org/bot"
+from app.telegram_client import TelegramClient
+from app.webhooks import WebhookReconciler, webhook_params
 
 
 class TelegramManager:
@@ -16,35 +16,37 @@ class TelegramManager:
         config_manager: UserConfigManager,
         message_creator: MessageBuilder,
         server_address: str,
+        telegram_client: TelegramClient,
+        webhook_reconciler: WebhookReconciler,
     ):
         self.logger = logger
         self.config_manager = config_manager
         self.message_creator = message_creator
         self.server_address = server_address
+        self.telegram_client = telegram_client
+        self.webhook_reconciler = webhook_reconciler
 
     def test_connection(self, bot_token: str, chat_id: str) -> Tuple[bool, str]:
         logger.info("Starting Telegram API connection test.")
         try:
-            me_response = requests.get(
-                f"https://api.telegram.org/bot{bot_token}/getMe", timeout=10
-            )
-            logger.debug("Response from getMe: %s", me_response.json())
+            me_response = self.telegram_client.get(bot_token, "getMe")
+            me_data = me_response.json()
+            logger.debug("Response from getMe: %s", Truncated(me_data))
 
-            if not me_response.json().get("ok"):
+            if not me_data.get("ok"):
                 logger.error("Invalid bot token: %s", bot_token)
                 return False, "Неверный токен бота"
 
             message_text = self.message_creator.telegram_connected(self.server_address)
             logger.debug("Message text created: %s", message_text)
 
-            send_response = requests.post(
-                f"https://api.telegram.org/bot{bot_token}/sendMessage",
-                json={"chat_id": chat_id, "text": message_text, "parse_mode": "HTML"},
-                timeout=10,
+            send_response = self.telegram_client.send_message(
+                bot_token, chat_id, message_text, parse_mode="HTML"
             )
-            logger.debug("Response from sendMessage: %s", send_response.json())
+            send_data = send_response.json()
+            logger.debug("Response from sendMessage: %s", Truncated(send_data))
 
-            if not send_response.json().get("ok"):
+            if not send_data.get("ok"):
                 logger.error("Failed to send message. Chat ID: %s", chat_id)
                 return False, "Не удалось отправить сообщение (проверьте Chat ID)"
 
@@ -86,14 +88,8 @@ class TelegramManager:
             return {"success": False, "error": "Неполная конфигурация Telegram"}, 400
 
         try:
-            payload = {"chat_id": chat_id, "text": message_text}
-            if parse_mode:
-                payload["parse_mode"] = parse_mode
-
-            response = requests.post(
-                f"https://api.telegram.org/bot{bot_token}/sendMessage",
-                json=payload,
-                timeout=10,
+            response = self.telegram_client.send_message(
+                bot_token, chat_id, message_text, parse_mode=parse_mode
             )
             response_data = response.json()
 
@@ -125,12 +121,12 @@ class TelegramManager:
 
     def check_webhook(self, token):
         self.logger.debug("Checking webhook for token: %s", token)
-        response = requests.get(f"https://api.telegram.org/bot{token}/getWebhookInfo")
+        response = self.telegram_client.get(token, "getWebhookInfo")
         self.logger.debug("getWebhookInfo response status: %s", response.status_code)
 
         if response.ok:
             data = response.json()
-            self.logger.debug("Webhook info retrieved: %s", data)
+            self.logger.debug("Webhook info retrieved: %s", Truncated(data))
             if data["result"]["url"]:  # Если есть URL, то вебхук установлен
                 self.logger.info("Webhook is already set for token: %s", token)
                 return True
@@ -149,11 +145,12 @@ class TelegramManager:
         url = f"{self.server_address}/webhook/{token}"
         self.logger.info("Setting webhook for token: %s with URL: %s", token, url)
 
-        response = requests.get(f"{BOT_API_URL}{token}/setWebhook?url={url}")
+        response = self.telegram_client.get(token, "setWebhook", params=webhook_params(url))
         self.logger.info("setWebhook response status: %s", response.status_code)
 
         if response.ok:
             self.logger.info("Webhook successfully set for token: %s", token)
+            self.webhook_reconciler.remember(token, url)
         else:
             self.logger.error(
                 "Failed to set webhook for token: %s, status code: %s",
@@ -163,15 +160,8 @@ class TelegramManager:
 
         return response.ok
 
-    def set_webhooks(self):
+    def set_webhooks(self, force_check: bool = False) -> Dict:
+        """Register webhooks for all configured bots where they differ."""
         bot_tokens = self.config_manager.get_bot_tokens()
-        self.logger.info("Setting webhooks for tokens...")
-
-        for token in bot_tokens:
-            if self.check_webhook(token):
-                if self.set_webhook(token):
-                    self.logger.info("Webhook установлен для токена: %s", token)
-                else:
-                    self.logger.error("Ошибка установки вебхука для токена: %s", token)
-            else:
-                self.logger.warning("Token is invalid or already registered: %s", token)
+        self.logger.info("Reconciling webhooks for %s tokens...", len(bot_tokens))
+        return self.webhook_reconciler.reconcile(bot_tokens, force_check=force_check)
@@ -1,25 +1,371 @@
-import requests
-from typing import List
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import logging
 
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.cache import TTLCache
+from app.metrics import AGENT_LATENCY
+from app.resilience import AdaptiveTimeout, CircuitBreaker
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+MAX_AGE_RE = re.compile(r"(?:^|,)\s*max-age\s*=\s*(\d+)", re.IGNORECASE)
+
+
+class AgentUnavailableError(Exception):
+    """The agent is down (breaker open, 5xx, timeout) or the deadline is spent."""
+
+
+def cache_max_age(response: requests.Response) -> int:
+    """Seconds the agent allows its answer to be reused (0 if not cacheable)."""
+    cache_control = response.headers.get("Cache-Control", "")
+    if "no-store" in cache_control.lower() or "no-cache" in cache_control.lower():
+        return 0
+    match = MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else 0
+
+
+def parse_stream_line(line: str) -> Optional[str]:
+    """Text of one NDJSON line (a JSON string or ``{"text": ...}``), or None.
+
+    Raises:
+        ValueError: If the line is not valid JSON
+    """
+    if not line:
+        return None
+    chunk = json.loads(line)
+    if isinstance(chunk, dict):
+        chunk = chunk.get("text")
+    return str(chunk) if chunk else None
+
+
+class AgentClientBase:
+    """Decisions shared by ``ManusAgent`` and ``AsyncManusAgent``.
 
-class ManusAgent:
-    def __init__(self, agent_url: str, logger: logging.Logger):
+    Deadline read timeouts, the circuit breaker, the answer
+    format check, the ``max-age`` result cache, the in-flight map and stats
+    live here; the subclasses only make the HTTP calls and coalesce
+    in-flight requests with their own kind of future.
+    """
+
+    def __init__(
+        self,
+        agent_url: str,
+        logger: logging.Logger,
+        result_cache_size: int = 0,
+        result_cache_max_ttl: float = 30.0,
+        connect_timeout: float = 3.0,
+        adaptive_timeout: Optional[AdaptiveTimeout] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
         self.agent_url = agent_url
         self.logger = logger
+        self.connect_timeout = connect_timeout
+        self.adaptive_timeout = adaptive_timeout or AdaptiveTimeout()
+        self.breaker = breaker or CircuitBreaker()
+
+        self.result_cache_max_ttl = result_cache_max_ttl
+        self._result_cache: Optional[TTLCache] = (
+            TTLCache(maxsize=result_cache_size, ttl=result_cache_max_ttl)
+            if result_cache_size > 0
+            else None
+        )
+        # Запросы в полёте: ключ -> future с результатом ведущего вызова
+        self._inflight: Dict[Tuple[str, str], Any] = {}
+        self.coalesced = 0
+
+    def _read_timeout(self, deadline: Optional[float]) -> float:
+        """Read timeout: ``max_timeout`` within the remaining deadline budget.
+
+        The adaptive estimate is not applied here; cutting calls to it would
+        time out every agent run longer than the recent ones.
+        """
+        read_timeout = self.adaptive_timeout.max_timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AgentUnavailableError("Update deadline exceeded before agent call")
+            read_timeout = min(read_timeout, remaining)
+        return read_timeout
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            raise AgentUnavailableError("Agent circuit breaker is open")
+
+    def _check_status(self, status: int):
+        """Feed the breaker with the answer status; 5xx means the agent is down.
+
+        Only 2xx proves the agent healthy; a rejected request (4xx) releases
+        a half-open probe without closing the breaker.
+        """
+        if status >= 500:
+            self.breaker.record_failure()
+            raise AgentUnavailableError(f"Agent answered {status}")
+        if 200 <= status < 300:
+            self.breaker.record_success()
+        else:
+            # 4xx — агент жив, но ошибка в запросе ничего не говорит о его здоровье
+            self.breaker.release()
+
+    def _record_failure(self, read_timeout: float, timed_out: bool):
+        # Дедлайн оставил меньше обычного времени ответа агента — это не его вина
+        if timed_out and read_timeout < self.adaptive_timeout.current():
+            self.breaker.release()
+            return
+        self.breaker.record_failure()
+
+    def _request_failed(
+        self, error: Exception, started: float, read_timeout: float, timed_out: bool
+    ) -> AgentUnavailableError:
+        """Record a connection error or timeout of a plain call."""
+        # Таймаут тоже учитываем в EWMA, иначе при росте задержек он не вырастет
+        self.adaptive_timeout.observe(time.perf_counter() - started)
+        self._record_failure(read_timeout, timed_out)
+        return AgentUnavailableError(f"Agent request failed: {error!r}")
+
+    def _stream_failed(
+        self, error: Exception, yielded: bool, read_timeout: float, timed_out: bool
+    ) -> Optional[AgentUnavailableError]:
+        """Record a failed stream; the error to raise if nothing was sent yet."""
+        self._record_failure(read_timeout, timed_out)
+        if not yielded:
+            return AgentUnavailableError(f"Agent stream failed: {error!r}")
+        # Часть ответа уже отправлена, просто обрываем поток
+        self.logger.error("Stream request failed: %r", error)
+        return None
+
+    def _command_list(self, data) -> Optional[List[str]]:
+        if not isinstance(data, list):
+            self.logger.error("Invalid response format")
+            return None
+        return data
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[List[str]]:
+        if self._result_cache is None:
+            return None
+        cached = self._result_cache.get(key)
+        return None if cached is None else list(cached)
 
-    def execute_command(self, message: str, user_uuid: str) -> List[str]:
+    def _remember(self, key: Tuple[str, str], command_list: List[str], max_age: int):
+        if self._result_cache is not None and max_age > 0:
+            self._result_cache.set(
+                key, command_list, ttl=min(max_age, self.result_cache_max_ttl)
+            )
+
+    def stats(self) -> Dict:
+        # len() словаря атомарна, блокировка подкласса здесь не нужна
+        stats = {"inflight": len(self._inflight), "coalesced": self.coalesced}
+        stats.update(self.adaptive_timeout.stats())
+        stats.update(
+            {f"breaker_{key}": value for key, value in self.breaker.stats().items()}
+        )
+        if self._result_cache is not None:
+            cache_stats = self._result_cache.stats()
+            stats.update(
+                cache_size=cache_stats["size"],
+                cache_hits=cache_stats["hits"],
+                cache_misses=cache_stats["misses"],
+            )
+        return stats
+
+
+class ManusAgent(AgentClientBase):
+    """Client for the OM11 agent.
+
+    Requests go through one pooled keep-alive session. Each call may carry a
+    ``deadline`` (``time.monotonic()`` value) derived from when the update
+    arrived; the read timeout is the smaller of the remaining budget and
+    ``max_timeout``. Connection errors, timeouts and 5xx answers feed a
+    circuit breaker; while it is open calls fail fast with
+    ``AgentUnavailableError``. A timeout shorter than the slow-call threshold
+    learned from recent latencies means the budget ran out, not that the
+    agent is down, and does not count against the breaker.
+
+    Concurrent ``execute_command`` calls with the same ``(message, user_uuid)``
+    share one in-flight request and its result. With ``result_cache_size``
+    set, answers the agent marks cacheable (``Cache-Control: max-age=N``) are
+    reused for ``min(N, result_cache_max_ttl)`` seconds.
+
+    Args:
+        agent_url: Base URL of the agent API
+        logger: Logger instance
+        result_cache_size: Max cached answers (0 disables the cache)
+        result_cache_max_ttl: Upper bound for the agent's max-age in seconds
+        pool_size: Max keep-alive connections to the agent
+        connect_timeout: Connect timeout in seconds
+        adaptive_timeout: Slow-call threshold and read timeout (defaults to 5..120 s)
+        breaker: Circuit breaker (defaults to 5 failures / 30 s)
+    """
+
+    def __init__(
+        self,
+        agent_url: str,
+        logger: logging.Logger,
+        result_cache_size: int = 0,
+        result_cache_max_ttl: float = 30.0,
+        pool_size: int = 20,
+        connect_timeout: float = 3.0,
+        adaptive_timeout: Optional[AdaptiveTimeout] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__(
+            agent_url,
+            logger,
+            result_cache_size=result_cache_size,
+            result_cache_max_ttl=result_cache_max_ttl,
+            connect_timeout=connect_timeout,
+            adaptive_timeout=adaptive_timeout,
+            breaker=breaker,
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._inflight_lock = threading.Lock()
+
+    def _timeouts(self, deadline: Optional[float]) -> Tuple[float, float]:
+        """(connect, read) timeouts within the remaining deadline budget."""
+        read_timeout = self._read_timeout(deadline)
+        return min(self.connect_timeout, read_timeout), read_timeout
+
+    def execute_command(
+        self, message: str, user_uuid: str, deadline: Optional[float] = None
+    ) -> List[str]:
+        """Return the agent output for ``message``.
+
+        Raises:
+            AgentUnavailableError: Breaker open, agent failed or deadline spent
+        """
+        key = (message, user_uuid)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                return list(future.result(timeout=timeout))
+            except FutureTimeoutError:
+                raise AgentUnavailableError("Update deadline exceeded waiting for agent")
+
+        try:
+            command_list, max_age = self._request_command(message, user_uuid, deadline)
+            self._remember(key, command_list, max_age)
+            future.set_result(command_list)
+            return list(command_list)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                # KeyboardInterrupt и т.п. не передаём ожидающим потокам
+                future.set_exception(AgentUnavailableError("Agent call was interrupted"))
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _request_command(
+        self, message: str, user_uuid: str, deadline: Optional[float]
+    ) -> Tuple[List[str], int]:
+        """Call the agent; returns the output and the cacheable max-age."""
+        timeouts = self._timeouts(deadline)
+        self._check_breaker()
         params = {"message": message, "user_uuid": user_uuid}
+        started = time.perf_counter()
+        outcome = "error"
         try:
-            response = requests.get(
-                f"{self.agent_url}/api/execute_command/", params=params
+            response = self.session.get(
+                f"{self.agent_url}/api/execute_command/", params=params, timeout=timeouts
             )
+            elapsed = time.perf_counter() - started
+            self._check_status(response.status_code)
+            self.adaptive_timeout.observe(elapsed)
             response.raise_for_status()
-            command_list: List[str] = response.json()
-            if not isinstance(command_list, list):
-                self.logger.error("Invalid response format")
-                return []
-            return command_list
+            command_list = self._command_list(response.json())
+            if command_list is None:
+                return [], 0
+            outcome = "ok"
+            return command_list, cache_max_age(response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise self._request_failed(
+                e, started, timeouts[1], isinstance(e, requests.ReadTimeout)
+            ) from e
+        except (requests.RequestException, ValueError) as e:
+            self.logger.error("Request failed: %s", e)
+            return [], 0
+        finally:
+            AGENT_LATENCY.observe(time.perf_counter() - started, "plain", outcome)
+
+    def execute_command_stream(
+        self, message: str, user_uuid: str, deadline: Optional[float] = None
+    ) -> Iterator[str]:
+        """Yield output chunks as the agent produces them.
+
+        Asks the agent for an NDJSON stream (one JSON string per line). If the
+        agent answers with a plain JSON list instead, its items are yielded.
+        The read timeout bounds the gap between chunks, not the whole stream.
+
+        Raises:
+            AgentUnavailableError: If the agent fails before the first chunk
+        """
+        timeouts = self._timeouts(deadline)
+        self._check_breaker()
+        params = {"message": message, "user_uuid": user_uuid, "stream": "1"}
+        started = time.perf_counter()
+        outcome = "error"
+        yielded = False
+        try:
+            with self.session.get(
+                f"{self.agent_url}/api/execute_command/",
+                params=params,
+                headers={"Accept": NDJSON_CONTENT_TYPE},
+                stream=True,
+                timeout=timeouts,
+            ) as response:
+                self._check_status(response.status_code)
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+                if not content_type.startswith(NDJSON_CONTENT_TYPE):
+                    command_list = self._command_list(response.json())
+                    if command_list is None:
+                        return
+                    outcome = "ok"
+                    yield from command_list
+                    return
+
+                # chunk_size=None отдаёт данные по мере поступления chunked-ответа
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    try:
+                        chunk = parse_stream_line(line)
+                    except ValueError:
+                        self.logger.error("Invalid stream line: %.100s", line)
+                        continue
+                    if chunk:
+                        yielded = True
+                        yield chunk
+                outcome = "ok"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = self._stream_failed(
+                e, yielded, timeouts[1], isinstance(e, requests.ReadTimeout)
+            )
+            if error is not None:
+                raise error from e
         except requests.RequestException as e:
-            self.logger.error(f"Request failed: {e}")
-            return []
+            self.logger.error("Stream request failed: %s", e)
+        finally:
+            # Время до конца потока, а не до первого чанка
+            AGENT_LATENCY.observe(time.perf_counter() - started, "stream", outcome)
@@ -2,7 +2,6 @@ from dataclasses import dataclass
 from typing import Optional
 
 AUTH_TOKEN_LENGTH = 32
-AUTH_TIMEOUT = 300
 
 
 @dataclass
@@ -36,6 +35,10 @@ class MessageTemplates:
         "⏳ Срок действия токена истек\n" "Пожалуйста, запросите новый токен."
     )
 
+    AGENT_UNAVAILABLE: str = (
+        "⚠️ Агент временно недоступен\n" "Пожалуйста, повторите запрос через минуту."
+    )
+
     AUTH_INVALID: str = (
         "❌ Неверный токен\n" "Проверьте правильность ввода и попробуйте снова."
     )
@@ -63,6 +66,9 @@ class MessageBuilder:
     def auth_expired(self) -> str:
         return self.templates.AUTH_EXPIRED
 
+    def agent_unavailable(self) -> str:
+        return self.templates.AGENT_UNAVAILABLE
+
     def auth_invalid(self) -> str:
         return self.templates.AUTH_INVALID
 
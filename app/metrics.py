@@ -0,0 +1,269 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы бакетов в секундах: от быстрых ответов кэша до долгих вызовов агента
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _add_labels(sample: str, pairs: str) -> str:
+    """Prepend ``pairs`` (``a="1",b="2"``) to the labels of a sample line."""
+    name, sep, rest = sample.partition("{")
+    if sep:
+        return f"{name}{{{pairs},{rest}"
+    name, _, value = sample.partition(" ")
+    return f"{name}{{{pairs}}} {value}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Histogram:
+    """Cumulative histogram of observed values (seconds for latencies).
+
+    An observation is a bisect over the bucket bounds and three increments
+    under a lock, so it is cheap enough for every request.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по бакетам (+Inf последний), сумма, количество]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [
+                (labels, list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            ]
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                label_str = _format_labels(names, labels + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class CallbackGauge:
+    """Gauge read from a callback at scrape time.
+
+    The callback returns either a number or a dict mapping label values
+    (a tuple, or a single value for one label) to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable,
+        labelnames: Sequence[str] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = []
+        for labels, value in values.items():
+            if not isinstance(labels, tuple):
+                labels = (labels,)
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._constant_labels = ""
+
+    def set_constant_labels(self, **labels):
+        """Labels added to every sample, e.g. ``worker`` under gunicorn where
+        each worker process keeps its own registry."""
+        self._constant_labels = _format_labels(tuple(labels), tuple(labels.values()))[1:-1]
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable,
+        labelnames: Sequence[str] = (),
+    ) -> CallbackGauge:
+        # Повторная регистрация (новый create_app) заменяет старый колбэк
+        self.unregister(name)
+        return self.register(CallbackGauge(name, documentation, callback, labelnames))
+
+    def register_stats(self, name: str, documentation: str, stats: Callable[[], Dict]):
+        """Export the numeric fields of a component's ``stats()`` dict.
+
+        Every field becomes a sample of gauge ``name`` labelled ``stat``.
+        """
+
+        def collect():
+            return {
+                key: value
+                for key, value in stats().items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            }
+
+        return self.gauge_callback(name, documentation, collect, ("stat",))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        constant = self._constant_labels
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            samples = metric.collect()
+            if constant:
+                samples = [_add_labels(sample, constant) for sample in samples]
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр процесса и метрики горячих путей
+registry = MetricsRegistry()
+
+WEBHOOK_LATENCY = registry.histogram(
+    "om11tg_webhook_duration_seconds",
+    "Time spent in the /webhook/<token> handler.",
+    ("status",),
+)
+AGENT_LATENCY = registry.histogram(
+    "om11tg_agent_request_duration_seconds",
+    "Duration of requests to the OM11 agent.",
+    ("mode", "outcome"),
+)
+TELEGRAM_LATENCY = registry.histogram(
+    "om11tg_telegram_request_duration_seconds",
+    "Duration of Bot API calls per method (one observation per attempt).",
+    ("method", "outcome"),
+)
+SESSION_LOOKUP_LATENCY = registry.histogram(
+    "om11tg_session_lookup_duration_seconds",
+    "Duration of session lookups by result (hit, miss, negative_hit).",
+    ("result",),
+)
+CONFIG_LOAD_LATENCY = registry.histogram(
+    "om11tg_config_load_duration_seconds",
+    "Duration of user config loads by result (hit, miss, not_found).",
+    ("result",),
+)
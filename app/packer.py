@@ -0,0 +1,180 @@
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+FENCE = "```"
+
+# Приоритеты точек разреза: чем меньше, тем лучше
+CODE_BLOCK, PARAGRAPH, LINE, SENTENCE, WORD = range(5)
+_SENTENCE_END = re.compile(r"[.!?…](?=\s)")
+_WORD_END = re.compile(r" +")
+
+
+class MessagePacker:
+    """Packs agent output chunks into as few Telegram messages as possible.
+
+    Consecutive chunks are joined with ``separator`` while they fit into
+    ``limit`` characters; a chunk longer than ``limit`` is split, preferably
+    between code blocks, then on paragraphs, lines, sentences and words. A
+    code block cut in two is closed and reopened so both parts render.
+
+    Per-bot overrides come from the ``message_packing`` entry of the user
+    config (see ``with_options``).
+
+    Args:
+        limit: Max characters per message (Telegram allows 4096)
+        merge: Join small chunks; with False only oversized ones are split
+        separator: Text placed between merged chunks
+    """
+
+    def __init__(
+        self,
+        limit: int = TELEGRAM_MESSAGE_LIMIT,
+        merge: bool = True,
+        separator: str = "\n\n",
+    ):
+        if not 0 < limit <= TELEGRAM_MESSAGE_LIMIT:
+            raise ValueError(f"Message limit must be 1..{TELEGRAM_MESSAGE_LIMIT}")
+        self.limit = limit
+        self.merge = merge
+        self.separator = separator
+
+    def with_options(self, options: Optional[Dict]) -> "MessagePacker":
+        """Packer with ``limit``/``merge``/``separator`` from ``options`` on
+        top of this one's settings; unknown or invalid values are ignored."""
+        if not isinstance(options, dict):
+            return self
+        limit = options.get("limit", self.limit)
+        if (
+            isinstance(limit, bool)
+            or not isinstance(limit, int)
+            or not 0 < limit <= TELEGRAM_MESSAGE_LIMIT
+        ):
+            limit = self.limit
+        merge = options.get("merge", self.merge)
+        separator = options.get("separator", self.separator)
+        return MessagePacker(
+            limit=limit,
+            merge=merge if isinstance(merge, bool) else self.merge,
+            separator=separator if isinstance(separator, str) else self.separator,
+        )
+
+    def pack(self, chunks: Iterable[str]) -> List[str]:
+        """Messages to send for ``chunks``, in order; empty chunks are dropped."""
+        messages: List[str] = []
+        current = ""
+        for part in self.split_all(chunks):
+            if (
+                self.merge
+                and current
+                and len(current) + len(self.separator) + len(part) <= self.limit
+            ):
+                current = f"{current}{self.separator}{part}"
+                continue
+            if current:
+                messages.append(current)
+            current = part
+        if current:
+            messages.append(current)
+        return messages
+
+    def split_all(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Split every chunk to fit the limit, lazily (for streamed output)."""
+        for chunk in chunks:
+            yield from self.split(chunk)
+
+    def split(self, text: str) -> List[str]:
+        """Split ``text`` into parts of at most ``limit`` characters."""
+        if not text or not text.strip():
+            return []
+        parts = []
+        # Место под закрывающую ``` части, разрезанной внутри блока кода
+        budget = max(1, self.limit - len(FENCE) - 1)
+        # При совсем малом лимите закрывающая ``` не помещается
+        repair_fences = self.limit > len(FENCE) + 1
+        while len(text) > self.limit:
+            cut = self._find_cut(text, budget)
+            head, tail = text[:cut].rstrip(), text[cut:]
+            open_fence = _open_fence(head) if repair_fences else None
+            if open_fence is not None:
+                # Отступы внутри кода сохраняем
+                head = f"{head}\n{FENCE}"
+                tail = tail.lstrip("\n")
+                tail = f"{open_fence}\n{tail}"
+                if len(tail) >= len(text):
+                    # Строка ограждения длиннее бюджета: без ремонта, зато
+                    # текст гарантированно укорачивается
+                    head, tail = text[:cut], text[cut:]
+            else:
+                tail = tail.lstrip()
+            if head.strip():
+                parts.append(head)
+            text = tail
+        if text.strip():
+            parts.append(text)
+        return parts
+
+    @staticmethod
+    def _find_cut(text: str, budget: int) -> int:
+        """Best cut position up to ``budget``: prefer cuts that fill at least
+        half a message, then the better boundary kind, then the later one."""
+        best: Optional[Tuple[bool, int, int]] = None
+        for kind, position in _boundaries(text, budget):
+            if not 0 < position <= budget:
+                continue
+            key = (position > budget // 2, -kind, position)
+            if best is None or key > best:
+                best = key
+        return best[2] if best is not None else budget
+
+
+def _is_fence(line: str) -> bool:
+    return line.lstrip().startswith(FENCE)
+
+
+def _boundaries(text: str, budget: int) -> Iterator[Tuple[int, int]]:
+    """Yield ``(kind, position)`` cut points in ``text`` up to ``budget``.
+
+    No cut is offered right after an opening fence: that part would hold
+    only the fence, and the rest would start with the same fence again.
+    """
+    in_code = False
+    after_open_fence = False
+    position = 0
+    for line in text.splitlines(keepends=True):
+        if position > budget:
+            return
+        fence = _is_fence(line)
+        if fence and not in_code:
+            yield CODE_BLOCK, position
+        elif not in_code and not line.strip():
+            yield PARAGRAPH, position
+        elif not after_open_fence:
+            yield LINE, position
+        after_open_fence = fence and not in_code
+        if not in_code and not fence:
+            for match in _SENTENCE_END.finditer(line):
+                yield SENTENCE, position + match.end()
+            for match in _WORD_END.finditer(line):
+                yield WORD, position + match.end()
+        if fence:
+            in_code = not in_code
+        position += len(line)
+        if fence and not in_code:
+            yield CODE_BLOCK, position
+
+
+def _open_fence(text: str) -> Optional[str]:
+    """Opening fence line (with its language) if ``text`` ends inside a code block."""
+    open_fence = None
+    for line in text.splitlines():
+        if _is_fence(line):
+            open_fence = None if open_fence is not None else line.strip()
+    return open_fence
+
+
+def packer_for_bot(config_manager, bot_token: str, default: MessagePacker) -> MessagePacker:
+    """``default`` with the ``message_packing`` overrides of the bot's config."""
+    user_id = config_manager.get_uuid_by_bot_token(bot_token)
+    config = config_manager.load_config(user_id) if user_id else None
+    return default.with_options((config or {}).get("message_packing"))
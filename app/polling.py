@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+import aiohttp
+
+from app.telegram_client import ALLOWED_UPDATES, BOT_API_URL
+
+
+class LongPollingIngress:
+    """Receives updates for many bots via ``getUpdates`` on one event loop.
+
+    Every registered bot token gets a polling coroutine, so thousands of bots
+    share a single thread. Updates are handed to ``dispatch(update, token)``,
+    the same entry point the webhook route uses; it runs in a worker thread
+    because it may block (e.g. the Redis deduplicator). The token set is
+    re-read from the config manager every ``refresh_interval`` seconds.
+
+    Args:
+        logger: Logger instance
+        config_manager: Source of bot tokens
+        dispatch: Callable taking ``(update, bot_token)``; returns False when
+            the update could not be queued and should be fetched again later
+        api_url: Bot API base URL, the token is appended to it
+        poll_timeout: ``getUpdates`` long-poll timeout in seconds
+        refresh_interval: How often the token list is re-read
+        max_connections: Max open connections to the Bot API
+        min_backoff: First delay after an error or a webhook conflict
+        max_backoff: Upper bound of the doubling delay
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        config_manager,
+        dispatch: Callable[[Dict, str], bool],
+        api_url: str = BOT_API_URL,
+        poll_timeout: int = 30,
+        refresh_interval: float = 60.0,
+        max_connections: int = 1000,
+        min_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        self.logger = logger
+        self.config_manager = config_manager
+        self.dispatch = dispatch
+        self.api_url = api_url
+        self.poll_timeout = poll_timeout
+        self.refresh_interval = refresh_interval
+        self.max_connections = max_connections
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.offsets: Dict[str, int] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+
+    async def _call(self, session: aiohttp.ClientSession, token: str, method: str, **params):
+        async with session.post(f"{self.api_url}{token}/{method}", json=params) as response:
+            return response.status, await response.json(content_type=None)
+
+    async def _poll_bot(self, session: aiohttp.ClientSession, token: str):
+        backoff = self.min_backoff
+        webhook_deleted = False
+
+        while True:
+            try:
+                if not webhook_deleted:
+                    # getUpdates не работает, пока у бота установлен вебхук
+                    status, data = await self._call(session, token, "deleteWebhook")
+                    if not data.get("ok"):
+                        raise RuntimeError(
+                            f"deleteWebhook failed ({status}): {data.get('description')}"
+                        )
+                    webhook_deleted = True
+
+                status, data = await self._call(
+                    session,
+                    token,
+                    "getUpdates",
+                    offset=self.offsets.get(token),
+                    timeout=self.poll_timeout,
+                    allowed_updates=ALLOWED_UPDATES,
+                )
+                if status == 409:
+                    # Кто-то снова поставил вебхук или опрашивает тем же токеном
+                    self.logger.warning("Webhook conflict for bot %s, deleting webhook", token)
+                    webhook_deleted = False
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                if not data.get("ok"):
+                    retry_after = (data.get("parameters") or {}).get("retry_after")
+                    if retry_after:
+                        self.logger.warning(
+                            "getUpdates rate limited for bot %s, retry after %ss",
+                            token,
+                            retry_after,
+                        )
+                        await asyncio.sleep(float(retry_after))
+                        continue
+                    raise RuntimeError(
+                        f"getUpdates failed ({status}): {data.get('description')}"
+                    )
+
+                for update in data.get("result", []):
+                    if update.get("message") and not await asyncio.to_thread(
+                        self.dispatch, update, token
+                    ):
+                        # Очередь переполнена: не сдвигаем offset, заберём позже
+                        self.logger.warning("Dispatch queue full for bot %s", token)
+                        await asyncio.sleep(self.min_backoff)
+                        break
+                    self.offsets[token] = update["update_id"] + 1
+                backoff = self.min_backoff
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("Polling error for bot %s: %s", token, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _sync_tasks(self, session: aiohttp.ClientSession, tokens):
+        tokens = set(tokens)
+        for token, task in list(self._tasks.items()):
+            if token not in tokens:
+                self._tasks.pop(token).cancel()
+            elif task.done():
+                # Задача упала — перезапускаем её ниже
+                self._tasks.pop(token)
+                if not task.cancelled() and task.exception() is not None:
+                    self.logger.error(
+                        "Polling task for bot %s died: %r", token, task.exception()
+                    )
+        for token in tokens - set(self._tasks):
+            self._tasks[token] = asyncio.create_task(self._poll_bot(session, token))
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        timeout = aiohttp.ClientTimeout(total=self.poll_timeout + 15)
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            try:
+                while not self._stop_event.is_set():
+                    tokens = await asyncio.to_thread(self.config_manager.get_bot_tokens)
+                    self._sync_tasks(session, tokens)
+                    self.logger.info("Long polling %s bots", len(self._tasks))
+                    try:
+                        await asyncio.wait_for(
+                            self._stop_event.wait(), timeout=self.refresh_interval
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                for task in self._tasks.values():
+                    task.cancel()
+                await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+                self._tasks.clear()
+
+    def start(self) -> threading.Thread:
+        """Run the event loop in a background daemon thread."""
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(self.run(),), name="long-polling", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread:
+            self._thread.join(timeout)
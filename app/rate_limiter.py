@@ -0,0 +1,344 @@
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+
+import requests
+
+from app.telegram_client import TelegramClient, TelegramResponse
+
+# Методы, которые отправляют сообщения в чат и попадают под лимиты Telegram
+PACED_METHODS = frozenset(
+    {
+        "sendMessage",
+        "editMessageText",
+        "sendPhoto",
+        "sendDocument",
+        "sendAudio",
+        "sendVideo",
+        "sendMediaGroup",
+        "forwardMessage",
+        "copyMessage",
+    }
+)
+
+
+def rejected_response(wait: float) -> TelegramResponse:
+    """Bot API style 429 for a send the limiter refused to queue."""
+    retry_after = max(1, int(wait + 0.999))
+    body = {
+        "ok": False,
+        "error_code": 429,
+        "description": f"Too Many Requests: send queue is {wait:.1f}s long",
+        "parameters": {"retry_after": retry_after},
+    }
+    return TelegramResponse(
+        429, {"Content-Type": "application/json", "Retry-After": str(retry_after)}, body
+    )
+
+
+class TokenBucket:
+    """Token bucket kept as a theoretical arrival time (GCRA).
+
+    A bucket never rejects: ``book`` takes the next free slot, so concurrent
+    callers are queued in order and each learns when it may send.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.interval = 1.0 / rate
+        self.tolerance = (capacity - 1) * self.interval
+        self.tat = 0.0
+        self.blocked_until = 0.0
+
+    def earliest(self, now: float) -> float:
+        return max(now, self.tat - self.tolerance, self.blocked_until)
+
+    def book(self, send_at: float):
+        self.tat = max(self.tat, send_at) + self.interval
+
+    def idle(self, now: float) -> bool:
+        return self.tat <= now and self.blocked_until <= now
+
+
+class SlotCalendar:
+    """Bot-wide limit kept as a calendar of booked send slots.
+
+    Unlike a single arrival time, a send booked ahead for a busy chat takes
+    only its own slot: other chats of the bot still get the free slots
+    before it. Slots up to ``capacity - 1`` intervals old that went unused
+    may be taken now, which allows the same bursts as ``TokenBucket``.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.interval = 1.0 / rate
+        self.tolerance = (capacity - 1) * self.interval
+        self.booked = set()
+        self.blocked_until = 0.0
+
+    def slot(self, not_before: float) -> Tuple[int, float]:
+        """First free slot for a send not before ``not_before``; (index, send time)."""
+        start = max(not_before, self.blocked_until)
+        index = math.ceil((start - self.tolerance) / self.interval)
+        while index in self.booked:
+            index += 1
+        return index, max(start, index * self.interval)
+
+    def book(self, index: int):
+        self.booked.add(index)
+
+    def forget(self, now: float):
+        oldest = math.ceil((now - self.tolerance) / self.interval)
+        self.booked = {index for index in self.booked if index >= oldest}
+
+    def idle(self, now: float) -> bool:
+        self.forget(now)
+        return not self.booked and self.blocked_until <= now
+
+
+class RateLimitedTelegramClient(TelegramClient):
+    """TelegramClient that paces sends to stay within Telegram's limits.
+
+    Every message-sending call reserves a token from the bot's bucket and from
+    the target chat's bucket (a slower one for groups) and sleeps until both
+    allow it. A ``429`` response blocks the bot's and the chat's buckets for
+    ``retry_after`` seconds and the call is retried up to ``max_retries``
+    times.
+
+    A call never waits longer than ``max_wait``: if the next free slot is
+    further away (a burst to one chat) nothing is booked and a ``429``
+    response is returned at once, so callers' threads are not tied up.
+
+    Args:
+        bot_rate: Messages per second per bot token
+        chat_rate: Messages per second per private chat
+        group_rate: Messages per second per group chat (negative chat id)
+        chat_burst: Bucket capacity for chats and groups
+        max_retries: Retries after ``429 Too Many Requests``
+        max_wait: Max seconds a call may wait for its slot (None: no limit)
+    """
+
+    def __init__(
+        self,
+        *args,
+        bot_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_wait: Optional[float] = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.bot_rate = bot_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+
+        self._buckets: Dict[Hashable, Any] = {}
+        self._bucket_lock = threading.Lock()
+        self._reservations = 0
+
+        self.waiting = 0
+        self.paced_calls = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self.total_queue_time = 0.0
+        self.max_queue_time = 0.0
+
+    def _bot_bucket(self, bot_token: str) -> SlotCalendar:
+        bucket = self._buckets.get(bot_token)
+        if bucket is None:
+            bucket = self._buckets[bot_token] = SlotCalendar(self.bot_rate, self.bot_rate)
+        return bucket
+
+    def _chat_bucket(self, bot_token: str, chat_id) -> TokenBucket:
+        key = (bot_token, str(chat_id))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            is_group = str(chat_id).startswith("-")
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._buckets[key] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def reserve(self, bot_token: str, chat_id) -> float:
+        """Book the next send slot for a chat; returns seconds to wait.
+
+        The chat's bucket gives the earliest moment for this chat; the bot's
+        calendar then gives its first free slot not before it, so a backlog
+        in one chat does not delay the bot's other chats.
+
+        If the wait would exceed ``max_wait`` nothing is booked and the
+        wait is returned anyway; check it with ``over_limit``.
+        Public so AsyncTelegramClient can pace through the same buckets.
+        """
+        with self._bucket_lock:
+            now = self._clock()
+            calendar = self._bot_bucket(bot_token)
+            chat = None if chat_id is None else self._chat_bucket(bot_token, chat_id)
+
+            # Слот бота ищем не раньше слота чата, чужая очередь его не сдвигает
+            not_before = now if chat is None else chat.earliest(now)
+            index, send_at = calendar.slot(not_before)
+            if self.over_limit(send_at - now):
+                self.rejected += 1
+                return send_at - now
+            calendar.book(index)
+            if chat is not None:
+                chat.book(send_at)
+
+            self._reservations += 1
+            if self._reservations % 1000 == 0:
+                self._prune(now)
+        return send_at - now
+
+    def over_limit(self, wait: float) -> bool:
+        return self.max_wait is not None and wait > self.max_wait
+
+    def _prune(self, now: float):
+        for key in [k for k, b in self._buckets.items() if b.idle(now)]:
+            del self._buckets[key]
+
+    def block(self, bot_token: str, chat_id, retry_after: float):
+        # retry_after в 429 относится ко всему боту, а не только к чату
+        with self._bucket_lock:
+            now = self._clock()
+            buckets = [self._bot_bucket(bot_token)]
+            if chat_id is not None:
+                buckets.append(self._chat_bucket(bot_token, chat_id))
+            for bucket in buckets:
+                bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+
+    @staticmethod
+    def retry_after(response) -> float:
+        """Seconds from a 429 body's ``parameters.retry_after`` or the header."""
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        parameters = data.get("parameters") if isinstance(data, dict) else None
+        if isinstance(parameters, dict) and "retry_after" in parameters:
+            try:
+                return float(parameters["retry_after"])
+            except (TypeError, ValueError):
+                pass
+        try:
+            return float(response.headers.get("Retry-After", 1))
+        except (TypeError, ValueError):
+            return 1.0
+
+    def admit(
+        self, bot_token: str, chat_id, method: str
+    ) -> Tuple[float, Optional[TelegramResponse]]:
+        """Reserve a slot for a paced send.
+
+        Returns ``(wait, rejected)``: seconds to sleep before sending, or a
+        ``rejected_response`` to return instead when the queue is longer than
+        ``max_wait``, without calling Telegram.
+        """
+        wait = self.reserve(bot_token, chat_id)
+        if not self.over_limit(wait):
+            return wait, None
+        self.logger.warning(
+            "Send queue for chat %s is %.1fs long, dropping %s", chat_id, wait, method
+        )
+        return wait, rejected_response(wait)
+
+    def retry_delay(
+        self, response, bot_token: str, chat_id, method: str, paced: bool, attempt: int
+    ) -> Optional[float]:
+        """Handle a ``429`` answer; seconds to sleep before retrying, or None.
+
+        Blocks the buckets for ``retry_after``. Paced sends need no sleep of
+        their own: the next ``reserve`` waits out the block.
+        """
+        retry_after = self.retry_after(response)
+        self.record_rate_limit(method, chat_id, retry_after)
+        self.block(bot_token, chat_id, retry_after)
+        if attempt >= self.max_retries or self.over_limit(retry_after):
+            return None
+        return 0.0 if paced else retry_after
+
+    def request(
+        self,
+        bot_token: str,
+        method: str,
+        http_method: str = "POST",
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Union[requests.Response, TelegramResponse]:
+        paced = method in PACED_METHODS
+        chat_id = (json or params or {}).get("chat_id")
+
+        for attempt in range(self.max_retries + 1):
+            if paced:
+                enqueued = self._clock()
+                wait, rejected = self.admit(bot_token, chat_id, method)
+                if rejected is not None:
+                    return rejected
+                if wait > 0:
+                    self.add_waiting(1)
+                    try:
+                        self._sleep(wait)
+                    finally:
+                        self.add_waiting(-1)
+                self.record_queue_time(self._clock() - enqueued)
+
+            response = super().request(
+                bot_token,
+                method,
+                http_method=http_method,
+                params=params,
+                json=json,
+                timeout=timeout,
+            )
+            if response.status_code != 429:
+                return response
+
+            delay = self.retry_delay(response, bot_token, chat_id, method, paced, attempt)
+            if delay is None:
+                break
+            if delay > 0:
+                self._sleep(delay)
+
+        return response
+
+    def record_rate_limit(self, method: str, chat_id, retry_after: float):
+        with self._bucket_lock:
+            self.rate_limited += 1
+        self.logger.warning(
+            "Telegram rate limit hit on %s (chat %s), retry after %ss",
+            method,
+            chat_id,
+            retry_after,
+        )
+
+    def add_waiting(self, delta: int):
+        with self._bucket_lock:
+            self.waiting += delta
+
+    def record_queue_time(self, queued: float):
+        with self._bucket_lock:
+            self.paced_calls += 1
+            self.total_queue_time += queued
+            self.max_queue_time = max(self.max_queue_time, queued)
+
+    def scheduler_stats(self) -> Dict[str, Any]:
+        with self._bucket_lock:
+            return {
+                "paced_calls": self.paced_calls,
+                "waiting": self.waiting,
+                "rate_limited": self.rate_limited,
+                "rejected": self.rejected,
+                "buckets": len(self._buckets),
+                "avg_queue_time": self.total_queue_time / self.paced_calls
+                if self.paced_calls
+                else 0.0,
+                "max_queue_time": self.max_queue_time,
+            }
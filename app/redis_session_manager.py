@@ -1,33 +1,150 @@
 import json
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.utils import is_session_expired
+
+# Обновляет last_active и продлевает TTL только у существующей сессии,
+# за один round-trip и атомарно
+TOUCH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'last_active', ARGV[1])
+if tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
 
 
 class TelegramSessionManager:
-    def __init__(self, redis_client):
+    """Sessions stored as Redis hashes under ``<key_prefix><tg_id>``.
+
+    Each hash holds ``user_uuid`` and ``last_active``. With ``ttl`` set,
+    sessions idle for longer are treated as absent by ``get_user``; the key
+    itself expires server-side ``expired_retention`` seconds later (every
+    ``update_last_active`` extends it), so idle sessions disappear without
+    a sweeper but ``is_expired`` can still tell them from missing ones.
+
+    Sessions written by older versions as a JSON string under the bare
+    ``tg_id`` key are migrated to the hash layout on first read.
+
+    Args:
+        redis_client: ``redis.Redis`` instance
+        key_prefix: Namespace for session keys
+        ttl: Session lifetime in seconds after the last activity (0 disables)
+        expired_retention: Seconds an expired session is kept before Redis
+            deletes the key
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        key_prefix: str = "om11tg:session:",
+        ttl: int = 0,
+        expired_retention: int = 0,
+    ):
         # Подключение к Redis
         self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.ttl = int(ttl or 0)
+        # Время жизни ключа в Redis: сессия плюс срок хранения истёкшей
+        self.key_ttl = self.ttl + int(expired_retention or 0) if self.ttl else 0
+        self._touch = redis_client.register_script(TOUCH_SCRIPT)
+
+    def _key(self, tg_id) -> str:
+        return f"{self.key_prefix}{tg_id}"
+
+    @staticmethod
+    def _decode(user_data: Dict) -> Optional[Dict]:
+        if not user_data:
+            return None
+        return {
+            (k.decode() if isinstance(k, bytes) else k): (
+                v.decode() if isinstance(v, bytes) else v
+            )
+            for k, v in user_data.items()
+        }
+
+    def _queue_add(self, pipe, tg_id, user_uuid):
+        key = self._key(tg_id)
+        pipe.hset(
+            key,
+            mapping={"user_uuid": user_uuid, "last_active": datetime.now().isoformat()},
+        )
+        if self.key_ttl:
+            pipe.expire(key, self.key_ttl)
 
     def add_user(self, tg_id, user_uuid):
-        # Создаем состояние пользователя
-        user_data = {"user_uuid": user_uuid, "last_active": datetime.now().isoformat()}
+        pipe = self.redis_client.pipeline()
+        self._queue_add(pipe, tg_id, user_uuid)
+        pipe.execute()
 
-        # Сохраняем данные в Redis как JSON
-        self.redis_client.set(tg_id, json.dumps(user_data))
+    def add_users(self, users: Iterable[Tuple]):
+        """Store many ``(tg_id, user_uuid)`` pairs in one round-trip."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for tg_id, user_uuid in users:
+            self._queue_add(pipe, tg_id, user_uuid)
+        pipe.execute()
 
-    def get_user(self, tg_id):
-        # Получаем данные пользователя из Redis
-        user_data = self.redis_client.get(tg_id)
+    def _load(self, tg_id) -> Optional[Dict]:
+        user_data = self._decode(self.redis_client.hgetall(self._key(tg_id)))
         if user_data:
-            return json.loads(user_data)
-        return None
+            return user_data
+        return self._migrate_legacy(tg_id)
+
+    def get_user(self, tg_id):
+        user_data = self._load(tg_id)
+        if is_session_expired(user_data, self.ttl):
+            return None
+        return user_data
+
+    def is_expired(self, tg_id) -> bool:
+        """True if ``tg_id`` has a session that expired and is still kept."""
+        return is_session_expired(self._load(tg_id), self.ttl)
+
+    def get_users(self, tg_ids: Iterable) -> Dict[str, Optional[Dict]]:
+        """Fetch many sessions in one round-trip; missing ones map to None."""
+        tg_ids: List = list(tg_ids)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for tg_id in tg_ids:
+            pipe.hgetall(self._key(tg_id))
+        users = {}
+        for tg_id, user_data in zip(tg_ids, pipe.execute()):
+            user_data = self._decode(user_data)
+            users[str(tg_id)] = (
+                None if is_session_expired(user_data, self.ttl) else user_data
+            )
+        return users
+
+    def _migrate_legacy(self, tg_id):
+        # Старый формат: JSON-строка под ключом tg_id без префикса
+        legacy = self.redis_client.get(str(tg_id))
+        if not legacy:
+            return None
+        try:
+            user_data = json.loads(legacy)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(user_data, dict) or not user_data.get("user_uuid"):
+            return None
+
+        key = self._key(tg_id)
+        pipe = self.redis_client.pipeline()
+        pipe.hset(key, mapping=user_data)
+        if self.key_ttl:
+            pipe.expire(key, self.key_ttl)
+        pipe.delete(str(tg_id))
+        pipe.execute()
+        return user_data
 
     def update_last_active(self, tg_id):
         # Обновляем дату последней активности
-        user_data = self.get_user(tg_id)
-        if user_data:
-            user_data["last_active"] = datetime.now().isoformat()
-            self.redis_client.set(tg_id, json.dumps(user_data))
+        self._touch(
+            keys=[self._key(tg_id)], args=[datetime.now().isoformat(), self.key_ttl]
+        )
 
     def delete_user(self, tg_id):
         # Удаляем пользователя из Redis
-        self.redis_client.delete(tg_id)
+        self.redis_client.delete(self._key(tg_id), str(tg_id))
@@ -0,0 +1,180 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Числовые коды состояний для метрик
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Stops calling a backend after repeated failures.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    ``allow`` returns False for ``reset_timeout`` seconds. Then one probe
+    call is let through (half-open): success closes the breaker, failure
+    opens it again.
+
+    Args:
+        failure_threshold: Consecutive failures that open the breaker
+        reset_timeout: Seconds to stay open before probing
+        clock: Monotonic time source, replaceable for tests
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self.opened_total = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            # Пробный вызов, который так и не отчитался, не блокирует навсегда
+            if state == HALF_OPEN and (
+                not self._probing
+                or self._clock() - self._probe_started >= self.reset_timeout
+            ):
+                self._probing = True
+                self._probe_started = self._clock()
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """End a call that proves neither health nor failure (e.g. a 4xx).
+
+        A half-open breaker lets the next call probe instead of waiting
+        for the stale probe to time out.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened_total += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": STATE_CODES[state],
+                "consecutive_failures": self._failures,
+                "opened_total": self.opened_total,
+                "rejected": self.rejected,
+            }
+
+
+class AdaptiveTimeout:
+    """Slow-call threshold derived from observed latency.
+
+    Keeps an EWMA of the latency and of its deviation (as TCP does for RTO)
+    and suggests ``average + k * deviation``, clamped to
+    ``[min_timeout, max_timeout]``. Until ``warmup`` samples are seen the
+    maximum is used.
+
+    Agent runs vary a lot, so calls are not cut to this value: reads wait up
+    to ``max_timeout``. A call slower than the threshold is counted as slow,
+    and a timeout shorter than it (the deadline budget was nearly spent) is
+    not blamed on the backend.
+
+    Args:
+        min_timeout: Lower bound in seconds
+        max_timeout: Upper bound in seconds, also the read timeout
+        alpha: EWMA weight of a new latency sample
+        beta: EWMA weight of a new deviation sample
+        k: Deviations added on top of the average
+        warmup: Samples needed before the threshold adapts
+    """
+
+    def __init__(
+        self,
+        min_timeout: float = 5.0,
+        max_timeout: float = 120.0,
+        alpha: float = 0.125,
+        beta: float = 0.25,
+        k: float = 4.0,
+        warmup: int = 5,
+    ):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+        self.warmup = warmup
+        self._lock = threading.Lock()
+        self._average: Optional[float] = None
+        self._deviation = 0.0
+        self.samples = 0
+        self.slow = 0
+
+    def observe(self, latency: float):
+        with self._lock:
+            if latency > self._threshold():
+                self.slow += 1
+            self.samples += 1
+            if self._average is None:
+                self._average = latency
+                self._deviation = latency / 2
+                return
+            self._deviation += self.beta * (abs(latency - self._average) - self._deviation)
+            self._average += self.alpha * (latency - self._average)
+
+    def _threshold(self) -> float:
+        if self._average is None or self.samples < self.warmup:
+            return self.max_timeout
+        suggested = self._average + self.k * self._deviation
+        return min(self.max_timeout, max(self.min_timeout, suggested))
+
+    def current(self) -> float:
+        with self._lock:
+            return self._threshold()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "latency_ewma": self._average or 0.0,
+                "slow_threshold": self._threshold(),
+                "slow_calls": self.slow,
+            }
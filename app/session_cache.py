@@ -0,0 +1,111 @@
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.cache import TTLCache
+from app.metrics import SESSION_LOOKUP_LATENCY
+from app.utils import is_session_expired
+
+# Маркер «пользователь не авторизован» для негативного кэширования
+_NOT_FOUND = object()
+_MISSING = object()
+
+
+class CachedSessionManager:
+    """In-process LRU (L1) in front of a SQLite or Redis session manager (L2).
+
+    Lookups are served from memory for ``ttl`` seconds; unknown Telegram ids
+    are remembered for ``negative_ttl`` seconds so unauthenticated users do
+    not hit the backend on every message; ``is_expired`` answers are cached
+    for ``negative_ttl`` too. Writes go to the backend first and
+    then update the cache. Other processes sharing the backend may see a
+    change only after the entry expires.
+
+    Args:
+        backend: Object with ``add_user``, ``get_user``,
+            ``update_last_active`` and ``delete_user``
+        maxsize: Max cached Telegram ids
+        ttl: Lifetime of a cached session in seconds
+        negative_ttl: Lifetime of a cached "no session" answer in seconds
+        session_ttl: Session lifetime after the last activity, also checked
+            on cache hits (0 disables)
+    """
+
+    def __init__(
+        self,
+        backend,
+        maxsize: int = 10000,
+        ttl: float = 60.0,
+        negative_ttl: float = 5.0,
+        session_ttl: int = 0,
+    ):
+        self.backend = backend
+        self.negative_ttl = negative_ttl
+        self.session_ttl = session_ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._expired = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self.negative_hits = 0
+
+    def __getattr__(self, name):
+        # flush, close и прочие методы бэкенда доступны напрямую
+        return getattr(self.backend, name)
+
+    def add_user(self, tg_id, user_uuid):
+        self.backend.add_user(tg_id, user_uuid)
+        self._expired.invalidate(str(tg_id))
+        self._cache.set(
+            str(tg_id),
+            {"user_uuid": user_uuid, "last_active": datetime.now().isoformat()},
+        )
+
+    def get_user(self, tg_id) -> Optional[Dict]:
+        started = time.perf_counter()
+        key = str(tg_id)
+        cached = self._cache.get(key, _MISSING)
+        if cached is _NOT_FOUND:
+            self.negative_hits += 1
+            SESSION_LOOKUP_LATENCY.observe(time.perf_counter() - started, "negative_hit")
+            return None
+        if cached is not _MISSING:
+            if not is_session_expired(cached, self.session_ttl):
+                SESSION_LOOKUP_LATENCY.observe(time.perf_counter() - started, "hit")
+                return dict(cached)
+            self._cache.invalidate(key)
+
+        user_data = self.backend.get_user(tg_id)
+        SESSION_LOOKUP_LATENCY.observe(time.perf_counter() - started, "miss")
+        if user_data is None:
+            self._cache.set(key, _NOT_FOUND, ttl=self.negative_ttl)
+            return None
+        self._cache.set(key, user_data)
+        return dict(user_data)
+
+    def is_expired(self, tg_id) -> bool:
+        """True if ``tg_id`` had a session that expired (as opposed to none)."""
+        key = str(tg_id)
+        expired = self._expired.get(key, _MISSING)
+        if expired is _MISSING:
+            expired = bool(self.backend.is_expired(tg_id))
+            self._expired.set(key, expired)
+        return expired
+
+    def update_last_active(self, tg_id):
+        self.backend.update_last_active(tg_id)
+        key = str(tg_id)
+        cached = self._cache.peek(key, _MISSING)
+        if isinstance(cached, dict):
+            self._cache.replace(
+                key, dict(cached, last_active=datetime.now().isoformat())
+            )
+
+    def delete_user(self, tg_id):
+        self.backend.delete_user(tg_id)
+        self._cache.set(str(tg_id), _NOT_FOUND, ttl=self.negative_ttl)
+        self._expired.invalidate(str(tg_id))
+
+    def invalidate(self, tg_id):
+        self._cache.invalidate(str(tg_id))
+        self._expired.invalidate(str(tg_id))
+
+    def stats(self) -> Dict:
+        return dict(self._cache.stats(), negative_hits=self.negative_hits)
@@ -0,0 +1,79 @@
+import logging
+import sqlite3
+import threading
+from typing import Optional
+
+
+class SessionSweeper:
+    """Background thread that deletes expired SQLite sessions.
+
+    Every ``interval`` seconds buffered ``last_active`` writes are flushed,
+    expired rows are deleted in ``batch_size`` transactions with a short
+    pause between them so request writes are not blocked, and freed pages
+    are returned with an incremental vacuum.
+
+    Args:
+        logger: Logger instance
+        session_manager: ``SQLiteSessionManager`` with ``session_ttl`` set
+        interval: Seconds between sweeps
+        batch_size: Max rows deleted per transaction
+        batch_pause: Pause between batches in seconds
+        vacuum_pages: Max pages released per sweep
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        session_manager,
+        interval: float = 60.0,
+        batch_size: int = 500,
+        batch_pause: float = 0.05,
+        vacuum_pages: int = 200,
+    ):
+        self.logger = logger
+        self.session_manager = session_manager
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.deleted_total = 0
+
+    def sweep(self) -> int:
+        """Run one sweep and return the number of deleted sessions."""
+        self.session_manager.flush()
+        deleted = 0
+        while not self._stop_event.is_set():
+            count = self.session_manager.delete_expired(self.batch_size)
+            deleted += count
+            if count < self.batch_size:
+                break
+            self._stop_event.wait(self.batch_pause)
+
+        if deleted:
+            self.session_manager.incremental_vacuum(self.vacuum_pages)
+            self.deleted_total += deleted
+            self.logger.info("Session sweeper removed %s expired sessions", deleted)
+        return deleted
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sweep()
+            except sqlite3.Error as e:
+                self.logger.error("Session sweep failed: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="session-sweeper", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -1,51 +1,310 @@
 import sqlite3
+import threading
+import weakref
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, Optional
+
+from app.utils import call_after_fork, is_session_expired, session_cutoff
+
+class _ThreadConnection:
+    """Owns one connection. Kept in the thread's local data, so it is
+    dropped (and the connection closed) when the thread exits."""
+
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def close(self):
+        try:
+            self.conn.close()
+        except sqlite3.Error:
+            pass
+
+    __del__ = close
+
 
 class SQLiteSessionManager:
-    def __init__(self, db_file='sessions.db'):
+    """Telegram id -> user_uuid sessions stored in SQLite.
+
+    By default a single connection is shared and guarded by a lock. With
+    ``concurrent=True`` the database runs in WAL mode, every thread gets its
+    own connection so readers never block each other, and
+    ``update_last_active`` is buffered and written in one transaction every
+    ``flush_interval`` seconds (or once ``max_pending`` updates pile up).
+
+    With ``session_ttl`` set, sessions idle for longer are treated as absent
+    by ``get_user``. They are kept for another ``expired_retention`` seconds
+    so ``is_expired`` can tell an expired session from a missing one, then
+    removed in batches by ``delete_expired``.
+
+    A thread's connection is closed when the thread exits, so thread churn
+    does not pile up file descriptors and page caches.
+
+    Safe to create before ``fork`` (gunicorn ``preload``): the child closes
+    the inherited connections and opens its own on first use.
+
+    With ``lazy_init`` the schema setup (including the one-time ``VACUUM``
+    that switches on incremental auto-vacuum) runs on first use instead of
+    in the constructor.
+    """
+
+    def __init__(
+        self,
+        db_file='sessions.db',
+        concurrent: bool = False,
+        flush_interval: float = 1.0,
+        max_pending: int = 1000,
+        session_ttl: int = 0,
+        cache_size_kb: int = 2048,
+        expired_retention: int = 0,
+        lazy_init: bool = False,
+    ):
         self.db_file = Path(db_file)
-        self.conn = sqlite3.connect(self.db_file)
-        self._init_db()
+        self.session_ttl = session_ttl
+        self.expired_retention = expired_retention
+        self.cache_size_kb = cache_size_kb
+        self.concurrent = concurrent
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._local = threading.local()
+        # Слабые ссылки: соединение живёт, пока жив его поток
+        self._connections: "weakref.WeakSet[_ThreadConnection]" = weakref.WeakSet()
+        self._conn_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        # Буфер отложенных обновлений last_active: tg_id -> timestamp
+        self._pending: Dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._stopped = False
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+        if not concurrent:
+            self._shared = self._connect()
+            self.conn = self._shared.conn
+        if not lazy_init:
+            self._init_db()
+        call_after_fork(self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Соединения родителя в потомке не используем. Закрываем их сразу,
+        # до открытия своих: закрытие дескриптора снимает fcntl-блокировки
+        # процесса на файл, а у потомка их ещё нет. Поток flusher не пережил
+        # fork, буфер last_active сбросит родитель.
+        for holder in list(self._connections):
+            holder.close()
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()
+        self._conn_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._flusher = None
+        self._schema_lock = threading.Lock()
+        if not self.concurrent:
+            self._shared = self._connect()
+            self.conn = self._shared.conn
+
+    def _connect(self) -> _ThreadConnection:
+        # Поток-владелец один, но закрыть соединение может и другой поток
+        conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        # Ограничиваем кэш страниц каждого соединения
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        if self.concurrent:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        holder = _ThreadConnection(conn)
+        with self._conn_lock:
+            self._connections.add(holder)
+        return holder
+
+    def _connection(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            self._init_db()
+        return self._thread_connection()
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        if not self.concurrent:
+            return self.conn
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._local.holder = self._connect()
+        return holder.conn
+
+    def _execute(self, sql, params=()):
+        conn = self._connection()
+        with self._write_lock:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+        return cursor
 
     def _init_db(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sessions (
-                tg_id TEXT PRIMARY KEY,
-                user_uuid TEXT NOT NULL,
-                last_active TEXT NOT NULL
-            )
-        ''')
-        self.conn.commit()
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn = self._thread_connection()
+            with self._write_lock:
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    # auto_vacuum меняется только через VACUUM, делаем это один раз
+                    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                    conn.execute('VACUUM')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        tg_id TEXT PRIMARY KEY,
+                        user_uuid TEXT NOT NULL,
+                        last_active TEXT NOT NULL
+                    )
+                ''')
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_sessions_last_active '
+                    'ON sessions (last_active)'
+                )
+                conn.commit()
+            self._schema_ready = True
 
     def add_user(self, tg_id, user_uuid):
-        cursor = self.conn.cursor()
-        cursor.execute('''
+        self._discard_pending(tg_id)
+        self._execute('''
             INSERT OR REPLACE INTO sessions (tg_id, user_uuid, last_active)
             VALUES (?, ?, ?)
         ''', (str(tg_id), user_uuid, datetime.now().isoformat()))
-        self.conn.commit()
+
+    def _load(self, tg_id) -> Optional[Dict]:
+        conn = self._connection()
+        if self.concurrent:
+            row = conn.execute(
+                'SELECT user_uuid, last_active FROM sessions WHERE tg_id = ?',
+                (str(tg_id),),
+            ).fetchone()
+        else:
+            with self._write_lock:
+                row = conn.execute(
+                    'SELECT user_uuid, last_active FROM sessions WHERE tg_id = ?',
+                    (str(tg_id),),
+                ).fetchone()
+        if not row:
+            return None
+        last_active = self._pending.get(str(tg_id), row[1])
+        return {"user_uuid": row[0], "last_active": last_active}
 
     def get_user(self, tg_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT user_uuid, last_active FROM sessions WHERE tg_id = ?', (str(tg_id),))
-        row = cursor.fetchone()
-        if row:
-            return {"user_uuid": row[0], "last_active": row[1]}
+        user_data = self._load(tg_id)
+        if user_data and not is_session_expired(user_data, self.session_ttl):
+            return user_data
         return None
 
+    def is_expired(self, tg_id) -> bool:
+        """True if ``tg_id`` has a session that expired and is not swept yet."""
+        return is_session_expired(self._load(tg_id), self.session_ttl)
+
     def update_last_active(self, tg_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            UPDATE sessions SET last_active = ? WHERE tg_id = ?
-        ''', (datetime.now().isoformat(), str(tg_id)))
-        self.conn.commit()
+        now = datetime.now().isoformat()
+        if not self.concurrent:
+            self._execute('''
+                UPDATE sessions SET last_active = ? WHERE tg_id = ?
+            ''', (now, str(tg_id)))
+            return
+
+        self._ensure_flusher()
+        with self._pending_lock:
+            self._pending[str(tg_id)] = now
+            overflow = len(self._pending) >= self.max_pending
+        if overflow:
+            self._flush_event.set()
 
     def delete_user(self, tg_id):
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM sessions WHERE tg_id = ?', (str(tg_id),))
-        self.conn.commit()
+        self._discard_pending(tg_id)
+        self._execute('DELETE FROM sessions WHERE tg_id = ?', (str(tg_id),))
+
+    def delete_expired(self, batch_size: int = 500) -> int:
+        """Delete up to ``batch_size`` sessions expired for longer than
+        ``expired_retention``; returns how many."""
+        if not self.session_ttl:
+            return 0
+        cutoff = session_cutoff(self.session_ttl + self.expired_retention)
+        cursor = self._execute('''
+            DELETE FROM sessions WHERE rowid IN (
+                SELECT rowid FROM sessions WHERE last_active < ? LIMIT ?
+            )
+        ''', (cutoff, batch_size))
+        return cursor.rowcount
+
+    def incremental_vacuum(self, pages: int = 100):
+        """Return up to ``pages`` free pages to the filesystem."""
+        conn = self._connection()
+        with self._write_lock:
+            # execute() делает только один шаг прагмы (одна страница),
+            # executescript() выполняет её до конца
+            conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+
+    def _discard_pending(self, tg_id):
+        if self._pending:
+            with self._pending_lock:
+                self._pending.pop(str(tg_id), None)
+
+    def flush(self) -> int:
+        """Write buffered last_active updates in one transaction."""
+        with self._pending_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+
+        conn = self._connection()
+        try:
+            with self._write_lock:
+                conn.executemany(
+                    'UPDATE sessions SET last_active = ? WHERE tg_id = ?',
+                    [(last_active, tg_id) for tg_id, last_active in batch.items()],
+                )
+                conn.commit()
+        except sqlite3.Error:
+            # Возвращаем пачку в буфер, не затирая более свежие значения
+            conn.rollback()
+            with self._pending_lock:
+                for tg_id, last_active in batch.items():
+                    self._pending.setdefault(tg_id, last_active)
+            raise
+        return len(batch)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None or self._stopped:
+            return
+        with self._conn_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name='session-flusher', daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Повторим на следующем тике, обновления остались в буфере
+                pass
+
+    def close(self):
+        self._stopped = True
+        self._flush_event.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        with self._conn_lock:
+            for holder in list(self._connections):
+                holder.close()
+            self._connections.clear()
 
     def __del__(self):
-        self.conn.close()
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -0,0 +1,39 @@
+import time
+from typing import Callable, List, Tuple
+
+
+class StartupProfile:
+    """Wall time of the startup steps, for ``run.py --profile-startup``.
+
+    ``mark(name)`` closes the step that began at the previous mark (or at
+    creation); ``add`` records a step timed elsewhere, e.g. module imports
+    measured before this module could be imported.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self._last = clock()
+        self.steps: List[Tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float):
+        self.steps.append((name, seconds))
+
+    def mark(self, name: str):
+        now = self._clock()
+        self.steps.append((name, now - self._last))
+        self._last = now
+
+    def total(self) -> float:
+        return sum(seconds for _, seconds in self.steps)
+
+    def report(self) -> str:
+        width = max((len(name) for name, _ in self.steps), default=0)
+        total = self.total()
+        lines = [
+            f"{name:<{width}}  {seconds * 1000:9.2f} ms  {seconds / total:6.1%}"
+            if total
+            else f"{name:<{width}}  {seconds * 1000:9.2f} ms"
+            for name, seconds in self.steps
+        ]
+        lines.append(f"{'total':<{width}}  {total * 1000:9.2f} ms")
+        return "\n".join(lines)
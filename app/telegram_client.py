@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.metrics import TELEGRAM_LATENCY
+
+BOT_API_URL = "https://api.telegram.org/bot"
+# Обрабатываем только сообщения, остальное Telegram пусть не присылает
+ALLOWED_UPDATES = ["message"]
+
+
+class TelegramResponse:
+    """Fully read Bot API response with the parts of ``requests.Response``
+    the handlers use (``status_code``, ``ok``, ``headers``, ``json()``).
+
+    Returned by ``AsyncTelegramClient`` and for sends the rate limiter
+    answers itself without calling Telegram.
+    """
+
+    __slots__ = ("status_code", "headers", "_data")
+
+    def __init__(self, status_code: int, headers, data: Any):
+        self.status_code = status_code
+        self.headers = headers
+        self._data = data
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self) -> Any:
+        if self._data is None:
+            raise ValueError("Response body is not JSON")
+        return self._data
+
+
+class CallStats:
+    """Per-method call counters shared by the sync and async Bot API clients.
+
+    Also feeds the ``TELEGRAM_LATENCY`` histogram.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, method: str, elapsed: float, error: bool):
+        TELEGRAM_LATENCY.observe(elapsed, method, "error" if error else "ok")
+        with self._lock:
+            stats = self._stats.setdefault(
+                method, {"calls": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0}
+            )
+            stats["calls"] += 1
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+            if error:
+                stats["errors"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                method: dict(
+                    values,
+                    avg_time=values["total_time"] / values["calls"]
+                    if values["calls"]
+                    else 0.0,
+                )
+                for method, values in self._stats.items()
+            }
+
+
+class TelegramClient:
+    """Shared Bot API client with a pooled keep-alive session.
+
+    Args:
+        logger: Logger instance
+        api_url: Bot API base URL, the token is appended to it
+        pool_size: Max keep-alive connections kept per host
+        timeout: Default per-call timeout in seconds
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        api_url: str = BOT_API_URL,
+        pool_size: int = 20,
+        timeout: float = 10.0,
+    ):
+        self.logger = logger
+        self.api_url = api_url
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.call_stats = CallStats()
+
+    def request(
+        self,
+        bot_token: str,
+        method: str,
+        http_method: str = "POST",
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        """Call a Bot API method and return the raw response.
+
+        Raises:
+            requests.exceptions.RequestException: On connection errors and timeouts
+        """
+        url = f"{self.api_url}{bot_token}/{method}"
+        started = time.monotonic()
+        try:
+            response = self.session.request(
+                http_method,
+                url,
+                params=params,
+                json=json,
+                timeout=timeout or self.timeout,
+            )
+        except requests.exceptions.RequestException:
+            self.call_stats.record(method, time.monotonic() - started, error=True)
+            raise
+
+        self.call_stats.record(method, time.monotonic() - started, error=not response.ok)
+        return response
+
+    def get(self, bot_token: str, method: str, **kwargs) -> requests.Response:
+        return self.request(bot_token, method, http_method="GET", **kwargs)
+
+    def post(self, bot_token: str, method: str, **kwargs) -> requests.Response:
+        return self.request(bot_token, method, http_method="POST", **kwargs)
+
+    def send_message(
+        self,
+        bot_token: str,
+        chat_id,
+        text: str,
+        parse_mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        return self.post(bot_token, "sendMessage", json=payload, timeout=timeout)
+
+    def edit_message_text(
+        self,
+        bot_token: str,
+        chat_id,
+        message_id: int,
+        text: str,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
+        return self.post(bot_token, "editMessageText", json=payload, timeout=timeout)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return self.call_stats.snapshot()
+
+    def close(self):
+        self.session.close()
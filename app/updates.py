@@ -1,8 +1,79 @@
-import requests
-from typing import List
+import time
+from typing import List, Optional, Tuple
 
+from app.manus_api import AgentUnavailableError
+from app.packer import TELEGRAM_MESSAGE_LIMIT, MessagePacker, packer_for_bot
+
+STREAM_MODES = ("off", "messages", "edit")
+AGENT_ERROR_MESSAGE = "ОШИБКА: произошла неожижаная ошибка при обращении к агенту"
+
+
+def auth_token_from(text: str) -> Optional[str]:
+    """Web token of an ``/auth <token>`` command, None if it is missing."""
+    command_parts = text.split()
+    return command_parts[1] if len(command_parts) >= 2 else None
+
+
+class StreamedReply:
+    """One reply grown via editMessageText as chunks arrive.
+
+    Holds the decisions of the ``edit`` stream mode; the handlers only make
+    the Telegram calls. Each ``(message_id, text)`` returned is an edit to
+    send. Edits are throttled to ``edit_interval``; a new message is started
+    when the text would exceed ``limit``.
+    """
+
+    def __init__(self, limit: int = TELEGRAM_MESSAGE_LIMIT, edit_interval: float = 1.0):
+        self.limit = limit
+        self.edit_interval = edit_interval
+        self.message_id = None
+        self.text = ""
+        self.flushed_text = ""
+        self.last_edit = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.message_id is not None
+
+    def close_if_full(self, chunk: str) -> Optional[Tuple[int, str]]:
+        """Close the message if ``chunk`` does not fit; returns its last edit."""
+        if self.message_id is None or len(self.text) + 1 + len(chunk) <= self.limit:
+            return None
+        edit = self.pending()
+        self.message_id = None
+        return edit
+
+    def open(self, response, chunk: str) -> bool:
+        """Start a message from the sendMessage ``response``; False if it has no id."""
+        if response.ok:
+            self.message_id = (response.json().get("result") or {}).get("message_id")
+        self.text = self.flushed_text = chunk
+        self.last_edit = time.monotonic()
+        return self.message_id is not None
+
+    def append(self, chunk: str) -> Optional[Tuple[int, str]]:
+        """Add a chunk to the open message; returns an edit once the interval passed."""
+        self.text = f"{self.text}\n{chunk}"
+        if time.monotonic() - self.last_edit < self.edit_interval:
+            return None
+        self.flushed_text = self.text
+        self.last_edit = time.monotonic()
+        return self.message_id, self.text
+
+    def pending(self) -> Optional[Tuple[int, str]]:
+        """Edit with the text not sent yet, if any."""
+        if self.message_id is None or self.text == self.flushed_text:
+            return None
+        return self.message_id, self.text
+
+
+class CommandHandlerBase:
+    """Replies shared by ``CommandHandler`` and ``AsyncCommandHandler``.
+
+    Subclasses route updates and make the store, agent and Telegram calls;
+    what to answer is decided here.
+    """
 
-class CommandHandler:
     def __init__(
         self,
         logger,
@@ -10,52 +81,135 @@ class CommandHandler:
         config_manager,
         message_builder,
         session_manager,
-        bot_api_url: str,
+        telegram_client,
+        stream_mode: str = "off",
+        stream_edit_interval: float = 1.0,
+        message_packer: Optional[MessagePacker] = None,
     ):
+        if stream_mode not in STREAM_MODES:
+            raise ValueError(f"Unknown stream mode: {stream_mode}")
         self.logger = logger
         self.manus_agent = manus_agent
         self.config_manager = config_manager
         self.message_builder = message_builder
         self.session_manager = session_manager
-        self.bot_api_url = bot_api_url
+        self.telegram_client = telegram_client
+        self.stream_mode = stream_mode
+        self.stream_edit_interval = stream_edit_interval
+        self.message_packer = message_packer or MessagePacker()
+
+    def _agent_error_reply(self, error: Exception) -> str:
+        """Reply to a failed agent call; call it from the ``except`` block."""
+        if isinstance(error, AgentUnavailableError):
+            self.logger.warning("Agent unavailable: %s", error)
+            return self.message_builder.agent_unavailable()
+        self.logger.exception("An error: %s", error)
+        return AGENT_ERROR_MESSAGE
+
+    def _unauthorized_reply(self, expired: bool) -> str:
+        if expired:
+            return self.message_builder.auth_expired()
+        return self.message_builder.auth_required()
+
+    def _start_reply(self, user) -> str:
+        return self.message_builder.start(first_name=user["first_name"])
+
+    def _auth_reply(self, user, web_user_uuid) -> str:
+        if web_user_uuid:
+            return self.message_builder.welcome(user["first_name"])
+        return self.message_builder.auth_invalid()
+
+    @staticmethod
+    def _auth_token_missing(user) -> str:
+        return f"Validation error, {user['first_name']}, please provide web token"
+
 
+class CommandHandler(CommandHandlerBase):
     def _send_message(self, bot_token: str, chat_id, text: str):
-        url = f"{self.bot_api_url}{bot_token}/sendMessage"
-        payload = {"chat_id": chat_id, "text": text}
-        requests.post(url, json=payload)
+        return self.telegram_client.send_message(bot_token, chat_id, text)
 
-    def handle_message(self, update, bot_token):
+    def _reply_with_agent_output(
+        self, bot_token: str, chat_id, message, user_uuid, deadline: Optional[float] = None
+    ):
+        packer = packer_for_bot(self.config_manager, bot_token, self.message_packer)
+        if self.stream_mode == "off":
+            output_chain: List[str] = self.manus_agent.execute_command(
+                message, user_uuid, deadline=deadline
+            )
+            # Мелкие части склеиваем, слишком длинные режем по 4096
+            for chain in packer.pack(output_chain):
+                self._send_message(bot_token, chat_id, chain)
+            return
+
+        chunks = packer.split_all(
+            self.manus_agent.execute_command_stream(message, user_uuid, deadline=deadline)
+        )
+        if self.stream_mode == "messages":
+            for chunk in chunks:
+                self._send_message(bot_token, chat_id, chunk)
+        else:
+            self._stream_into_message(bot_token, chat_id, chunks, packer.limit)
+
+    def _stream_into_message(
+        self, bot_token: str, chat_id, chunks, limit: int = TELEGRAM_MESSAGE_LIMIT
+    ):
+        """Grow one message via editMessageText as chunks arrive (see ``StreamedReply``)."""
+        reply = StreamedReply(limit, self.stream_edit_interval)
+        for chunk in chunks:
+            edit = reply.close_if_full(chunk)
+            if edit:
+                self.telegram_client.edit_message_text(bot_token, chat_id, *edit)
+
+            if not reply.is_open:
+                response = self._send_message(bot_token, chat_id, chunk)
+                if not reply.open(response, chunk):
+                    # Не удалось получить id сообщения, дальше шлём по частям
+                    for rest in chunks:
+                        self._send_message(bot_token, chat_id, rest)
+                    return
+                continue
+
+            edit = reply.append(chunk)
+            if edit:
+                self.telegram_client.edit_message_text(bot_token, chat_id, *edit)
+
+        edit = reply.pending()
+        if edit:
+            self.telegram_client.edit_message_text(bot_token, chat_id, *edit)
+
+    def handle_update(self, update, bot_token, deadline: Optional[float] = None):
+        """Route an update; ``deadline`` is the ``time.monotonic()`` budget end."""
+        text = update["message"].get("text", "")
+        if text.startswith("/start"):
+            self.handle_start(update, bot_token)
+        elif text.startswith("/auth"):
+            self.handle_auth(update, bot_token)
+        else:
+            self.logger.debug("Handling message from bot: %s", bot_token)
+            self.handle_message(update, bot_token, deadline)
+
+    def handle_message(self, update, bot_token, deadline: Optional[float] = None):
         message = update["message"].get("text")
         user = update["message"].get("from")
         tg_id = user.get("id")
-        self.logger.info(f"tg_id: {tg_id}")
-
         user_info = self.session_manager.get_user(tg_id)
-        self.logger.info(f"user_info: {user_info}")
+        self.logger.debug("tg_id: %s, user_info: %s", tg_id, user_info)
 
         if user_info:
             user_uuid = user_info.get("user_uuid")
             if user_uuid:
+                self.session_manager.update_last_active(tg_id)
                 try:
-                    output_chain: List[str] = self.manus_agent.execute_command(
-                        message, user_uuid
+                    self._reply_with_agent_output(
+                        bot_token, user["id"], message, user_uuid, deadline
                     )
-                    for chain in output_chain:
-                        self._send_message(bot_token, user["id"], chain)
                 except Exception as e:
-                    self.logger(f"An error: {str(e)}")
-                    error_message = (
-                        "ОШИБКА: произошла неожижаная ошибка при обращении к агенту"
-                    )
-                    self._send_message(
-                        bot_token,
-                        user["id"],
-                        error_message,
-                    )
+                    self._send_message(bot_token, user["id"], self._agent_error_reply(e))
+                return
 
         # Если пользователь не авторизован
-        template = self.message_builder.auth_required()
-        self._send_message(bot_token, user["id"], template)
+        expired = user_info is None and self.session_manager.is_expired(tg_id)
+        self._send_message(bot_token, user["id"], self._unauthorized_reply(expired))
 
     def handle_start(self, update, bot_token):
         if not update.get("message"):
@@ -63,36 +217,22 @@ class CommandHandler:
 
         user = update["message"]["from"]
         # Можно добавить дополнительные проверки или логирование
-        welcome_template = self.message_builder.start(first_name=user["first_name"])
-        self._send_message(bot_token, user["id"], welcome_template)
+        self._send_message(bot_token, user["id"], self._start_reply(user))
 
     def handle_auth(self, update, bot_token):
         if not update.get("message"):
             return
 
         user = update["message"]["from"]
-        text = update["message"].get("text", "")
-        command_parts = text.split()
-
-        if len(command_parts) < 2:
-            self._send_message(
-                bot_token,
-                user["id"],
-                f"Validation error, {user['first_name']}, please provide web token",
-            )
+        auth_token = auth_token_from(update["message"].get("text", ""))
+        if auth_token is None:
+            self._send_message(bot_token, user["id"], self._auth_token_missing(user))
             return
 
-        auth_token = command_parts[1]
-        first_name = user["first_name"]
         web_user_uuid = self.config_manager.user_uuid_by_authtoken(auth_token)
-
         if web_user_uuid:
             self.session_manager.add_user(
                 tg_id=user["id"],
                 user_uuid=web_user_uuid,
             )
-            auth_success_template = self.message_builder.welcome(first_name)
-            self._send_message(bot_token, user["id"], auth_success_template)
-        else:
-            auth_invalid_template = self.message_builder.auth_invalid()
-            self._send_message(bot_token, user["id"], auth_invalid_template)
+        self._send_message(bot_token, user["id"], self._auth_reply(user, web_user_uuid))
@@ -1,5 +1,37 @@
+import os
 import uuid
+import weakref
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
 
 
 def generate_uuid_32():
     return str(uuid.uuid4()).replace("-", "")
+
+
+def session_cutoff(ttl: int) -> str:
+    """ISO timestamp before which a session with the given TTL is expired."""
+    return (datetime.now() - timedelta(seconds=ttl)).isoformat()
+
+
+def is_session_expired(user_data: Optional[Dict], ttl: int) -> bool:
+    if not ttl or not user_data:
+        return False
+    return user_data.get("last_active", "") < session_cutoff(ttl)
+
+
+def call_after_fork(method: Callable[[], None]):
+    """Run the bound ``method`` in the child process right after ``fork``.
+
+    The instance is referenced weakly, so registering does not keep it alive.
+    """
+    if not hasattr(os, "register_at_fork"):
+        return
+    ref = weakref.WeakMethod(method)
+
+    def callback():
+        bound = ref()
+        if bound is not None:
+            bound()
+
+    os.register_at_fork(after_in_child=callback)
@@ -0,0 +1,133 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import requests
+
+from app.telegram_client import ALLOWED_UPDATES, TelegramClient
+
+
+def webhook_params(url: str) -> Dict[str, str]:
+    """``setWebhook`` parameters for ``url`` limited to ``ALLOWED_UPDATES``."""
+    return {"url": url, "allowed_updates": json.dumps(ALLOWED_UPDATES)}
+
+
+class WebhookReconciler:
+    """Brings every bot's webhook to ``{server_address}/webhook/{token}``.
+
+    Tokens are checked concurrently with bounded parallelism and
+    ``setWebhook`` is only called when the registered URL or allowed update
+    types differ. The last known URL per token is cached, so repeated runs
+    skip bots already in the expected state without any API call.
+
+    Args:
+        logger: Logger instance
+        telegram_client: Bot API client
+        server_address: Public base URL of this service
+        max_workers: Max concurrent Bot API round-trips
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        telegram_client: TelegramClient,
+        server_address: str,
+        max_workers: int = 16,
+    ):
+        self.logger = logger
+        self.telegram_client = telegram_client
+        self.server_address = server_address
+        self.max_workers = max_workers
+        self._known: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.last_report: Optional[Dict] = None
+
+    def expected_url(self, token: str) -> str:
+        return f"{self.server_address}/webhook/{token}"
+
+    def remember(self, token: str, url: str):
+        with self._lock:
+            self._known[token] = url
+
+    def forget(self, token: str):
+        with self._lock:
+            self._known.pop(token, None)
+
+    def get_webhook_info(self, token: str) -> Optional[Dict]:
+        response = self.telegram_client.get(token, "getWebhookInfo")
+        if not response.ok:
+            self.logger.error(
+                "Failed to get webhook info for token %s, status code: %s",
+                token,
+                response.status_code,
+            )
+            return None
+        return response.json().get("result") or {}
+
+    def reconcile_one(self, token: str, force_check: bool = False) -> str:
+        """Returns ``"cached"``, ``"unchanged"``, ``"set"`` or ``"failed"``."""
+        expected = self.expected_url(token)
+        if not force_check and self._known.get(token) == expected:
+            return "cached"
+
+        try:
+            info = self.get_webhook_info(token)
+            if info is None:
+                return "failed"
+            # Без allowed_updates Telegram шлёт все типы апдейтов
+            if (
+                info.get("url", "") == expected
+                and info.get("allowed_updates") == ALLOWED_UPDATES
+            ):
+                self.remember(token, expected)
+                return "unchanged"
+
+            response = self.telegram_client.get(
+                token, "setWebhook", params=webhook_params(expected)
+            )
+            if not response.ok:
+                self.logger.error(
+                    "Failed to set webhook for token: %s, status code: %s",
+                    token,
+                    response.status_code,
+                )
+                return "failed"
+            self.remember(token, expected)
+            return "set"
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # ValueError — ответ не JSON (например, HTML 502 от прокси)
+            self.logger.error("Webhook reconciliation failed for token %s: %s", token, e)
+            return "failed"
+
+    def reconcile(self, tokens: Iterable[str], force_check: bool = False) -> Dict:
+        """Reconcile all tokens and return per-outcome counts and duration."""
+        started = time.monotonic()
+        tokens = list(dict.fromkeys(tokens))
+        report = {"total": len(tokens), "cached": 0, "unchanged": 0, "set": 0, "failed": 0}
+
+        if tokens:
+            workers = min(self.max_workers, len(tokens))
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="webhook-reconciler"
+            ) as executor:
+                for outcome in executor.map(
+                    lambda token: self.reconcile_one(token, force_check), tokens
+                ):
+                    report[outcome] += 1
+
+        report["duration"] = time.monotonic() - started
+        self.last_report = report
+        self.logger.info(
+            "Webhook reconciliation: %s bots, %s set, %s unchanged, %s cached, "
+            "%s failed in %.2fs",
+            report["total"],
+            report["set"],
+            report["unchanged"],
+            report["cached"],
+            report["failed"],
+            report["duration"],
+        )
+        return report
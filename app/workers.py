@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class UpdateWorkerPool:
+    """Bounded thread pool that runs update handlers off the request thread.
+
+    Args:
+        logger: Logger instance
+        max_workers: Number of handler threads
+        max_pending: Max queued plus running tasks; ``submit`` refuses more
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        max_workers: int = 8,
+        max_pending: int = 1000,
+    ):
+        self.logger = logger
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="update-worker"
+        )
+        self._pending = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return self._pending
+
+    def submit(self, fn: Callable, *args, **kwargs) -> bool:
+        """Schedule ``fn``; returns False if the pool is full or shutting down."""
+        with self._cond:
+            if self._closed or self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+
+        try:
+            self._executor.submit(self._run, fn, args, kwargs)
+        except RuntimeError:
+            self._task_done()
+            return False
+        return True
+
+    def _run(self, fn: Callable, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            self.logger.exception("Unhandled error in update worker: %s", e)
+        finally:
+            self._task_done()
+
+    def _task_done(self):
+        with self._cond:
+            self._pending -= 1
+            if self._pending == 0:
+                self._cond.notify_all()
+
+    def shutdown(self, timeout: Optional[float] = 30.0) -> bool:
+        """Stop accepting work and wait up to ``timeout`` for queued tasks.
+
+        Returns:
+            True if every task finished before the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._closed = True
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            drained = self._pending == 0
+
+        if not drained:
+            self.logger.warning(
+                "Worker pool shutdown timed out with %s tasks pending", self._pending
+            )
+        self._executor.shutdown(wait=drained, cancel_futures=not drained)
+        return drained
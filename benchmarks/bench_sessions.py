@@ -0,0 +1,83 @@
+"""Throughput of SQLiteSessionManager in default and concurrent modes.
+
+Usage:
+    python benchmarks/bench_sessions.py [--threads 8] [--seconds 3] [--users 10000]
+
+Importing the ``app`` package loads ``config``, so the usual environment
+variables (or ``instance/.env``) must be present.
+
+Each mode runs a read-only phase (get_user) and a write phase
+(update_last_active) with the given number of threads, and reports
+operations per second.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sqlite_session_manager import SQLiteSessionManager  # noqa: E402
+
+
+def run_phase(threads: int, seconds: float, operation) -> float:
+    counts = [0] * threads
+    stop = threading.Event()
+
+    def worker(index):
+        rnd = random.Random(index)
+        while not stop.is_set():
+            operation(rnd)
+            counts[index] += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in pool:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def bench(concurrent: bool, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = SQLiteSessionManager(
+            db_file=os.path.join(tmp, "sessions.db"), concurrent=concurrent
+        )
+        for tg_id in range(args.users):
+            manager.add_user(tg_id, f"uuid-{tg_id}")
+
+        reads = run_phase(
+            args.threads,
+            args.seconds,
+            lambda rnd: manager.get_user(rnd.randrange(args.users)),
+        )
+        writes = run_phase(
+            args.threads,
+            args.seconds,
+            lambda rnd: manager.update_last_active(rnd.randrange(args.users)),
+        )
+        manager.close()
+    return {"reads": reads, "writes": writes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--users", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"threads={args.threads} seconds={args.seconds} users={args.users}")
+    print(f"{'mode':<12}{'reads/sec':>14}{'writes/sec':>14}")
+    for name, concurrent in (("default", False), ("concurrent", True)):
+        result = bench(concurrent, args)
+        print(f"{name:<12}{result['reads']:>14,.0f}{result['writes']:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
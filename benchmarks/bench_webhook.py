@@ -0,0 +1,466 @@
+"""End-to-end load test of the webhook path against fake Telegram and OM11 servers.
+
+Usage:
+    python benchmarks/bench_webhook.py [--tenants 10] [--users 20] [--rate 200]
+        [--duration 10] [--mix start=1,auth=1,text=8]
+        [--telegram-latency 20] [--agent-latency 100]
+        [--telegram-error-rate 0] [--telegram-429-rate 0] [--agent-error-rate 0]
+        [--agent-chunks 1]
+        [--no-rate-limit] [--execution-mode threads|async] [--json]
+
+The app is built with ``create_app`` inside a temporary working directory
+(sessions.db, user configs and logs go there) and served by werkzeug on a
+local port. One local HTTP server stands in for both api.telegram.org and the
+OM11 agent; its latency and error rates are configurable. Environment
+variables that are not set are filled with local defaults; app logging is
+off unless LOG_LEVEL is set.
+
+Every update carries a ``#<seq>`` marker that comes back in the bot's reply
+(first name for /start and /auth, echoed agent output for free text), so the
+fake Telegram can match replies to updates. Before the measured run every
+user is authenticated once with /auth.
+
+Reported: webhook acknowledgement latency (measured from the scheduled send
+time, so a saturated server is not hidden), end-to-end latency until the
+reply reaches Telegram, throughput, unanswered updates and outbound calls
+per Bot API method.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+MARKER = re.compile(r"#(\d+)")
+UPDATE_KINDS = ("start", "auth", "text")
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(share * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": max(values, default=0.0) * 1000,
+    }
+
+
+class FakeUpstream:
+    """Local stand-in for the Bot API and the OM11 agent.
+
+    ``/bot<token>/<method>`` answers like Telegram, ``/api/execute_command/``
+    echoes the message back as a one-item list. Replies containing a
+    ``#<seq>`` marker are timestamped for end-to-end latency.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.calls: Dict[str, int] = {}
+        self.replies: Dict[int, float] = {}
+        self.injected_errors = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(args.seed)
+        self._message_ids = itertools.count(1)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def answered(self, seqs) -> bool:
+        with self._lock:
+            return set(seqs).issubset(self.replies.keys())
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.injected_errors = 0
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.replies), dict(sorted(self.calls.items())), self.injected_errors
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            hit = self._rng.random() < rate
+            if hit:
+                self.injected_errors += 1
+        return hit
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path.startswith("/api/execute_command"):
+                    upstream._agent(self, query)
+                else:
+                    upstream._telegram(self, url.path, dict(query, **body))
+
+            do_GET = do_POST = _handle
+
+        return Handler
+
+    def _agent(self, handler, query: Dict):
+        self._count("agent:execute_command")
+        time.sleep(self.args.agent_latency / 1000)
+        if self._roll(self.args.agent_error_rate):
+            handler._reply(500, {"error": "injected"})
+            return
+        chunks = [f"echo: {query.get('message', '')}"]
+        chunks += [f"part {index}" for index in range(1, self.args.agent_chunks)]
+        handler._reply(200, chunks)
+
+    def _telegram(self, handler, path: str, payload: Dict):
+        method = path.rsplit("/", 1)[-1]
+        self._count(f"telegram:{method}")
+        time.sleep(self.args.telegram_latency / 1000)
+
+        if method in ("sendMessage", "editMessageText"):
+            match = MARKER.search(str(payload.get("text", "")))
+            if match:
+                with self._lock:
+                    self.replies.setdefault(int(match.group(1)), time.perf_counter())
+
+        if self._roll(self.args.telegram_429_rate):
+            handler._reply(
+                429,
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+            )
+            return
+        if self._roll(self.args.telegram_error_rate):
+            handler._reply(500, {"ok": False, "error_code": 500})
+            return
+
+        if method == "getWebhookInfo":
+            result = {"url": ""}
+        elif method in ("sendMessage", "editMessageText"):
+            result = {"message_id": next(self._message_ids)}
+        else:
+            result = True
+        handler._reply(200, {"ok": True, "result": result})
+
+
+def prepare_environment(args, upstream_url: str, workdir: str):
+    os.environ["TELEGRAM_API_URL"] = f"{upstream_url}/bot"
+    os.environ["API_OM11_URL"] = upstream_url
+    os.environ["TELEGRAM_RATE_LIMIT"] = "false" if args.no_rate_limit else "true"
+    os.environ["EXECUTION_MODE"] = args.execution_mode
+    # Ошибки от инъекций засыпали бы отчёт; LOG_LEVEL=ERROR их покажет
+    os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+    os.environ.setdefault("LOG_FILE", os.path.join(workdir, "app.log"))
+    os.environ.setdefault("WEBHOOK_SHUTDOWN_TIMEOUT", "5")
+    defaults = {
+        "API_OM11TG_URL": "http://127.0.0.1",
+        "SECRET_KEY": "bench",
+        "SERVER_HOST": "127.0.0.1",
+        "SERVER_PORT": "0",
+        "SERVER_ADDRESS": "http://127.0.0.1",
+        "FLASK_ENV": "production",
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": "6379",
+        "REDIS_DB": "0",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in UPDATE_KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown update kind: {kind}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+class LoadGenerator:
+    """Open-loop sender: updates are scheduled at a fixed rate and latency is
+    measured from the scheduled time."""
+
+    def __init__(self, args, webhook_url: str, tenants: List[Dict], first_seq: int = 1):
+        self.args = args
+        self.webhook_url = webhook_url
+        self.tenants = tenants
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=args.concurrency)
+        self.session.mount("http://", adapter)
+
+        self.sent: Dict[int, float] = {}
+        self.acks: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count(first_seq)
+
+    def build_update(self, seq: int, kind: str, tenant: Dict, user_id: int) -> Dict:
+        if kind == "start":
+            text = "/start"
+        elif kind == "auth":
+            text = f"/auth {tenant['auth_token']}"
+        else:
+            text = f"ping #{seq}"
+        return {
+            "update_id": seq,
+            "message": {
+                "message_id": seq,
+                "text": text,
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "first_name": f"user#{seq}"},
+            },
+        }
+
+    def post(self, tenant: Dict, update: Dict, scheduled: float):
+        seq = update["update_id"]
+        with self._lock:
+            self.sent[seq] = scheduled
+        try:
+            response = self.session.post(
+                f"{self.webhook_url}/webhook/{tenant['bot_token']}",
+                json=update,
+                timeout=30,
+            )
+            status = str(response.status_code)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - scheduled
+        with self._lock:
+            self.acks.append(elapsed)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def run(self, plan, rate: float) -> float:
+        """Send ``plan`` (an iterable of ``(kind, tenant, user_id)``) at ``rate``."""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            for index, (kind, tenant, user_id) in enumerate(plan):
+                scheduled = started + index / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                seq = next(self._seq)
+                update = self.build_update(seq, kind, tenant, user_id)
+                pool.submit(self.post, tenant, update, scheduled)
+        return time.perf_counter() - started
+
+
+def wait_for_replies(upstream: FakeUpstream, seqs, timeout: float) -> float:
+    deadline = time.perf_counter() + timeout
+    seqs = list(seqs)
+    while time.perf_counter() < deadline and not upstream.answered(seqs):
+        time.sleep(0.05)
+    return time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenants", type=int, default=10, help="Bots (one config each)")
+    parser.add_argument("--users", type=int, default=20, help="Telegram users per bot")
+    parser.add_argument("--rate", type=float, default=200.0, help="Updates per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("start=1,auth=1,text=8"))
+    parser.add_argument("--concurrency", type=int, default=64, help="Sender threads")
+    parser.add_argument("--telegram-latency", type=float, default=20.0, help="ms")
+    parser.add_argument("--agent-latency", type=float, default=100.0, help="ms")
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--telegram-429-rate", type=float, default=0.0)
+    parser.add_argument("--agent-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--agent-chunks", type=int, default=1, help="Output elements per agent answer"
+    )
+    parser.add_argument("--no-rate-limit", action="store_true", help="TELEGRAM_RATE_LIMIT=false")
+    parser.add_argument(
+        "--execution-mode", choices=("threads", "async"), default="threads"
+    )
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(args)
+    upstream.start()
+
+    workdir = tempfile.mkdtemp(prefix="om11tg-bench-")
+    os.chdir(workdir)
+    prepare_environment(args, upstream.url, workdir)
+
+    # config читает окружение при импорте, поэтому импортируем после настройки
+    from werkzeug.serving import make_server
+
+    from app import create_app
+    from config import APIURLConfig, Config
+
+    app = create_app(Config(), APIURLConfig())
+    # Лог каждого запроса werkzeug сам по себе заметно тормозит прогон
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    webhook_url = f"http://127.0.0.1:{server.server_port}"
+
+    config_manager = app.telegram_manager.config_manager
+    tenants = []
+    for index in range(args.tenants):
+        tenant = {
+            "user_id": f"bench-user-{index}",
+            "bot_token": f"{100000 + index}:bench-token-{index}",
+            "auth_token": f"bench-auth-{index:026d}",
+            "chat_id": index,
+        }
+        config_manager.save_config(tenant["user_id"], tenant)
+        tenants.append(tenant)
+    users = [
+        (tenant, tenant["chat_id"] * 100000 + user)
+        for tenant in tenants
+        for user in range(args.users)
+    ]
+
+    # Прогрев: каждый пользователь один раз проходит /auth
+    warmup = LoadGenerator(args, webhook_url, tenants)
+    warmup.run((("auth", tenant, user_id) for tenant, user_id in users), args.rate)
+    wait_for_replies(upstream, warmup.sent, args.drain_timeout)
+    upstream.reset_counters()
+
+    rng = random.Random(args.seed)
+    kinds = list(args.mix)
+    weights = [args.mix[kind] for kind in kinds]
+    total = int(args.rate * args.duration)
+    plan = [
+        (rng.choices(kinds, weights)[0],) + rng.choice(users) for _ in range(total)
+    ]
+
+    # Свои update_id: повтор id прогрева отбросила бы дедупликация
+    load = LoadGenerator(
+        args, webhook_url, tenants, first_seq=max(warmup.sent, default=0) + 1
+    )
+    load_started = time.perf_counter()
+    send_time = load.run(plan, args.rate)
+    finished = wait_for_replies(upstream, load.sent, args.drain_timeout)
+
+    replies, calls, injected = upstream.snapshot()
+    end_to_end = [replies[seq] - sent for seq, sent in load.sent.items() if seq in replies]
+    last_reply = max((replies[seq] for seq in load.sent if seq in replies), default=finished)
+    wall_time = max(last_reply - load_started, send_time)
+
+    report = {
+        "config": {
+            "tenants": args.tenants,
+            "users": len(users),
+            "rate": args.rate,
+            "duration": args.duration,
+            "mix": args.mix,
+            "rate_limit": not args.no_rate_limit,
+            "execution_mode": args.execution_mode,
+            "telegram_latency_ms": args.telegram_latency,
+            "agent_latency_ms": args.agent_latency,
+            "telegram_error_rate": args.telegram_error_rate,
+            "telegram_429_rate": args.telegram_429_rate,
+            "agent_error_rate": args.agent_error_rate,
+            "agent_chunks": args.agent_chunks,
+        },
+        "sent": len(load.sent),
+        "statuses": load.statuses,
+        "ack_throughput": len(load.acks) / send_time if send_time else 0.0,
+        "reply_throughput": len(end_to_end) / wall_time if wall_time else 0.0,
+        "unanswered": len(load.sent) - len(end_to_end),
+        "ack_latency": summarize(load.acks),
+        "end_to_end_latency": summarize(end_to_end),
+        "outbound_calls": calls,
+        "injected_errors": injected,
+    }
+
+    server.shutdown()
+    app.shutdown()
+    upstream.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print_report(report)
+
+
+def print_report(report: Dict):
+    config = report["config"]
+    print(
+        f"tenants={config['tenants']} users={config['users']} rate={config['rate']:g}/s "
+        f"duration={config['duration']:g}s rate_limit={config['rate_limit']} "
+        f"execution_mode={config['execution_mode']}"
+    )
+    print(f"sent={report['sent']} statuses={report['statuses']} unanswered={report['unanswered']}")
+    print(
+        f"throughput: acks {report['ack_throughput']:,.1f}/s, "
+        f"replies {report['reply_throughput']:,.1f}/s"
+    )
+    print(f"{'latency':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in ("ack_latency", "end_to_end_latency"):
+        row = report[name]
+        print(
+            f"{name.replace('_latency', ''):<14}{row['count']:>8}{row['p50_ms']:>10.1f}"
+            f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}"
+        )
+    print(f"outbound calls (injected errors: {report['injected_errors']}):")
+    for name, count in report["outbound_calls"].items():
+        print(f"  {name:<32}{count:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from typing import Any, Optional, TypeVar
+from typing import Any, Callable, Optional, TypeVar
 
 # Load environment variables
 load_dotenv("instance/.env")
@@ -15,11 +15,48 @@ def get_env(key: str, required: bool = True, default: Optional[T] = None) -> Opt
     return value if value is not None else default
 
 
+def parse_bool(value: str) -> bool:
+    return str(value).lower() in ("true", "1", "t")
+
+
+class Setting:
+    """Config attribute read from the environment on first access.
+
+    Same rules as ``get_env``; ``parse`` converts the raw value (and a
+    default given as a string). The result is cached, so a required
+    variable only has to be set when something actually reads it, e.g.
+    REDIS_* only with a Redis backend.
+    """
+
+    _UNSET = object()
+
+    def __init__(
+        self,
+        key: str,
+        parse: Optional[Callable[[Any], Any]] = None,
+        required: bool = True,
+        default: Optional[Any] = None,
+    ):
+        self.key = key
+        self.parse = parse
+        self.required = required
+        self.default = default
+        self._value = self._UNSET
+
+    def __get__(self, instance, owner) -> Any:
+        if self._value is self._UNSET:
+            value = get_env(self.key, required=self.required, default=self.default)
+            if self.parse is not None and value is not None:
+                value = self.parse(value)
+            self._value = value
+        return self._value
+
+
 class APIURLConfig:
     """API URL configurations loaded from environment."""
 
-    OM11: str = get_env("API_OM11_URL")
-    OM11TG: str = get_env("API_OM11TG_URL")
+    OM11: str = Setting("API_OM11_URL")
+    OM11TG: str = Setting("API_OM11TG_URL")
 
     def get(self, key: str, default: Optional[Any] = None) -> Any:
         """Get configuration value by key with optional default."""
@@ -34,14 +71,134 @@ class APIURLConfig:
 class Config:
     """Flask application configuration."""
 
-    SECRET_KEY: str = get_env("SECRET_KEY")
-    DEBUG: bool = os.getenv("FLASK_DEBUG", "false").lower() in ("true", "1", "t")
-    ENV: str = get_env("FLASK_ENV", "production")
+    SECRET_KEY: str = Setting("SECRET_KEY")
+    DEBUG: bool = Setting("FLASK_DEBUG", parse_bool, default="false")
+    ENV: str = Setting("FLASK_ENV", default="production")
 
     # Server config
-    HOST: str = get_env("SERVER_HOST")
-    PORT: int = int(get_env("SERVER_PORT"))
-    SERVER_ADDRESS: str = get_env("SERVER_ADDRESS")
+    HOST: str = Setting("SERVER_HOST")
+    PORT: int = Setting("SERVER_PORT", int)
+    SERVER_ADDRESS: str = Setting("SERVER_ADDRESS")
+    # Production server (python run.py serve): gunicorn workers x threads.
+    # SERVER_GRACEFUL_TIMEOUT must cover WEBHOOK_SHUTDOWN_TIMEOUT, otherwise
+    # a worker is killed before its queue is drained
+    SERVER_WORKERS: int = Setting("SERVER_WORKERS", int, default=os.cpu_count() or 1)
+    SERVER_THREADS: int = Setting("SERVER_THREADS", int, default=8)
+    SERVER_TIMEOUT: int = Setting("SERVER_TIMEOUT", int, default=60)
+    SERVER_GRACEFUL_TIMEOUT: int = Setting("SERVER_GRACEFUL_TIMEOUT", int, default=40)
+    # Lock file electing the worker that runs long polling and webhook reconcile
+    SERVER_PRIMARY_LOCK: str = Setting("SERVER_PRIMARY_LOCK", default="instance/primary.lock")
+    # Defer work that grows with the data (user config index) to first use
+    STARTUP_LAZY: bool = Setting("STARTUP_LAZY", parse_bool, default="false")
+
+    # Logging: with LOG_ASYNC records are written by a background thread
+    LOG_FILE: str = Setting("LOG_FILE", default="app.log")
+    LOG_ASYNC: bool = Setting("LOG_ASYNC", parse_bool, default="false")
+    LOG_COMPRESS: bool = Setting("LOG_COMPRESS", parse_bool, default="false")
+    # LOG_FORMAT: "text" or "json" (one object per line, fields truncated)
+    LOG_LEVEL: str = Setting("LOG_LEVEL", str.upper, default="INFO")
+    LOG_FORMAT: str = Setting("LOG_FORMAT", default="text")
+    LOG_MAX_FIELD_LENGTH: int = Setting("LOG_MAX_FIELD_LENGTH", int, default=2000)
+    # Доля DEBUG-записей, которые реально пишутся (1.0 — все)
+    LOG_DEBUG_SAMPLE_RATE: float = Setting("LOG_DEBUG_SAMPLE_RATE", float, default=1.0)
+
+    # User config storage: "json" (one file per user) or "sqlite"
+    CONFIG_STORAGE: str = Setting("CONFIG_STORAGE", default="json")
+    CONFIG_DB_FILE: str = Setting("CONFIG_DB_FILE", default="instance/user_configs.db")
+    CONFIG_CACHE_SIZE: int = Setting("CONFIG_CACHE_SIZE", int, default=1024)
+    CONFIG_CACHE_TTL: float = Setting("CONFIG_CACHE_TTL", float, default=60)
+
+    # Telegram Bot API client
+    TELEGRAM_API_URL: str = Setting("TELEGRAM_API_URL", default="https://api.telegram.org/bot")
+    TELEGRAM_POOL_SIZE: int = Setting("TELEGRAM_POOL_SIZE", int, default=20)
+    TELEGRAM_TIMEOUT: float = Setting("TELEGRAM_TIMEOUT", float, default=10)
+
+    # Outbound pacing (Telegram allows ~30 msg/s per bot, ~1 msg/s per chat,
+    # 20 msg/min per group)
+    TELEGRAM_RATE_LIMIT: bool = Setting("TELEGRAM_RATE_LIMIT", parse_bool, default="true")
+    TELEGRAM_BOT_RATE: float = Setting("TELEGRAM_BOT_RATE", float, default=30)
+    TELEGRAM_CHAT_RATE: float = Setting("TELEGRAM_CHAT_RATE", float, default=1)
+    TELEGRAM_GROUP_RATE_PER_MIN: float = Setting(
+        "TELEGRAM_GROUP_RATE_PER_MIN", float, default=20
+    )
+    # A send that would wait longer for its slot fails fast with 429 (0: no limit)
+    TELEGRAM_MAX_WAIT: float = Setting("TELEGRAM_MAX_WAIT", float, default=10)
+
+    # Session storage backend: "sqlite" or "redis"
+    SESSION_BACKEND: str = Setting("SESSION_BACKEND", default="sqlite")
+    # Session lifetime in seconds after the last activity (0 disables expiry);
+    # an expired session is kept SESSION_EXPIRED_RETENTION more seconds so the
+    # user is told it expired instead of being asked to authenticate
+    SESSION_TTL: int = Setting("SESSION_TTL", int, default=30 * 24 * 3600)
+    SESSION_EXPIRED_RETENTION: int = Setting(
+        "SESSION_EXPIRED_RETENTION", int, default=7 * 24 * 3600
+    )
+    SESSION_SWEEP_INTERVAL: float = Setting("SESSION_SWEEP_INTERVAL", float, default=60)
+
+    # SQLite sessions: WAL + per-thread connections and batched last_active
+    # writes when SESSION_DB_CONCURRENT is enabled
+    SESSION_DB_CONCURRENT: bool = Setting("SESSION_DB_CONCURRENT", parse_bool, default="true")
+    SESSION_FLUSH_INTERVAL: float = Setting("SESSION_FLUSH_INTERVAL", float, default=1.0)
+    SESSION_CACHE_SIZE: int = Setting("SESSION_CACHE_SIZE", int, default=10000)
+    SESSION_CACHE_TTL: float = Setting("SESSION_CACHE_TTL", float, default=60)
+    SESSION_NEGATIVE_TTL: float = Setting("SESSION_NEGATIVE_TTL", float, default=5)
+
+    # Update ingress: "webhook" (Telegram calls /webhook/<token>) or
+    # "polling" (getUpdates long polling for all configured bots)
+    INGRESS_MODE: str = Setting("INGRESS_MODE", default="webhook")
+    POLLING_TIMEOUT: int = Setting("POLLING_TIMEOUT", int, default=30)
+
+    # Webhook update processing: WEBHOOK_QUEUE_SIZE bounds queued plus
+    # running updates over all chats, DISPATCHER_LANE_SIZE those of one chat
+    WEBHOOK_WORKERS: int = Setting("WEBHOOK_WORKERS", int, default=8)
+    WEBHOOK_QUEUE_SIZE: int = Setting("WEBHOOK_QUEUE_SIZE", int, default=1000)
+    WEBHOOK_SHUTDOWN_TIMEOUT: float = Setting("WEBHOOK_SHUTDOWN_TIMEOUT", float, default=30)
+    # Update execution: "threads" (worker pool) or "async" (one event loop
+    # with aiohttp clients; ASYNC_MAX_PENDING updates may be in flight)
+    EXECUTION_MODE: str = Setting("EXECUTION_MODE", default="threads")
+    ASYNC_MAX_PENDING: int = Setting("ASYNC_MAX_PENDING", int, default=10000)
+    ASYNC_AGENT_CONNECTIONS: int = Setting("ASYNC_AGENT_CONNECTIONS", int, default=1000)
+    ASYNC_TELEGRAM_CONNECTIONS: int = Setting("ASYNC_TELEGRAM_CONNECTIONS", int, default=100)
+    # Agent output streaming: "off", "messages" (one message per chunk)
+    # or "edit" (one message updated via editMessageText)
+    AGENT_STREAM_MODE: str = Setting("AGENT_STREAM_MODE", default="off")
+    AGENT_STREAM_EDIT_INTERVAL: float = Setting(
+        "AGENT_STREAM_EDIT_INTERVAL", float, default=1.0
+    )
+    # Outbound packing: small agent chunks are merged into one message,
+    # chunks over MESSAGE_LIMIT are split. A bot can override it with
+    # "message_packing": {"limit", "merge", "separator"} in its user config
+    MESSAGE_LIMIT: int = Setting("MESSAGE_LIMIT", int, default=4096)
+    MESSAGE_MERGE: bool = Setting("MESSAGE_MERGE", parse_bool, default="true")
+
+    # Agent client: the whole update must be handled within UPDATE_DEADLINE
+    # seconds from arrival; reads wait up to AGENT_TIMEOUT_MAX, while the
+    # slow-call threshold adapts between the MIN/MAX bounds; after
+    # AGENT_BREAKER_THRESHOLD failures in a row calls fail fast for
+    # AGENT_BREAKER_RESET seconds
+    UPDATE_DEADLINE: float = Setting("UPDATE_DEADLINE", float, default=120)
+    AGENT_POOL_SIZE: int = Setting("AGENT_POOL_SIZE", int, default=20)
+    AGENT_CONNECT_TIMEOUT: float = Setting("AGENT_CONNECT_TIMEOUT", float, default=3)
+    AGENT_TIMEOUT_MIN: float = Setting("AGENT_TIMEOUT_MIN", float, default=5)
+    AGENT_TIMEOUT_MAX: float = Setting("AGENT_TIMEOUT_MAX", float, default=120)
+    AGENT_BREAKER_THRESHOLD: int = Setting("AGENT_BREAKER_THRESHOLD", int, default=5)
+    AGENT_BREAKER_RESET: float = Setting("AGENT_BREAKER_RESET", float, default=30)
+
+    # Cache of agent answers marked "Cache-Control: max-age" (0 disables)
+    AGENT_RESULT_CACHE_SIZE: int = Setting("AGENT_RESULT_CACHE_SIZE", int, default=0)
+    AGENT_RESULT_CACHE_MAX_TTL: float = Setting("AGENT_RESULT_CACHE_MAX_TTL", float, default=30)
+
+    DISPATCHER_LANE_SIZE: int = Setting("DISPATCHER_LANE_SIZE", int, default=100)
+    # Drop redelivered updates by (bot, update_id): "memory", "redis" or "off"
+    DEDUP_BACKEND: str = Setting("DEDUP_BACKEND", default="memory")
+    DEDUP_TTL: int = Setting("DEDUP_TTL", int, default=3600)
+    DEDUP_MAX_SIZE: int = Setting("DEDUP_MAX_SIZE", int, default=100000)
+
+    # Webhook registration for all configured bots
+    WEBHOOK_RECONCILE_ON_STARTUP: bool = Setting(
+        "WEBHOOK_RECONCILE_ON_STARTUP", parse_bool, default="false"
+    )
+    WEBHOOK_RECONCILE_WORKERS: int = Setting("WEBHOOK_RECONCILE_WORKERS", int, default=16)
 
     def get(self, key: str, default: Optional[Any] = None) -> Any:
         """Get configuration value by key with optional default.
@@ -67,11 +224,20 @@ class Config:
 class RedisConfig:
     """Redis configuration."""
 
-    HOST: str = get_env("REDIS_HOST")
-    PORT: int = int(get_env("REDIS_PORT"))
-    DB: int = int(get_env("REDIS_DB"))
+    HOST: str = Setting("REDIS_HOST")
+    PORT: int = Setting("REDIS_PORT", int)
+    DB: int = Setting("REDIS_DB", int)
     DECODE_RESPONSES: bool = True
 
+    # Connection pool
+    MAX_CONNECTIONS: int = Setting("REDIS_MAX_CONNECTIONS", int, default=50)
+    SOCKET_TIMEOUT: float = Setting("REDIS_SOCKET_TIMEOUT", float, default=5)
+    SOCKET_CONNECT_TIMEOUT: float = Setting("REDIS_SOCKET_CONNECT_TIMEOUT", float, default=2)
+    HEALTH_CHECK_INTERVAL: int = Setting("REDIS_HEALTH_CHECK_INTERVAL", int, default=30)
+
+    SESSION_KEY_PREFIX: str = Setting("REDIS_SESSION_KEY_PREFIX", default="om11tg:session:")
+    DEDUP_KEY_PREFIX: str = Setting("REDIS_DEDUP_KEY_PREFIX", default="om11tg:update:")
+
     def get(self, key: str, default: Optional[Any] = None) -> Any:
         """Get Redis configuration value by key.
 
@@ -1,11 +1,11 @@
+import argparse
+import importlib
 import os
 import subprocess
 import sys
 import socket
-
-from app import create_app
-from app.logs import logger
-from config import Config, RedisConfig, APIURLConfig
+import threading
+import time
 
 def is_port_in_use(port):
     """Check if a port is already in use."""
@@ -13,6 +13,10 @@ def is_port_in_use(port):
         return s.connect_ex(("127.0.0.1", port)) == 0
 
 def old_main():
+    from app import create_app
+    from app.logs import logger
+    from config import Config, RedisConfig, APIURLConfig
+
     # Initialize configuration objects
     app_config = Config()
     redis_config = RedisConfig()
@@ -66,6 +70,9 @@ def old_main():
     )
 
 def new_main():
+    from app import create_app
+    from config import Config, RedisConfig, APIURLConfig
+
     app_config = Config()
     redis_config = RedisConfig()
     api_url_config = APIURLConfig()
@@ -73,6 +80,7 @@ def new_main():
     app = create_app(
         app_config=app_config,
         api_url_config=api_url_config,
+        redis_config=redis_config,
     )
 
     app.run(
@@ -81,6 +89,192 @@ def new_main():
         host=app_config.get("HOST", "localhost")
     )
 
+def acquire_primary_lock(lock_path: str):
+    """Block until this process holds an exclusive lock on ``lock_path``.
+
+    The lock is released by the OS when the process exits, so after a
+    graceful reload another worker takes over.
+    """
+    import fcntl
+
+    lock_dir = os.path.dirname(lock_path)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    lock_file = open(lock_path, "a")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def serve(args):
+    """Production server: gunicorn pre-fork workers with threads.
+
+    The app is built once in the master (preload) and forked into the
+    workers; background threads start in each worker after fork. SIGHUP
+    replaces the workers gracefully and SIGTERM stops them: each worker
+    finishes its requests, then drains its update queue before exiting.
+    """
+    # gunicorn есть только на POSIX и нужен только в этом режиме
+    from gunicorn.app.base import BaseApplication
+
+    from app import create_app
+    from app.logs import logger
+    from config import Config, RedisConfig, APIURLConfig
+
+    app_config = Config()
+    app = create_app(
+        app_config=app_config,
+        api_url_config=APIURLConfig(),
+        redis_config=RedisConfig(),
+        start_background=False,
+    )
+    workers = args.workers or app_config.get("SERVER_WORKERS", 1)
+    primary_lock = app_config.get("SERVER_PRIMARY_LOCK", "instance/primary.lock")
+    if workers > 1 and app_config.get("DEDUP_BACKEND", "memory") == "memory":
+        logger.warning(
+            "DEDUP_BACKEND=memory is per worker; use redis to drop redeliveries "
+            "that reach another worker"
+        )
+
+    def post_fork(server, worker):
+        # У каждого воркера свой реестр: метка отличает их ряды в Prometheus
+        app.metrics.set_constant_labels(worker=str(os.getpid()))
+        app.start_background(primary=False)
+
+        def elect_primary():
+            worker.primary_lock = acquire_primary_lock(primary_lock)
+            # Блокировку может получить воркер, который уже останавливается
+            if app.ready.is_set():
+                server.log.info("Worker %s runs the primary tasks", worker.pid)
+                app.start_primary()
+
+        threading.Thread(target=elect_primary, name="primary-election", daemon=True).start()
+
+    def worker_exit(server, worker):
+        app.shutdown()
+
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{app_config.get('HOST')}:{app_config.get('PORT')}",
+                "workers": workers,
+                "threads": args.threads or app_config.get("SERVER_THREADS", 8),
+                "worker_class": "gthread",
+                "preload_app": True,
+                "timeout": app_config.get("SERVER_TIMEOUT", 60),
+                "graceful_timeout": app_config.get("SERVER_GRACEFUL_TIMEOUT", 40),
+                "post_fork": post_fork,
+                "worker_exit": worker_exit,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    ProductionApplication().run()
+
+
+def profile_startup(args):
+    """Print where cold start goes: module imports, then each ``create_app``
+    step. Background threads are not started.
+
+    The commands import the app lazily so this sees a cold import.
+    """
+    started = time.perf_counter()
+    import_steps = []
+
+    def timed_import(module: str):
+        began = time.perf_counter()
+        importlib.import_module(module)
+        import_steps.append((f"import: {module}", time.perf_counter() - began))
+
+    timed_import("config")
+    from config import Config, RedisConfig, APIURLConfig
+
+    app_config = Config()
+    modules = ["flask", "requests"]
+    if "redis" in (
+        app_config.get("SESSION_BACKEND", "sqlite"),
+        app_config.get("DEDUP_BACKEND", "memory"),
+    ):
+        modules.append("redis")
+    if (
+        app_config.get("EXECUTION_MODE", "threads") == "async"
+        or app_config.get("INGRESS_MODE", "webhook") == "polling"
+    ):
+        modules.append("aiohttp")
+    for module in modules + ["app"]:
+        timed_import(module)
+
+    from app import create_app
+    from app.startup import StartupProfile
+
+    profile = StartupProfile()
+    for name, seconds in import_steps:
+        profile.add(name, seconds)
+    app = create_app(
+        app_config=app_config,
+        api_url_config=APIURLConfig(),
+        redis_config=RedisConfig(),
+        start_background=False,
+        profile=profile,
+    )
+    app.shutdown()
+    print(profile.report())
+    print(f"wall clock: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+def migrate_configs(args):
+    """Import the per-user JSON config directory into the SQLite store."""
+    from app import TG_CONFIGS_DIR
+    from app.config_storage import migrate_json_to_sqlite
+
+    source = args.source or TG_CONFIGS_DIR
+    total = migrate_json_to_sqlite(
+        source_dir=source,
+        db_file=args.target,
+        batch_size=args.batch_size,
+    )
+    print(f"Migrated {total} configs from {source} to {args.target}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="OM11TG server")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print import and create_app timings and exit",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-configs",
+        help="Import JSON user configs into the SQLite config store",
+    )
+    migrate_parser.add_argument("--source", help="Defaults to instance/user_configs")
+    migrate_parser.add_argument(
+        "--target", default=os.getenv("CONFIG_DB_FILE", "instance/user_configs.db")
+    )
+    migrate_parser.add_argument("--batch-size", type=int, default=500)
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run the production server (gunicorn workers x threads)",
+    )
+    serve_parser.add_argument("--workers", type=int, help="Defaults to SERVER_WORKERS")
+    serve_parser.add_argument("--threads", type=int, help="Defaults to SERVER_THREADS")
+
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    #old_main()
-    new_main()
+    args = parse_args()
+    if args.profile_startup:
+        profile_startup(args)
+    elif args.command == "migrate-configs":
+        migrate_configs(args)
+    elif args.command == "serve":
+        serve(args)
+    else:
+        #old_main()
+        new_main()
@@ -0,0 +1,88 @@
+import logging
+import threading
+
+import pytest
+from flask import Flask
+
+from app.api import configure_api
+from app.metrics import MetricsRegistry
+
+
+class FakeDispatcher:
+    def __init__(self, accept=True):
+        self.accept = accept
+        self.updates = []
+
+    def dispatch(self, update, bot_token, received_at=None):
+        self.updates.append((bot_token, update))
+        return self.accept
+
+
+def make_client(dispatcher):
+    app = Flask(__name__)
+    configure_api(
+        app=app,
+        logger=logging.getLogger("test"),
+        command_handler=None,
+        telegram_manager=None,
+        generate_uuid_32=lambda: "0" * 32,
+        dispatcher=dispatcher,
+        metrics=MetricsRegistry(),
+        ready=threading.Event(),
+    )
+    return app.test_client()
+
+
+def message_update(update_id=1):
+    return {
+        "update_id": update_id,
+        "message": {"text": "hi", "chat": {"id": 5}, "from": {"id": 5}},
+    }
+
+
+def test_message_is_dispatched():
+    dispatcher = FakeDispatcher()
+    response = make_client(dispatcher).post("/webhook/bot", json=message_update())
+
+    assert response.status_code == 200
+    assert dispatcher.updates == [("bot", message_update())]
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        {"update_id": 2, "edited_message": {"text": "hi"}},
+        {"update_id": 3, "callback_query": {"id": "1"}},
+        {"update_id": 4, "my_chat_member": {"chat": {"id": 5}}},
+    ],
+)
+def test_unhandled_update_types_are_acknowledged(update):
+    dispatcher = FakeDispatcher()
+    response = make_client(dispatcher).post("/webhook/bot", json=update)
+
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "ignored"}
+    assert dispatcher.updates == []
+
+
+@pytest.mark.parametrize("body", [b"not json", b"[1, 2]", b'{"message": {}}'])
+def test_malformed_body_is_rejected(body):
+    response = make_client(FakeDispatcher()).post(
+        "/webhook/bot", data=body, content_type="application/json"
+    )
+
+    assert response.status_code == 400
+
+
+def test_full_queue_answers_503():
+    response = make_client(FakeDispatcher(accept=False)).post(
+        "/webhook/bot", json=message_update()
+    )
+
+    assert response.status_code == 503
+
+
+def test_ready_reflects_event():
+    response = make_client(FakeDispatcher()).get("/ready")
+
+    assert response.status_code == 503
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import logging
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.async_manus_api import AsyncManusAgent
+from app.async_telegram_client import AsyncTelegramClient
+from app.async_updates import AsyncCommandHandler
+from app.manus_api import NDJSON_CONTENT_TYPE, AgentUnavailableError
+from app.messages import MessageBuilder, MessageTemplates
+from app.rate_limiter import RateLimitedTelegramClient
+from app.resilience import CircuitBreaker
+from app.telegram_client import TelegramResponse
+
+logger = logging.getLogger("test")
+
+
+class FakeAgentApi:
+    """Local agent: answers ``/api/execute_command/`` with a JSON list or NDJSON."""
+
+    def __init__(self, body=None, status=200, stream=None, delay=0.0):
+        self.body = body if body is not None else ["answer"]
+        self.status = status
+        self.stream = stream
+        self.delay = delay
+        self.requests = []
+        app = web.Application()
+        app.router.add_get("/api/execute_command/", self.handle)
+        self.server = TestServer(app)
+
+    async def handle(self, request):
+        self.requests.append(dict(request.query))
+        await asyncio.sleep(self.delay)
+        if self.stream is None:
+            return web.json_response(self.body, status=self.status)
+        response = web.StreamResponse(headers={"Content-Type": NDJSON_CONTENT_TYPE})
+        await response.prepare(request)
+        for chunk in self.stream:
+            await response.write(f"{json.dumps(chunk)}\n".encode())
+        await response.write_eof()
+        return response
+
+
+class ScriptedBotApi:
+    """Local Bot API: replays ``(status, body)`` answers, then answers ok."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = []
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.server = TestServer(app)
+
+    async def handle(self, request):
+        self.calls.append((time.monotonic(), request.match_info["method"], await request.json()))
+        if self.script:
+            status, body = self.script.pop(0)
+            return web.json_response(body, status=status)
+        return web.json_response({"ok": True, "result": {"message_id": len(self.calls)}})
+
+
+def run_with(server, test):
+    """Run ``test(url)`` on a fresh loop with ``server`` listening."""
+
+    async def main():
+        await server.start_server()
+        try:
+            return await test(str(server.make_url("")).rstrip("/"))
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_agent_returns_plain_answer():
+    api = FakeAgentApi(body=["one", "two"])
+
+    async def test(url):
+        agent = AsyncManusAgent(url, logger)
+        try:
+            return await agent.execute_command("hi", "user")
+        finally:
+            await agent.close()
+
+    assert run_with(api.server, test) == ["one", "two"]
+    assert api.requests == [{"message": "hi", "user_uuid": "user"}]
+
+
+def test_agent_coalesces_identical_calls():
+    api = FakeAgentApi(delay=0.1)
+
+    async def test(url):
+        agent = AsyncManusAgent(url, logger)
+        try:
+            results = await asyncio.gather(
+                *(agent.execute_command("hi", "user") for _ in range(5)),
+                agent.execute_command("hi", "other"),
+            )
+            return results, agent.stats()
+        finally:
+            await agent.close()
+
+    results, stats = run_with(api.server, test)
+
+    assert results == [["answer"]] * 6
+    assert len(api.requests) == 2
+    assert stats["coalesced"] == 4 and stats["inflight"] == 0
+
+
+def test_waiter_deadline_does_not_cancel_the_shared_call():
+    api = FakeAgentApi(delay=0.2)
+
+    async def test(url):
+        agent = AsyncManusAgent(url, logger)
+        try:
+            leader = asyncio.create_task(agent.execute_command("hi", "user"))
+            await asyncio.sleep(0.05)
+            with pytest.raises(AgentUnavailableError):
+                await agent.execute_command("hi", "user", deadline=time.monotonic() + 0.01)
+            return await leader
+        finally:
+            await agent.close()
+
+    assert run_with(api.server, test) == ["answer"]
+    assert len(api.requests) == 1
+
+
+def test_agent_5xx_fails_and_feeds_breaker():
+    api = FakeAgentApi(status=503)
+    breaker = CircuitBreaker(failure_threshold=1)
+
+    async def test(url):
+        agent = AsyncManusAgent(url, logger, breaker=breaker)
+        try:
+            with pytest.raises(AgentUnavailableError):
+                await agent.execute_command("hi", "user")
+            # Breaker открыт: второй вызов не доходит до агента
+            with pytest.raises(AgentUnavailableError):
+                await agent.execute_command("hi", "user")
+        finally:
+            await agent.close()
+
+    run_with(api.server, test)
+    assert len(api.requests) == 1
+
+
+def test_agent_stream_yields_ndjson_chunks():
+    api = FakeAgentApi(stream=["first", {"text": "second"}, ""])
+
+    async def test(url):
+        agent = AsyncManusAgent(url, logger)
+        try:
+            return [chunk async for chunk in agent.execute_command_stream("hi", "user")]
+        finally:
+            await agent.close()
+
+    assert run_with(api.server, test) == ["first", "second"]
+    assert api.requests[0]["stream"] == "1"
+
+
+def test_telegram_429_is_retried_after_retry_after():
+    api = ScriptedBotApi(
+        (429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.1}}),
+    )
+    limiter = RateLimitedTelegramClient(logger)
+
+    async def test(url):
+        client = AsyncTelegramClient(logger, api_url=f"{url}/bot", rate_limiter=limiter)
+        try:
+            return await client.send_message("123:abc", 1, "hi")
+        finally:
+            await client.close()
+
+    response = run_with(api.server, test)
+
+    assert response.ok and response.json()["result"]["message_id"] == 2
+    assert [method for _, method, _ in api.calls] == ["sendMessage", "sendMessage"]
+    assert api.calls[1][0] - api.calls[0][0] >= 0.09
+    assert limiter.scheduler_stats()["rate_limited"] == 1
+
+
+def test_telegram_send_over_max_wait_is_answered_locally():
+    api = ScriptedBotApi()
+    limiter = RateLimitedTelegramClient(logger, chat_burst=1, max_wait=2.0)
+    for _ in range(3):
+        limiter.reserve("123:abc", 1)
+
+    async def test(url):
+        client = AsyncTelegramClient(logger, api_url=f"{url}/bot", rate_limiter=limiter)
+        try:
+            return await client.send_message("123:abc", 1, "hi")
+        finally:
+            await client.close()
+
+    response = run_with(api.server, test)
+
+    assert response.status_code == 429
+    assert response.json()["parameters"]["retry_after"] == 3
+    assert api.calls == []
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+
+    async def send_message(self, bot_token, chat_id, text):
+        self.sent.append((chat_id, text))
+        return TelegramResponse(200, {}, {"ok": True, "result": {"message_id": 42}})
+
+    async def edit_message_text(self, bot_token, chat_id, message_id, text):
+        self.edits.append((message_id, text))
+
+
+class FakeAgent:
+    def __init__(self, output=None, error=None):
+        self.output = output or ["answer"]
+        self.error = error
+        self.calls = []
+
+    async def execute_command(self, message, user_uuid, deadline=None):
+        self.calls.append((message, user_uuid))
+        if self.error is not None:
+            raise self.error
+        return list(self.output)
+
+    async def execute_command_stream(self, message, user_uuid, deadline=None):
+        self.calls.append((message, user_uuid))
+        for chunk in self.output:
+            yield chunk
+
+
+class FakeSessions:
+    def __init__(self, sessions=None, expired=()):
+        self.sessions = dict(sessions or {})
+        self.expired = set(expired)
+        self.touched = []
+
+    def get_user(self, tg_id):
+        return self.sessions.get(tg_id)
+
+    def is_expired(self, tg_id):
+        return tg_id in self.expired
+
+    def update_last_active(self, tg_id):
+        self.touched.append(tg_id)
+
+    def add_user(self, tg_id, user_uuid):
+        self.sessions[tg_id] = {"user_uuid": user_uuid}
+
+
+class FakeConfigManager:
+    def get_uuid_by_bot_token(self, bot_token):
+        return None
+
+    def user_uuid_by_authtoken(self, auth_token):
+        return "web-uuid" if auth_token == "good" else None
+
+
+def make_handler(agent=None, sessions=None, **kwargs):
+    telegram = FakeTelegram()
+    handler = AsyncCommandHandler(
+        logger=logger,
+        manus_agent=agent or FakeAgent(),
+        config_manager=FakeConfigManager(),
+        message_builder=MessageBuilder(MessageTemplates()),
+        session_manager=sessions or FakeSessions(),
+        telegram_client=telegram,
+        **kwargs,
+    )
+    return handler, telegram
+
+
+def update(text, tg_id=7):
+    return {"update_id": 1, "message": {"text": text, "from": {"id": tg_id, "first_name": "Ann"}}}
+
+
+def test_handler_replies_with_agent_output():
+    sessions = FakeSessions({7: {"user_uuid": "u7"}})
+    agent = FakeAgent(["one", "two"])
+    handler, telegram = make_handler(agent, sessions)
+
+    asyncio.run(handler.handle_update(update("hi"), "123:abc"))
+
+    assert agent.calls == [("hi", "u7")]
+    assert sessions.touched == [7]
+    # Короткие ответы агента упаковываются в одно сообщение
+    assert telegram.sent == [(7, "one\n\ntwo")]
+
+
+def test_handler_tells_expired_from_unknown_users():
+    templates = MessageTemplates()
+    handler, telegram = make_handler(sessions=FakeSessions(expired={8}))
+
+    asyncio.run(handler.handle_update(update("hi", tg_id=7), "123:abc"))
+    asyncio.run(handler.handle_update(update("hi", tg_id=8), "123:abc"))
+
+    assert telegram.sent == [(7, templates.AUTH_REQUIRED), (8, templates.AUTH_EXPIRED)]
+
+
+def test_handler_reports_unavailable_agent():
+    sessions = FakeSessions({7: {"user_uuid": "u7"}})
+    agent = FakeAgent(error=AgentUnavailableError("down"))
+    handler, telegram = make_handler(agent, sessions)
+
+    asyncio.run(handler.handle_update(update("hi"), "123:abc"))
+
+    assert telegram.sent == [(7, MessageTemplates().AGENT_UNAVAILABLE)]
+
+
+def test_handler_auth_stores_session():
+    sessions = FakeSessions()
+    handler, telegram = make_handler(sessions=sessions)
+
+    asyncio.run(handler.handle_update(update("/auth good"), "123:abc"))
+    asyncio.run(handler.handle_update(update("/auth bad", tg_id=8), "123:abc"))
+
+    assert sessions.sessions == {7: {"user_uuid": "web-uuid"}}
+    assert [chat_id for chat_id, _ in telegram.sent] == [7, 8]
+
+
+def test_handler_edit_mode_grows_one_message():
+    sessions = FakeSessions({7: {"user_uuid": "u7"}})
+    handler, telegram = make_handler(
+        FakeAgent(["a", "b", "c"]), sessions, stream_mode="edit", stream_edit_interval=0.0
+    )
+
+    asyncio.run(handler.handle_update(update("hi"), "123:abc"))
+
+    assert telegram.sent == [(7, "a")]
+    assert telegram.edits == [(42, "a\nb"), (42, "a\nb\nc")]
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app.config_manager import UserConfigManager
+from app.config_storage import JSONDirectoryStorage, SQLiteConfigStorage
+
+
+class CountingStorage:
+    """Wraps a storage, counts ``versions`` scans and can hold their result on ``gate``."""
+
+    def __init__(self, storage, gate=None):
+        self.storage = storage
+        self.indexed = storage.indexed
+        self.gate = gate
+        self.scans = 0
+        self.scan_threads = []
+
+    def versions(self):
+        self.scans += 1
+        self.scan_threads.append(threading.current_thread())
+        versions = self.storage.versions()
+        if self.gate is not None:
+            self.gate.wait(5)
+        return versions
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def write_config(storage, user_id, **config):
+    storage.save(user_id, config)
+
+
+@pytest.fixture
+def json_storage(tmp_path):
+    storage = JSONDirectoryStorage(str(tmp_path / "configs"))
+    write_config(storage, "u1", bot_token="b1", auth_token="a1")
+    return storage
+
+
+def test_index_hit_does_not_scan_on_request_thread(json_storage):
+    storage = CountingStorage(json_storage)
+    manager = UserConfigManager(storage=storage, index_refresh_interval=0.0)
+    storage.scans = 0
+    storage.scan_threads.clear()
+
+    assert manager.get_uuid_by_bot_token("b1") == "u1"
+    wait_until(lambda: storage.scans >= 1)
+    assert threading.current_thread() not in storage.scan_threads
+
+
+def test_revoked_token_disappears_after_background_refresh(json_storage):
+    manager = UserConfigManager(storage=json_storage, index_refresh_interval=0.0)
+    os.remove(json_storage.get_path("u1"))
+
+    # Первый хит ещё отвечает из индекса и запускает обновление
+    assert manager.get_uuid_by_bot_token("b1") == "u1"
+    wait_until(lambda: manager.get_uuid_by_bot_token("b1") is None)
+
+
+def test_concurrent_misses_start_one_scan(json_storage):
+    gate = threading.Event()
+    storage = CountingStorage(json_storage, gate)
+    manager = UserConfigManager(storage=storage, lazy_index=True)
+
+    threads = [
+        threading.Thread(target=manager.get_uuid_by_bot_token, args=("missing",))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: storage.scans == 1)
+    time.sleep(0.05)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert storage.scans == 1
+
+
+def test_misses_refresh_at_most_once_per_interval(json_storage):
+    storage = CountingStorage(json_storage)
+    manager = UserConfigManager(storage=storage, index_refresh_interval=60.0)
+    for _ in range(10):
+        assert manager.get_uuid_by_bot_token("missing") is None
+
+    assert storage.scans == 1
+
+
+def test_miss_picks_up_config_written_externally(json_storage):
+    manager = UserConfigManager(storage=json_storage, index_refresh_interval=0.0)
+    write_config(json_storage, "u2", bot_token="b2")
+
+    assert manager.get_uuid_by_bot_token("b2") == "u2"
+
+
+def test_indexed_storage_never_scans_on_lookups(tmp_path):
+    sqlite = SQLiteConfigStorage(str(tmp_path / "configs.db"))
+    write_config(sqlite, "u1", bot_token="b1", auth_token="a1")
+    storage = CountingStorage(sqlite)
+    manager = UserConfigManager(storage=storage, index_refresh_interval=0.0)
+    storage.scans = 0
+
+    # Внешняя запись: промах находится одним запросом по индексу
+    write_config(sqlite, "u2", bot_token="b2")
+    for _ in range(5):
+        assert manager.get_uuid_by_bot_token("b1") == "u1"
+        assert manager.get_uuid_by_bot_token("b2") == "u2"
+        assert manager.user_uuid_by_authtoken("a1") == "u1"
+    time.sleep(0.05)
+
+    assert storage.scans == 0
+
+
+def test_save_during_refresh_is_not_overwritten(json_storage):
+    gate = threading.Event()
+    storage = CountingStorage(json_storage, gate)
+    manager = UserConfigManager(storage=storage, lazy_index=True)
+    refresh = threading.Thread(target=manager.refresh_index)
+    refresh.start()
+    wait_until(lambda: storage.scans == 1)
+
+    manager.save_config("u3", {"bot_token": "b3"})
+    gate.set()
+    refresh.join(5)
+
+    assert manager.get_uuid_by_bot_token("b3") == "u3"
+    assert manager.get_uuid_by_bot_token("b1") == "u1"
+
+
+def test_load_config_returns_a_deep_copy(json_storage):
+    write_config(json_storage, "u2", bot_token="b2", extra={"models": ["a"]})
+    manager = UserConfigManager(storage=json_storage)
+
+    config = manager.load_config("u2")
+    config["extra"]["models"].append("b")
+    config["bot_token"] = "changed"
+
+    assert manager.load_config("u2") == {"bot_token": "b2", "extra": {"models": ["a"]}}
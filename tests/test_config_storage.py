@@ -0,0 +1,83 @@
+import pytest
+
+from app.config_storage import (
+    JSONDirectoryStorage,
+    SQLiteConfigStorage,
+    create_config_storage,
+    migrate_json_to_sqlite,
+)
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def storage(request, tmp_path):
+    return create_config_storage(
+        kind=request.param,
+        config_dir=str(tmp_path / "configs"),
+        db_file=str(tmp_path / "configs.db"),
+    )
+
+
+def test_save_load_delete(storage):
+    version = storage.save("u1", {"bot_token": "b1", "auth_token": "a1", "nested": {"x": [1]}})
+
+    assert storage.load("u1") == {"bot_token": "b1", "auth_token": "a1", "nested": {"x": [1]}}
+    assert storage.versions() == {"u1": version}
+    assert storage.delete("u1")
+    assert storage.load("u1") is None
+    assert not storage.delete("u1")
+
+
+def test_versions_track_the_last_save(storage):
+    storage.save("u1", {"bot_token": "b1"})
+    version = storage.save("u1", {"bot_token": "b2"})
+
+    assert storage.versions()["u1"] == version
+    assert storage.load("u1") == {"bot_token": "b2"}
+
+
+def test_find_user_id_by_token(storage):
+    storage.save("u1", {"bot_token": "b1", "auth_token": "a1"})
+    storage.save("u2", {"bot_token": "b2", "auth_token": "a2"})
+
+    assert storage.find_user_id("bot_token", "b2") == "u2"
+    assert storage.find_user_id("auth_token", "a1") == "u1"
+    assert storage.find_user_id("bot_token", "nope") is None
+    assert dict(storage.iter_configs()).keys() == {"u1", "u2"}
+
+
+def test_json_storage_skips_broken_files(tmp_path):
+    storage = JSONDirectoryStorage(str(tmp_path))
+    storage.save("u1", {"bot_token": "b1"})
+    (tmp_path / "broken.json").write_text("{not json")
+
+    assert storage.load("broken") is None
+    assert dict(storage.iter_configs()) == {"u1": {"bot_token": "b1"}}
+    # Временные файлы атомарной записи не остаются в каталоге
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["broken.json", "u1.json"]
+
+
+def test_sqlite_storage_only_searches_indexed_fields(tmp_path):
+    storage = SQLiteConfigStorage(str(tmp_path / "configs.db"))
+
+    with pytest.raises(ValueError):
+        storage.find_user_id("chat_id", "1")
+
+
+def test_unknown_storage_kind_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        create_config_storage(kind="yaml", config_dir=str(tmp_path))
+
+
+def test_migrate_json_to_sqlite_in_batches(tmp_path):
+    source = JSONDirectoryStorage(str(tmp_path / "configs"))
+    for i in range(7):
+        source.save(f"u{i}", {"bot_token": f"b{i}", "auth_token": f"a{i}"})
+    db_file = str(tmp_path / "configs.db")
+
+    assert migrate_json_to_sqlite(source.config_dir, db_file, batch_size=3) == 7
+    # Повторный запуск перезаписывает те же строки
+    assert migrate_json_to_sqlite(source.config_dir, db_file, batch_size=3) == 7
+
+    target = SQLiteConfigStorage(db_file)
+    assert dict(target.iter_configs()) == dict(source.iter_configs())
+    assert target.find_user_id("bot_token", "b5") == "u5"
@@ -0,0 +1,70 @@
+import logging
+
+import pytest
+
+from app.dedup import RedisUpdateDeduplicator, UpdateDeduplicator
+
+
+def test_first_delivery_wins():
+    dedup = UpdateDeduplicator()
+
+    assert dedup.claim("111:secret", 1)
+    assert not dedup.claim("111:secret", 1)
+    # Тот же бот с другим секретом после перевыпуска токена
+    assert not dedup.claim("111:rotated", 1)
+    assert dedup.claim("222:secret", 1)
+    assert dedup.stats() == {"size": 2, "duplicates": 2}
+
+
+def test_released_update_can_be_claimed_again():
+    dedup = UpdateDeduplicator()
+    dedup.claim("111:secret", 1)
+
+    dedup.release("111:secret", 1)
+
+    assert dedup.claim("111:secret", 1)
+
+
+def test_store_is_bounded():
+    dedup = UpdateDeduplicator(maxsize=2)
+    for update_id in range(5):
+        dedup.claim("111:secret", update_id)
+
+    assert dedup.stats()["size"] == 2
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis()
+
+
+def test_redis_dedup_is_shared_between_instances(redis_client):
+    first = RedisUpdateDeduplicator(redis_client, logging.getLogger("test"), ttl=60)
+    second = RedisUpdateDeduplicator(redis_client, logging.getLogger("test"), ttl=60)
+
+    assert first.claim("111:secret", 1)
+    assert not second.claim("111:secret", 1)
+    assert 0 < redis_client.ttl("om11tg:update:111:1") <= 60
+    assert second.stats() == {"duplicates": 1, "errors": 0}
+
+    first.release("111:secret", 1)
+    assert second.claim("111:secret", 1)
+
+
+def test_redis_outage_lets_updates_through():
+    from redis import RedisError
+
+    class BrokenRedis:
+        def set(self, *args, **kwargs):
+            raise RedisError("down")
+
+        def delete(self, *args):
+            raise RedisError("down")
+
+    dedup = RedisUpdateDeduplicator(BrokenRedis(), logging.getLogger("test"))
+
+    assert dedup.claim("111:secret", 1)
+    assert dedup.claim("111:secret", 1)
+    dedup.release("111:secret", 1)
+    assert dedup.stats() == {"duplicates": 0, "errors": 2}
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from app.dedup import UpdateDeduplicator
+from app.dispatcher import UpdateDispatcher
+from app.workers import UpdateWorkerPool
+
+
+def update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": "hi"}}
+
+
+class RecordingHandler:
+    """Handler that records calls and blocks while ``gate`` is closed."""
+
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, update, bot_token, deadline=None):
+        if self.gate is not None:
+            self.gate.wait(5)
+        with self._lock:
+            self.calls.append((update["message"]["chat"]["id"], update["update_id"]))
+
+
+@pytest.fixture
+def pool():
+    pool = UpdateWorkerPool(logging.getLogger("test"), max_workers=4, max_pending=100)
+    yield pool
+    pool.shutdown(timeout=5)
+
+
+def make_dispatcher(pool, handler, **kwargs):
+    return UpdateDispatcher(logging.getLogger("test"), pool, handler, **kwargs)
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_updates_of_one_chat_run_in_order(pool):
+    handler = RecordingHandler()
+    dispatcher = make_dispatcher(pool, handler, max_batch=3)
+    for i in range(50):
+        assert dispatcher.dispatch(update(i, chat_id=i % 3), "bot")
+
+    wait_until(lambda: len(handler.calls) == 50)
+    for chat_id in range(3):
+        ids = [update_id for chat, update_id in handler.calls if chat == chat_id]
+        assert ids == sorted(ids)
+    assert dispatcher.stats()["queued_updates"] == 0
+
+
+def test_chats_run_in_parallel(pool):
+    gate = threading.Event()
+    handler = RecordingHandler(gate)
+    dispatcher = make_dispatcher(pool, handler)
+    dispatcher.dispatch(update(1, chat_id=1), "bot")
+    dispatcher.dispatch(update(2, chat_id=2), "bot")
+
+    wait_until(lambda: pool.pending == 2)
+    gate.set()
+    wait_until(lambda: len(handler.calls) == 2)
+
+
+def test_global_limit_counts_updates_inside_lanes(pool):
+    gate = threading.Event()
+    dispatcher = make_dispatcher(
+        pool, RecordingHandler(gate), max_lane_size=100, max_pending=5
+    )
+    accepted = [dispatcher.dispatch(update(i, chat_id=i % 2), "bot") for i in range(8)]
+
+    assert accepted == [True] * 5 + [False] * 3
+    stats = dispatcher.stats()
+    assert stats["queued_updates"] == 5
+    assert stats["rejected"] == 3
+    gate.set()
+    wait_until(lambda: dispatcher.stats()["queued_updates"] == 0)
+    assert dispatcher.dispatch(update(100, chat_id=1), "bot")
+
+
+def test_lane_limit_rejects_busy_chat_only(pool):
+    gate = threading.Event()
+    dispatcher = make_dispatcher(pool, RecordingHandler(gate), max_lane_size=2)
+
+    assert dispatcher.dispatch(update(1, chat_id=1), "bot")
+    assert dispatcher.dispatch(update(2, chat_id=1), "bot")
+    assert not dispatcher.dispatch(update(3, chat_id=1), "bot")
+    assert dispatcher.dispatch(update(4, chat_id=2), "bot")
+    gate.set()
+
+
+def test_redelivery_is_acknowledged_and_dropped(pool):
+    handler = RecordingHandler()
+    dispatcher = make_dispatcher(pool, handler, deduplicator=UpdateDeduplicator())
+
+    assert dispatcher.dispatch(update(7, chat_id=1), "bot")
+    assert dispatcher.dispatch(update(7, chat_id=1), "bot")
+    wait_until(lambda: handler.calls)
+    time.sleep(0.05)
+
+    assert handler.calls == [(1, 7)]
+    assert dispatcher.stats()["duplicates"] == 1
+
+
+def test_rejected_update_can_be_redelivered(pool):
+    gate = threading.Event()
+    handler = RecordingHandler(gate)
+    dispatcher = make_dispatcher(
+        pool, handler, max_pending=1, deduplicator=UpdateDeduplicator()
+    )
+    assert dispatcher.dispatch(update(1, chat_id=1), "bot")
+    assert not dispatcher.dispatch(update(2, chat_id=2), "bot")
+
+    gate.set()
+    wait_until(lambda: dispatcher.stats()["queued_updates"] == 0)
+    assert dispatcher.dispatch(update(2, chat_id=2), "bot")
+    wait_until(lambda: len(handler.calls) == 2)
+
+
+def test_closed_pool_rejects_without_leaking_pending():
+    pool = UpdateWorkerPool(logging.getLogger("test"), max_workers=1)
+    pool.shutdown(timeout=1)
+    dispatcher = make_dispatcher(pool, RecordingHandler(), max_pending=10)
+
+    assert not dispatcher.dispatch(update(1, chat_id=1), "bot")
+    stats = dispatcher.stats()
+    assert stats["queued_updates"] == 0
+    assert stats["active_lanes"] == 0
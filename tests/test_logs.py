@@ -0,0 +1,49 @@
+import logging
+import os
+
+import pytest
+
+from app import logs
+
+
+@pytest.fixture
+def async_logger(tmp_path):
+    name = "test-logs-async"
+    logger = logs.setup_logger(name, log_file=str(tmp_path / "app.log"), async_mode=True)
+    yield logger, tmp_path / "app.log"
+    logs.stop_listener(name)
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers.clear()
+
+
+def test_restart_after_fork_uses_a_fresh_listener(async_logger):
+    logger, log_file = async_logger
+    old = logs._listeners[logger.name]
+    old.stop()
+
+    logs._restart_listeners_after_fork()
+    new = logs._listeners[logger.name]
+    logger.warning("after restart")
+    logs.stop_listener(logger.name)
+
+    assert new is not old
+    assert new.handlers == old.handlers
+    assert new.respect_handler_level == old.respect_handler_level
+    assert logger.handlers[0].queue is new.queue is not old.queue
+    assert "after restart" in log_file.read_text()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_child_process_keeps_logging(async_logger):
+    logger, log_file = async_logger
+    pid = os.fork()
+    if pid == 0:
+        try:
+            logger.warning("from child")
+            logs.stop_listener(logger.name)
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert "from child" in log_file.read_text()
@@ -0,0 +1,261 @@
+import logging
+import threading
+import time
+
+import pytest
+import requests
+
+from app.manus_api import AgentUnavailableError, ManusAgent
+from app.resilience import OPEN, AdaptiveTimeout, CircuitBreaker
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data if data is not None else ["answer"]
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+    def json(self):
+        return self._data
+
+
+class FakeSession:
+    """Records the read timeout of each call and replays ``outcomes``."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.read_timeouts = []
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        self.read_timeouts.append(timeout[1])
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def make_agent(session, threshold=5):
+    agent = ManusAgent(
+        "http://agent",
+        logging.getLogger("test"),
+        adaptive_timeout=AdaptiveTimeout(min_timeout=5.0, max_timeout=120.0),
+        breaker=CircuitBreaker(failure_threshold=threshold),
+    )
+    agent.session = session
+    return agent
+
+
+def test_plain_calls_wait_up_to_max_timeout_after_fast_replies():
+    session = FakeSession(FakeResponse())
+    agent = make_agent(session)
+    for i in range(20):
+        agent.adaptive_timeout.observe(1.5)
+
+    agent.execute_command("hi", "user")
+
+    assert agent.adaptive_timeout.current() == pytest.approx(5.0)
+    assert session.read_timeouts == [120.0]
+
+
+def test_read_timeout_is_cut_to_deadline():
+    session = FakeSession(FakeResponse())
+    agent = make_agent(session)
+
+    agent.execute_command("hi", "user", deadline=time.monotonic() + 10.0)
+
+    assert 9.0 < session.read_timeouts[0] <= 10.0
+
+
+def test_spent_deadline_fails_without_calling_agent():
+    session = FakeSession(FakeResponse())
+    agent = make_agent(session)
+
+    with pytest.raises(AgentUnavailableError):
+        agent.execute_command("hi", "user", deadline=time.monotonic() - 1.0)
+    assert session.read_timeouts == []
+
+
+def test_timeout_cut_by_deadline_does_not_open_breaker():
+    session = FakeSession(requests.ReadTimeout("slow"))
+    agent = make_agent(session, threshold=2)
+    for _ in range(20):
+        agent.adaptive_timeout.observe(10.0)
+
+    for i in range(3):
+        with pytest.raises(AgentUnavailableError):
+            agent.execute_command(f"run {i}", "user", deadline=time.monotonic() + 2.0)
+
+    assert agent.breaker.state != OPEN
+
+
+def test_full_timeouts_and_connection_errors_open_breaker():
+    session = FakeSession(requests.ReadTimeout("hung"), requests.ConnectionError("down"))
+    agent = make_agent(session, threshold=2)
+
+    for i in range(2):
+        with pytest.raises(AgentUnavailableError):
+            agent.execute_command(f"run {i}", "user")
+
+    assert agent.breaker.state == OPEN
+    with pytest.raises(AgentUnavailableError, match="breaker"):
+        agent.execute_command("again", "user")
+
+
+def test_5xx_counts_as_failure():
+    agent = make_agent(FakeSession(FakeResponse(503)), threshold=1)
+
+    with pytest.raises(AgentUnavailableError):
+        agent.execute_command("hi", "user")
+    assert agent.breaker.state == OPEN
+
+
+def test_4xx_does_not_close_half_open_breaker():
+    agent = make_agent(FakeSession(FakeResponse(400)), threshold=1)
+    agent.breaker.reset_timeout = 0.0
+    agent.breaker.record_failure()
+
+    assert agent.execute_command("hi", "user") == []
+    assert agent.breaker.state != "closed"
+    # Следующий вызов снова может быть пробным
+    assert agent.breaker.allow()
+
+
+def test_4xx_does_not_reset_consecutive_failures():
+    session = FakeSession(requests.ConnectionError("down"), FakeResponse(404))
+    agent = make_agent(session, threshold=5)
+    with pytest.raises(AgentUnavailableError):
+        agent.execute_command("a", "user")
+    agent.execute_command("b", "user")
+
+    assert agent.breaker.stats()["consecutive_failures"] == 1
+
+
+def test_interrupted_leader_does_not_leak_base_exception_to_waiters():
+    agent = make_agent(FakeSession(KeyboardInterrupt()))
+    waiters = []
+    original = agent._request_command
+
+    def request_command(*args):
+        # Пока ведущий в полёте, второй вызов ждёт его результата
+        waiters.append(agent._inflight[("hi", "user")])
+        return original(*args)
+
+    agent._request_command = request_command
+    with pytest.raises(KeyboardInterrupt):
+        agent.execute_command("hi", "user")
+
+    error = waiters[0].exception(timeout=0)
+    assert isinstance(error, AgentUnavailableError)
+    assert agent.stats()["inflight"] == 0
+
+
+class GatedSession(FakeSession):
+    """``FakeSession`` whose calls block until ``gate`` is set."""
+
+    def __init__(self, *outcomes):
+        super().__init__(*outcomes)
+        self.gate = threading.Event()
+        self.entered = threading.Event()
+        self.params = []
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        self.params.append(params)
+        self.entered.set()
+        self.gate.wait(5)
+        return super().get(url, params=params, timeout=timeout, **kwargs)
+
+
+def run_concurrently(agent, session, calls):
+    """Start ``calls`` while the first agent request is held on the gate."""
+    results, errors = {}, {}
+
+    def call(name, message, user):
+        try:
+            results[name] = agent.execute_command(message, user)
+        except Exception as e:
+            errors[name] = e
+
+    threads = [
+        threading.Thread(target=call, args=(name, message, user))
+        for name, (message, user) in calls.items()
+    ]
+    threads[0].start()
+    assert session.entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Остальные вызовы успевают встать в очередь за ведущим
+    deadline = time.monotonic() + 5
+    while agent.coalesced + len(session.params) < len(calls):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    session.gate.set()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_identical_concurrent_calls_share_one_request():
+    session = GatedSession(FakeResponse(data=["answer"]))
+    agent = make_agent(session)
+
+    results, errors = run_concurrently(
+        agent, session, {name: ("hi", "user") for name in ("a", "b", "c")}
+    )
+
+    assert errors == {}
+    assert results == {"a": ["answer"], "b": ["answer"], "c": ["answer"]}
+    assert len(session.params) == 1
+    assert agent.stats()["coalesced"] == 2
+    assert agent.stats()["inflight"] == 0
+    # Каждый получает свою копию списка
+    results["a"].append("mutated")
+    assert results["b"] == ["answer"]
+
+
+def test_calls_for_different_users_are_not_coalesced():
+    session = GatedSession(FakeResponse(data=["answer"]))
+    agent = make_agent(session)
+
+    results, errors = run_concurrently(
+        agent, session, {"a": ("hi", "user-1"), "b": ("hi", "user-2")}
+    )
+
+    assert errors == {} and len(results) == 2
+    assert len(session.params) == 2
+    assert agent.stats()["coalesced"] == 0
+
+
+def test_waiters_get_the_leader_error():
+    session = GatedSession(requests.ConnectionError("down"))
+    agent = make_agent(session)
+
+    results, errors = run_concurrently(
+        agent, session, {"a": ("hi", "user"), "b": ("hi", "user")}
+    )
+
+    assert results == {}
+    assert set(errors) == {"a", "b"}
+    assert all(isinstance(e, AgentUnavailableError) for e in errors.values())
+    assert len(session.params) == 1
+
+
+def test_cacheable_answers_are_reused():
+    session = FakeSession(
+        FakeResponse(data=["cached"], headers={"Cache-Control": "max-age=60"}),
+        FakeResponse(data=["fresh"]),
+    )
+    agent = ManusAgent(
+        "http://agent", logging.getLogger("test"), result_cache_size=10, result_cache_max_ttl=30
+    )
+    agent.session = session
+
+    assert agent.execute_command("hi", "user") == ["cached"]
+    assert agent.execute_command("hi", "user") == ["cached"]
+    assert agent.execute_command("hi", "other") == ["fresh"]
+    assert agent.execute_command("hi", "other") == ["fresh"]
+    assert len(session.read_timeouts) == 3
+    assert agent.stats()["cache_hits"] == 1
@@ -0,0 +1,68 @@
+import pytest
+
+from app.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_counter_renders_labels_and_escapes(registry):
+    counter = registry.counter("calls_total", "Calls.", ("method",))
+    counter.inc("send")
+    counter.inc("send", amount=2)
+    counter.inc('say "hi"\n')
+
+    text = registry.render()
+
+    assert "# HELP calls_total Calls.\n# TYPE calls_total counter\n" in text
+    assert 'calls_total{method="send"} 3.0\n' in text
+    assert 'calls_total{method="say \\"hi\\"\\n"} 1.0\n' in text
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 6.05" in lines
+    assert "latency_seconds_count 4" in lines
+
+
+def test_register_stats_exports_numeric_fields(registry):
+    registry.register_stats(
+        "component", "Stats.", lambda: {"size": 3, "ratio": 0.5, "open": True, "name": "x"}
+    )
+
+    lines = registry.render().splitlines()
+
+    assert 'component{stat="size"} 3.0' in lines
+    assert 'component{stat="ratio"} 0.5' in lines
+    assert not any("open" in line or '"name"' in line for line in lines)
+
+
+def test_constant_labels_go_on_every_sample(registry):
+    registry.counter("plain_total", "No labels.").inc()
+    registry.counter("labelled_total", "Labelled.", ("kind",)).inc("a")
+    registry.set_constant_labels(worker="2")
+
+    lines = registry.render().splitlines()
+
+    assert 'plain_total{worker="2"} 1.0' in lines
+    assert 'labelled_total{worker="2",kind="a"} 1.0' in lines
+
+
+def test_gauge_callback_replaces_and_duplicates_fail(registry):
+    registry.gauge_callback("queue", "Queue.", lambda: 1)
+    registry.gauge_callback("queue", "Queue.", lambda: 2)
+    registry.counter("hits_total", "Hits.")
+
+    assert "queue 2.0" in registry.render().splitlines()
+    with pytest.raises(ValueError):
+        registry.counter("hits_total", "Hits.")
@@ -0,0 +1,72 @@
+import random
+import threading
+
+import pytest
+
+from app.packer import FENCE, MessagePacker
+
+
+def split_with_timeout(packer, text, timeout=5.0):
+    """Run ``packer.split`` in a thread so a regression fails instead of hanging."""
+    result = {}
+    thread = threading.Thread(
+        target=lambda: result.setdefault("parts", packer.split(text)), daemon=True
+    )
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "split did not finish"
+    return result["parts"]
+
+
+@pytest.mark.parametrize(
+    "limit, text",
+    [
+        (4096, "```python\n" + "y" * 5000 + "\n```"),
+        (4096, "```\n" + "y" * 5000),
+        (4096, "intro\n```\n" + "z" * 9000),
+        (100, "```\n" + "x" * 250 + "\n```"),
+        (100, "```javascript\n" + "x" * 250 + "\nshort\n" + "w" * 300 + "\n```"),
+        (5, "```\n" + "y" * 12),
+        (1, "```\n" + "y" * 12),
+    ],
+)
+def test_long_code_line_is_cut_hard(limit, text):
+    parts = split_with_timeout(MessagePacker(limit=limit), text)
+
+    assert parts
+    assert all(len(part) <= limit for part in parts)
+
+
+def test_long_code_line_keeps_content_and_fences():
+    code = "y" * 5000
+    parts = split_with_timeout(MessagePacker(), f"```python\n{code}\n```")
+
+    assert len(parts) == 2
+    for part in parts:
+        assert part.startswith("```python\n")
+        assert part.endswith(FENCE)
+    assert "".join(
+        part[len("```python\n"):-len(FENCE)].strip("\n") for part in parts
+    ) == code
+
+
+def test_prefers_paragraph_boundaries():
+    text = "a" * 3000 + "\n\n" + "b" * 3000
+
+    assert MessagePacker().split(text) == ["a" * 3000, "b" * 3000]
+
+
+def test_pack_merges_small_chunks():
+    packer = MessagePacker(limit=20)
+
+    assert packer.pack(["one", "two", "", "x" * 18]) == ["one\n\ntwo", "x" * 18]
+
+
+def test_random_texts_terminate_within_limit():
+    rng = random.Random(1)
+    pieces = ["```", "```py", "\n", "\n\n", " ", ". ", "word", "x" * 150]
+    for _ in range(300):
+        limit = rng.choice([1, 4, 5, 10, 50, 100])
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 40)))
+        parts = split_with_timeout(MessagePacker(limit=limit), text)
+        assert all(len(part) <= limit for part in parts), (limit, text)
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.polling import LongPollingIngress
+
+
+class FakeBotApi:
+    """Local Bot API: replays scripted getUpdates answers and records calls.
+
+    Once the script runs out, ``getUpdates`` answers with no updates after a
+    short pause, as a long poll with nothing new would.
+    """
+
+    def __init__(self, *get_updates):
+        self.script = list(get_updates)
+        self.calls = []
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.server = TestServer(app)
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = await request.json()
+        self.calls.append((time.monotonic(), method, params))
+        if method == "deleteWebhook":
+            return web.json_response({"ok": True, "result": True})
+        if self.script:
+            status, body = self.script.pop(0)
+            return web.json_response(body, status=status)
+        await asyncio.sleep(0.05)
+        return web.json_response({"ok": True, "result": []})
+
+    def methods(self):
+        return [method for _, method, _ in self.calls]
+
+    def get_updates_calls(self):
+        return [(at, params) for at, method, params in self.calls if method == "getUpdates"]
+
+
+class FakeConfigManager:
+    def get_bot_tokens(self):
+        return ["123:abc"]
+
+
+def updates(*ids):
+    return 200, {
+        "ok": True,
+        "result": [{"update_id": i, "message": {"chat": {"id": 1}, "text": "hi"}} for i in ids],
+    }
+
+
+def run_polling(api, dispatch, until, timeout=5.0, **kwargs):
+    async def main():
+        await api.server.start_server()
+        ingress = LongPollingIngress(
+            logging.getLogger("test"),
+            FakeConfigManager(),
+            dispatch,
+            api_url=str(api.server.make_url("/bot")),
+            poll_timeout=1,
+            refresh_interval=60.0,
+            **kwargs,
+        )
+        task = asyncio.create_task(ingress.run())
+        try:
+            deadline = time.monotonic() + timeout
+            while not until():
+                assert time.monotonic() < deadline, "condition not reached"
+                await asyncio.sleep(0.01)
+        finally:
+            ingress._stop_event.set()
+            await asyncio.wait_for(task, 5)
+            await api.server.close()
+        return ingress
+
+    return asyncio.run(main())
+
+
+def test_offset_confirms_dispatched_updates():
+    api = FakeBotApi(updates(10, 11), updates(12))
+    received = []
+
+    def dispatch(update, token):
+        received.append((token, update["update_id"]))
+        return True
+
+    ingress = run_polling(api, dispatch, until=lambda: len(api.get_updates_calls()) >= 3)
+
+    offsets = [params.get("offset") for _, params in api.get_updates_calls()[:3]]
+    assert offsets == [None, 12, 13]
+    assert received == [("123:abc", 10), ("123:abc", 11), ("123:abc", 12)]
+    assert ingress.offsets["123:abc"] == 13
+    assert api.get_updates_calls()[0][1]["allowed_updates"] == ["message"]
+
+
+def test_rejected_update_is_fetched_again():
+    api = FakeBotApi(updates(10, 11), updates(11))
+    accepted = {10}
+    received = []
+
+    def dispatch(update, token):
+        received.append(update["update_id"])
+        if update["update_id"] in accepted:
+            return True
+        accepted.add(update["update_id"])
+        return False
+
+    run_polling(api, dispatch, until=lambda: received.count(11) == 2, min_backoff=0.05)
+
+    offsets = [params.get("offset") for _, params in api.get_updates_calls()[:2]]
+    assert offsets == [None, 11]
+
+
+def test_conflict_deletes_webhook_again_with_backoff():
+    conflict = (409, {"ok": False, "error_code": 409, "description": "Conflict"})
+    api = FakeBotApi(conflict, conflict, conflict)
+
+    run_polling(
+        api,
+        lambda update, token: True,
+        until=lambda: len(api.get_updates_calls()) >= 4,
+        min_backoff=0.1,
+    )
+
+    assert api.methods()[:6] == ["deleteWebhook", "getUpdates"] * 3
+    starts = [at for at, _ in api.get_updates_calls()[:4]]
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    # 0.1, 0.2, 0.4: задержка растёт, цикл не крутится вхолостую
+    assert gaps[0] >= 0.1
+    assert gaps[1] >= 0.2
+    assert gaps[2] >= 0.4
+
+
+def test_rate_limit_waits_retry_after():
+    limited = (
+        429,
+        {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.3}},
+    )
+    api = FakeBotApi(limited, updates(5))
+    received = []
+
+    def dispatch(update, token):
+        received.append(update["update_id"])
+        return True
+
+    run_polling(api, dispatch, until=lambda: received == [5])
+
+    first, second = [at for at, _ in api.get_updates_calls()[:2]]
+    assert second - first >= 0.3
+    assert api.methods().count("deleteWebhook") == 1
+
+
+def test_dispatch_runs_off_the_event_loop():
+    api = FakeBotApi(updates(1))
+    loop_threads = []
+
+    def dispatch(update, token):
+        try:
+            asyncio.get_running_loop()
+            loop_threads.append(True)
+        except RuntimeError:
+            loop_threads.append(False)
+        return True
+
+    run_polling(api, dispatch, until=lambda: loop_threads)
+
+    assert loop_threads == [False]
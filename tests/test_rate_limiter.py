@@ -0,0 +1,113 @@
+import logging
+
+import pytest
+
+from app.rate_limiter import RateLimitedTelegramClient
+from app.telegram_client import TelegramResponse
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_limiter(clock, **kwargs):
+    kwargs.setdefault("max_wait", None)
+    return RateLimitedTelegramClient(
+        logging.getLogger("test"), clock=clock, sleep=lambda seconds: None, **kwargs
+    )
+
+
+def test_busy_chat_does_not_delay_other_chats(clock):
+    limiter = make_limiter(clock)
+    waits = [limiter.reserve("bot", "A") for _ in range(12)]
+
+    # Чат A упирается в свой лимит 1 msg/s после всплеска из 3
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[-1] == pytest.approx(9.0)
+    assert limiter.reserve("bot", "B") == 0.0
+    assert limiter.reserve("bot", "C") == 0.0
+
+
+def test_bot_limit_still_applies_across_chats(clock):
+    limiter = make_limiter(clock, bot_rate=10.0)
+    waits = [limiter.reserve("bot", f"chat{i}") for i in range(20)]
+
+    # Всплеск до 10 сразу, дальше по одному слоту в 0.1 s
+    assert waits[:10] == [0.0] * 10
+    assert waits[10:] == pytest.approx([0.1 * i for i in range(1, 11)])
+
+
+def test_group_chats_use_group_rate(clock):
+    limiter = make_limiter(clock, group_rate=0.5, chat_burst=1)
+
+    assert limiter.reserve("bot", -100) == 0.0
+    assert limiter.reserve("bot", -100) == pytest.approx(2.0)
+
+
+def test_over_limit_books_nothing(clock):
+    limiter = make_limiter(clock, chat_burst=1, max_wait=2.0)
+    waits = [limiter.reserve("bot", "A") for _ in range(5)]
+
+    assert waits[:3] == pytest.approx([0.0, 1.0, 2.0])
+    assert limiter.over_limit(waits[3])
+    assert limiter.over_limit(waits[4])
+    assert limiter.scheduler_stats()["rejected"] == 2
+    clock.now += 1.0
+    assert limiter.reserve("bot", "A") == pytest.approx(2.0)
+
+
+def test_block_delays_bot_and_chat(clock):
+    limiter = make_limiter(clock)
+    limiter.block("bot", "A", 5.0)
+
+    assert limiter.reserve("bot", "A") == pytest.approx(5.0)
+    assert limiter.reserve("bot", "B") == pytest.approx(5.0)
+    assert limiter.reserve("other", "A") == 0.0
+
+
+def test_idle_buckets_are_pruned(clock):
+    limiter = make_limiter(clock)
+    limiter.reserve("bot", "A")
+    clock.now += 60.0
+    limiter._prune(clock.now)
+
+    assert limiter.scheduler_stats()["buckets"] == 0
+
+
+def test_rejected_send_returns_bot_api_429(clock):
+    limiter = make_limiter(clock, chat_burst=1, max_wait=2.0)
+    for _ in range(3):
+        limiter.admit("bot", "A", "sendMessage")
+
+    wait, rejected = limiter.admit("bot", "A", "sendMessage")
+
+    assert wait == pytest.approx(3.0)
+    assert rejected.status_code == 429 and not rejected.ok
+    assert rejected.json()["parameters"]["retry_after"] == 3
+    assert limiter.retry_after(rejected) == 3.0
+
+
+@pytest.mark.parametrize(
+    "data, headers, expected",
+    [
+        ({"parameters": {"retry_after": 7}}, {}, 7.0),
+        ({"ok": False}, {"Retry-After": "4"}, 4.0),
+        (["not", "a", "dict"], {"Retry-After": "5"}, 5.0),
+        ("Too Many Requests", {}, 1.0),
+        ({"parameters": "oops"}, {"Retry-After": "2"}, 2.0),
+        (None, {"Retry-After": "soon"}, 1.0),
+    ],
+)
+def test_retry_after_tolerates_odd_bodies(data, headers, expected):
+    response = TelegramResponse(429, headers, data)
+
+    assert RateLimitedTelegramClient.retry_after(response) == expected
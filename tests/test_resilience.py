@@ -0,0 +1,127 @@
+import pytest
+
+from app.resilience import CLOSED, HALF_OPEN, OPEN, AdaptiveTimeout, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10.0, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+    assert breaker.stats()["opened_total"] == 1
+
+
+def test_success_resets_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, clock=clock)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now += 10.0
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_probe_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now += 10.0
+    breaker.allow()
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10.0, clock=clock)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10.0
+    breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.stats()["opened_total"] == 2
+
+
+def test_released_probe_keeps_half_open_and_allows_next(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now += 10.0
+    breaker.allow()
+    breaker.release()
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_stale_probe_does_not_block_forever(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+    clock.now += 10.0
+    breaker.allow()
+    clock.now += 10.0
+
+    assert breaker.allow()
+
+
+def test_adaptive_timeout_uses_max_during_warmup():
+    timeout = AdaptiveTimeout(min_timeout=5.0, max_timeout=120.0, warmup=5)
+    for _ in range(4):
+        timeout.observe(1.0)
+
+    assert timeout.current() == 120.0
+
+
+def test_adaptive_timeout_follows_latency_within_bounds():
+    timeout = AdaptiveTimeout(min_timeout=5.0, max_timeout=120.0, warmup=5)
+    for _ in range(20):
+        timeout.observe(1.5)
+    assert timeout.current() == pytest.approx(5.0)
+
+    for _ in range(50):
+        timeout.observe(30.0)
+    assert 30.0 < timeout.current() < 120.0
+
+    for _ in range(50):
+        timeout.observe(500.0)
+    assert timeout.current() == 120.0
+
+
+def test_adaptive_timeout_counts_slow_calls():
+    timeout = AdaptiveTimeout(min_timeout=5.0, max_timeout=120.0, warmup=5)
+    for _ in range(20):
+        timeout.observe(1.5)
+    timeout.observe(8.0)
+
+    stats = timeout.stats()
+    assert stats["slow_calls"] == 1
+    assert stats["latency_ewma"] > 1.5
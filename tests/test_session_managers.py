@@ -0,0 +1,235 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.session_cache import CachedSessionManager
+from app.sqlite_session_manager import SQLiteSessionManager
+
+
+@pytest.fixture(params=[False, True], ids=["shared", "concurrent"])
+def concurrent(request):
+    return request.param
+
+
+def tables(db_file):
+    with sqlite3.connect(db_file) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+
+
+def ago(seconds):
+    return (datetime.now() - timedelta(seconds=seconds)).isoformat()
+
+
+def backdate(db_file, tg_id, seconds):
+    with sqlite3.connect(db_file, timeout=30) as conn:
+        conn.execute(
+            "UPDATE sessions SET last_active = ? WHERE tg_id = ?", (ago(seconds), str(tg_id))
+        )
+
+
+@pytest.fixture
+def sqlite_sessions(tmp_path, concurrent):
+    managers = []
+
+    def make(**kwargs):
+        manager = SQLiteSessionManager(
+            tmp_path / "sessions.db", concurrent=concurrent, **kwargs
+        )
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.close()
+
+
+def test_lazy_init_defers_schema_to_first_use(tmp_path, sqlite_sessions):
+    db_file = tmp_path / "sessions.db"
+    manager = sqlite_sessions(lazy_init=True)
+    assert "sessions" not in tables(db_file)
+
+    manager.add_user(1, "uuid-1")
+
+    assert "sessions" in tables(db_file)
+    assert manager.get_user(1)["user_uuid"] == "uuid-1"
+
+
+def test_sqlite_add_get_delete(sqlite_sessions):
+    manager = sqlite_sessions()
+
+    manager.add_user(1, "uuid-1")
+    assert manager.get_user(1)["user_uuid"] == "uuid-1"
+    assert manager.get_user("1")["user_uuid"] == "uuid-1"
+
+    manager.delete_user(1)
+    assert manager.get_user(1) is None
+    assert not manager.is_expired(1)
+
+
+def test_sqlite_last_active_is_written(tmp_path, sqlite_sessions):
+    manager = sqlite_sessions()
+    manager.add_user(1, "uuid-1")
+    backdate(tmp_path / "sessions.db", 1, 600)
+
+    manager.update_last_active(1)
+    # В concurrent-режиме обновление сначала лежит в буфере
+    assert manager.get_user(1)["last_active"] > ago(60)
+    manager.flush()
+
+    with sqlite3.connect(tmp_path / "sessions.db") as conn:
+        (last_active,) = conn.execute("SELECT last_active FROM sessions").fetchone()
+    assert last_active > ago(60)
+
+
+def test_sqlite_expired_session_is_kept_for_retention(tmp_path, sqlite_sessions):
+    manager = sqlite_sessions(session_ttl=60, expired_retention=60)
+    manager.add_user(1, "uuid-1")
+    manager.add_user(2, "uuid-2")
+    backdate(tmp_path / "sessions.db", 1, 90)
+
+    assert manager.get_user(1) is None
+    assert manager.is_expired(1)
+    assert manager.delete_expired() == 0
+
+    backdate(tmp_path / "sessions.db", 1, 200)
+    assert manager.delete_expired() == 1
+    assert not manager.is_expired(1)
+    assert manager.get_user(2)["user_uuid"] == "uuid-2"
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis()
+
+
+def test_redis_sessions_are_prefixed_hashes(redis_client):
+    from app.redis_session_manager import TelegramSessionManager
+
+    manager = TelegramSessionManager(redis_client, key_prefix="s:", ttl=60, expired_retention=30)
+    manager.add_user(1, "uuid-1")
+
+    assert redis_client.hget("s:1", "user_uuid") == b"uuid-1"
+    assert 0 < redis_client.ttl("s:1") <= 90
+    assert manager.get_user(1)["user_uuid"] == "uuid-1"
+    assert manager.get_users([1, 2]) == {"1": manager.get_user(1), "2": None}
+
+    manager.delete_user(1)
+    assert manager.get_user(1) is None
+
+
+def test_redis_touch_only_updates_existing_sessions(redis_client):
+    from app.redis_session_manager import TelegramSessionManager
+
+    manager = TelegramSessionManager(redis_client, key_prefix="s:", ttl=60)
+    manager.add_user(1, "uuid-1")
+    redis_client.hset("s:1", "last_active", ago(600))
+
+    manager.update_last_active(1)
+    manager.update_last_active(2)
+
+    assert manager.get_user(1)["last_active"] > ago(60)
+    assert not redis_client.exists("s:2")
+
+
+def test_redis_expired_session_is_told_from_missing(redis_client):
+    from app.redis_session_manager import TelegramSessionManager
+
+    manager = TelegramSessionManager(redis_client, key_prefix="s:", ttl=60)
+    manager.add_user(1, "uuid-1")
+    redis_client.hset("s:1", "last_active", ago(90))
+
+    assert manager.get_user(1) is None
+    assert manager.is_expired(1)
+    assert not manager.is_expired(2)
+
+
+def test_redis_legacy_json_session_is_migrated(redis_client):
+    from app.redis_session_manager import TelegramSessionManager
+
+    redis_client.set("7", '{"user_uuid": "uuid-7", "last_active": "%s"}' % ago(1))
+    manager = TelegramSessionManager(redis_client, key_prefix="s:")
+
+    assert manager.get_user(7)["user_uuid"] == "uuid-7"
+    assert not redis_client.exists("7")
+    assert redis_client.hget("s:7", "user_uuid") == b"uuid-7"
+
+
+class CountingBackend:
+    def __init__(self):
+        self.sessions = {}
+        self.calls = []
+
+    def add_user(self, tg_id, user_uuid):
+        self.sessions[str(tg_id)] = {"user_uuid": user_uuid, "last_active": ago(0)}
+
+    def get_user(self, tg_id):
+        self.calls.append(("get_user", str(tg_id)))
+        return self.sessions.get(str(tg_id))
+
+    def is_expired(self, tg_id):
+        self.calls.append(("is_expired", str(tg_id)))
+        return False
+
+    def update_last_active(self, tg_id):
+        pass
+
+    def delete_user(self, tg_id):
+        self.sessions.pop(str(tg_id), None)
+
+
+def test_cached_sessions_hit_memory_after_first_lookup():
+    backend = CountingBackend()
+    manager = CachedSessionManager(backend)
+    backend.add_user(1, "uuid-1")
+
+    assert manager.get_user(1)["user_uuid"] == "uuid-1"
+    assert manager.get_user(1)["user_uuid"] == "uuid-1"
+    assert backend.calls == [("get_user", "1")]
+
+
+def test_cached_sessions_remember_unknown_ids():
+    backend = CountingBackend()
+    manager = CachedSessionManager(backend, negative_ttl=60)
+
+    assert manager.get_user(1) is None
+    assert manager.get_user(1) is None
+    assert backend.calls == [("get_user", "1")]
+    assert manager.stats()["negative_hits"] == 1
+
+    # add_user сбрасывает негативную запись
+    manager.add_user(1, "uuid-1")
+    assert manager.get_user(1)["user_uuid"] == "uuid-1"
+
+
+def test_cached_sessions_delete_is_seen_at_once():
+    backend = CountingBackend()
+    manager = CachedSessionManager(backend)
+    manager.add_user(1, "uuid-1")
+
+    manager.delete_user(1)
+
+    assert manager.get_user(1) is None
+    assert backend.calls == []
+
+
+def test_cached_session_past_ttl_goes_to_backend():
+    backend = CountingBackend()
+    manager = CachedSessionManager(backend, session_ttl=60)
+    backend.sessions["1"] = {"user_uuid": "uuid-1", "last_active": ago(90)}
+
+    manager.get_user(1)
+    manager.get_user(1)
+
+    # Кэшированная запись уже истекла, поэтому второй раз тоже идём в бэкенд
+    assert backend.calls == [("get_user", "1"), ("get_user", "1")]
+
+
+def test_cached_is_expired_answers_are_cached():
+    backend = CountingBackend()
+    manager = CachedSessionManager(backend, negative_ttl=60)
+
+    assert not manager.is_expired(1)
+    assert not manager.is_expired(1)
+    assert backend.calls == [("is_expired", "1")]
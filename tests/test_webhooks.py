@@ -0,0 +1,71 @@
+import json
+import logging
+
+from app.webhooks import WebhookReconciler
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._data = data
+
+    def json(self):
+        if isinstance(self._data, Exception):
+            raise self._data
+        return self._data
+
+
+class FakeTelegram:
+    def __init__(self, info):
+        self.info = info
+        self.calls = []
+
+    def get(self, token, method, params=None, **kwargs):
+        self.calls.append((method, params))
+        if method == "getWebhookInfo":
+            return FakeResponse(self.info)
+        return FakeResponse({"ok": True, "result": True})
+
+
+def make_reconciler(info):
+    telegram = FakeTelegram(info)
+    reconciler = WebhookReconciler(logging.getLogger("test"), telegram, "https://srv")
+    return reconciler, telegram
+
+
+def test_sets_webhook_with_allowed_updates():
+    reconciler, telegram = make_reconciler({"ok": True, "result": {"url": ""}})
+
+    assert reconciler.reconcile_one("bot") == "set"
+    method, params = telegram.calls[-1]
+    assert method == "setWebhook"
+    assert params["url"] == "https://srv/webhook/bot"
+    assert json.loads(params["allowed_updates"]) == ["message"]
+
+
+def test_resets_webhook_registered_without_allowed_updates():
+    reconciler, telegram = make_reconciler(
+        {"ok": True, "result": {"url": "https://srv/webhook/bot"}}
+    )
+
+    assert reconciler.reconcile_one("bot") == "set"
+
+
+def test_matching_webhook_is_left_alone_and_cached():
+    reconciler, telegram = make_reconciler(
+        {
+            "ok": True,
+            "result": {"url": "https://srv/webhook/bot", "allowed_updates": ["message"]},
+        }
+    )
+
+    assert reconciler.reconcile_one("bot") == "unchanged"
+    assert reconciler.reconcile_one("bot") == "cached"
+    assert [method for method, _ in telegram.calls] == ["getWebhookInfo"]
+
+
+def test_non_json_info_counts_as_failed():
+    reconciler, _ = make_reconciler(ValueError("html"))
+
+    assert reconciler.reconcile_one("bot") == "failed"